@@ -1,18 +1,24 @@
 # Gradio_UI_test.py
 import gradio as gr
 import asyncio
-import time, json, traceback
+import time, json, logging, uuid
 from typing import Dict, List, Tuple
+from collections import OrderedDict
 from langgraph.graph import StateGraph
 
 # 延迟导入AIMessage，避免循环导入
-from langchain_core.messages.ai import AIMessage
+from langchain_core.messages.ai import AIMessage, AIMessageChunk
+from structured_log import get_logger, sampled
+from tracing import current_span, span
+import metrics
+
+log = get_logger("Gradio_UI")
 
 # 声明JD_QueryState类型，避免直接从app导入
 try:
     from app import JD_QueryState
 except ImportError:
-    from typing_extensions import TypedDict
+    from typing_extensions import TypedDict, NotRequired
     from typing import Annotated
     from langgraph.graph.message import add_messages
 
@@ -21,6 +27,8 @@ except ImportError:
         messages: Annotated[list, add_messages]
         query: list[str]
         finished: bool
+        summary: NotRequired[str]
+        context_tokens: NotRequired[dict]
 
 # ================== 增强消息处理器 ==================
 class MessageProcessor:
@@ -41,11 +49,11 @@ class MessageProcessor:
         for key in ["output", "response", "result"]:
             messages.extend(MessageProcessor._parse_level(step_data.get(key, [])))  
         
-        # 输出接收到的消息数
-        msg_count = len(messages)
-        assistant_count = sum(1 for role, _ in messages if role == "assistant")
-        user_count = sum(1 for role, _ in messages if role == "user")
-        print(f"📤 解析到{msg_count}条消息(用户:{user_count}, 助手:{assistant_count})")
+        # 输出接收到的消息数（仅在调试级别统计）
+        if log.isEnabledFor(logging.DEBUG):
+            assistant_count = sum(1 for role, _ in messages if role == "assistant")
+            user_count = sum(1 for role, _ in messages if role == "user")
+            log.debug("📤 解析到%d条消息(用户:%d, 助手:%d)", len(messages), user_count, assistant_count)
         
         return messages
         
@@ -62,6 +70,7 @@ class MessageProcessor:
     def _parse_level(msg_list: List) -> List[Tuple[str, str]]:
         """统一解析层级数据"""
         parsed = []
+        debug_enabled = log.isEnabledFor(logging.DEBUG)
         for idx, item in enumerate(msg_list):
             role, content = "", ""
             log_prefix = ""
@@ -95,90 +104,236 @@ class MessageProcessor:
             # 添加有效的消息到结果中
             if role in ("user", "assistant") and content:
                 parsed.append((role, content))
-                print(f"{log_prefix}: {role}->{content[:50]}...")
+                if debug_enabled and sampled(log):
+                    log.debug("%s: %s->%.50s...", log_prefix, role, content)
         
         return parsed
 
 # ================== 智能流式处理器 ==================
-class StreamProcessor:
-    def __init__(self, state_graph: StateGraph):
-        self.state_graph = state_graph
-        self.context = {
+class TokenDelta(str):
+    """LLM逐token输出的增量文本（区别于完整消息，界面直接拼接显示）"""
+
+
+class ProductRow(dict):
+    """搜索工具刚提取到的一个商品（界面逐行追加到进度表格中，完整结果到达后被替换）"""
+
+
+def render_product_rows(rows: List[Dict]) -> str:
+    """把已收到的商品渲染为进度表格"""
+    lines = [f"正在获取商品，已收到{len(rows)}个：", "", "| 商品名称 | 价格 | 购买链接 |", "| --- | --- | --- |"]
+    for row in rows:
+        title = row.get("title", "无标题")
+        title = title[:30] + "..." if len(title) > 30 else title
+        link = row.get("purchase_link", "#")
+        lines.append(f"| {title} | {row.get('price', '价格未知')} | {f'[购买链接]({link})' if link != '#' else '无链接'} |")
+    return "\n".join(lines)
+
+
+def message_chunk_text(chunk) -> str:
+    """提取消息增量块中的文本（兼容字符串和内容块列表）"""
+    content = getattr(chunk, "content", "")
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content or ""
+
+
+class BoundedSet:
+    """容量有限的集合，超出容量时淘汰最早加入的元素"""
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._items = OrderedDict()
+
+    def add(self, item):
+        self._items[item] = None
+        self._items.move_to_end(item)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+
+class SessionContextStore:
+    """按Gradio会话隔离的处理器上下文，限制单会话内存并淘汰空闲会话"""
+    def __init__(self, idle_timeout: float = 1800, max_sessions: int = 200, max_cache_entries: int = 256):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.max_cache_entries = max_cache_entries
+        self._sessions = OrderedDict()
+        # 按会话键记录正在执行的轮次数，大于0时不淘汰（其检查点正在被写入）；
+        # 不放在上下文中，重置上下文不会丢失计数
+        self._active = {}
+
+    def _new_context(self) -> Dict:
+        return {
             "current_turn": 0,
             "history_hash": "",
-            "response_cache": set(),
-            "last_state": None
+            "response_cache": BoundedSet(self.max_cache_entries),
+            "last_state": None,
+            "thread_id": None,
+            "last_active": time.time()
         }
 
+    def get(self, session_key: str) -> Dict:
+        """获取（必要时创建）会话上下文，并刷新活跃时间"""
+        context = self._sessions.get(session_key)
+        if context is None:
+            context = self._sessions[session_key] = self._new_context()
+        context["last_active"] = time.time()
+        self._sessions.move_to_end(session_key)
+        return context
+
+    def reset(self, session_key: str) -> Dict:
+        """重置会话上下文（保留会话条目，执行中的轮次计数不受影响）"""
+        context = self._sessions[session_key] = self._new_context()
+        self._sessions.move_to_end(session_key)
+        return context
+
+    def begin(self, session_key: str):
+        """标记会话有一轮对话开始执行"""
+        self._active[session_key] = self._active.get(session_key, 0) + 1
+
+    def end(self, session_key: str):
+        """标记会话的一轮对话执行结束"""
+        remaining = self._active.get(session_key, 0) - 1
+        if remaining > 0:
+            self._active[session_key] = remaining
+        else:
+            self._active.pop(session_key, None)
+
+    def evict_idle(self) -> List[Dict]:
+        """淘汰空闲超时或超出数量上限的会话（跳过有轮次正在执行的会话），返回被淘汰的上下文"""
+        now = time.time()
+        evicted = []
+        for key in list(self._sessions):
+            context = self._sessions[key]
+            if now - context["last_active"] <= self.idle_timeout and len(self._sessions) <= self.max_sessions:
+                break  # 按活跃时间排序，后面的会话更新
+            if self._active.get(key):
+                continue
+            evicted.append(self._sessions.pop(key))
+        if evicted:
+            log.info("🧹 已淘汰%d个空闲会话，当前会话数: %d", len(evicted), len(self._sessions))
+        return evicted
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class StreamProcessor:
+    def __init__(self, state_graph: StateGraph, sessions: SessionContextStore = None):
+        self.state_graph = state_graph
+        self.sessions = sessions if sessions is not None else SessionContextStore()
+
     # +++ 新增方法 +++
-    def reset_context(self):
-        """重置对话上下文"""
-        self.context = {
-            "current_turn": 0,
-            "history_hash": "",
-            "response_cache": set(),
-            "last_state": None
-        }
-        print("🔄 已重置处理器上下文")
+    def reset_context(self, session_key: str = "default"):
+        """重置指定会话的对话上下文"""
+        self.sessions.reset(session_key)
+        log.debug("🔄 已重置会话%s的处理器上下文", session_key)
+
+    async def process(self, initial_state: JD_QueryState, thread_id: str = None, session_key: str = "default"):
+        """处理一轮对话，整轮记录为一条trace（各节点、LLM调用和工具为其子Span）"""
+        with span("turn", session=session_key, thread_id=thread_id or "") as turn_span:
+            metrics.TURNS_IN_PROGRESS.inc()
+            self.sessions.begin(session_key)
+            start, status = time.perf_counter(), "error"
+            try:
+                async for chunk in self._process_turn(initial_state, thread_id, session_key):
+                    yield chunk
+                status = "ok"
+            except GeneratorExit:
+                # 调用方因超时等原因提前停止读取
+                status = "aborted"
+                raise
+            finally:
+                self.sessions.end(session_key)
+                metrics.TURNS_IN_PROGRESS.dec()
+                metrics.TURN_LATENCY.observe(time.perf_counter() - start, status=status)
+            turn_span.set_attribute("turn", self.sessions.get(session_key).get("current_turn", 0))
 
-    async def process(self, initial_state: JD_QueryState):
-        """简化的对话处理器，添加了工具调用支持和超时控制"""
+    async def _process_turn(self, initial_state: JD_QueryState, thread_id: str = None, session_key: str = "default"):
+        """简化的对话处理器，添加了工具调用支持和超时控制
+
+        thread_id 不为空时作为检查点的会话ID，图会在已保存的会话状态上继续执行；
+        session_key 用于隔离不同Gradio会话的处理器上下文。
+        """
+        context = self.sessions.get(session_key)
         try:
-            # 输出代理状态
-            import os
-            print(f"🔐 代理状态: HTTP={'http_proxy' in os.environ}, HTTPS={'https_proxy' in os.environ}")
-            for proxy_type in ['http_proxy', 'https_proxy']:
-                proxy_value = os.environ.get(proxy_type, '')
-                proxy_value and print(f"  {proxy_type.upper()}代理值: {proxy_value}")
-            
-            # 调试输出消息历史长度
-            messages = initial_state.get("messages", [])
-            print(f"🔍 处理状态中包含{len(messages)}条消息历史")
-            
-            # 打印历史消息用于调试
-            if len(messages) > 1:
-                print(f"📜 历史上下文概要:")
-                for i, msg in enumerate(messages):
-                    role = msg.get("role", "unknown")
-                    content = msg.get("content", "")[:30]
-                    print(f"  [{i+1}] {role}: {content}...")
+            # 调试输出代理状态和本轮输入的消息（未开启调试级别时跳过）
+            if log.isEnabledFor(logging.DEBUG):
+                import os
+                log.debug("🔐 代理状态", extra={
+                    "http_proxy": os.environ.get("http_proxy", ""), "https_proxy": os.environ.get("https_proxy", "")
+                })
+                messages = initial_state.get("messages", [])
+                log.debug("🔍 处理状态中包含%d条消息", len(messages), extra={
+                    "history": [f"{msg.get('role', 'unknown')}: {msg.get('content', '')[:30]}" for msg in messages]
+                })
             
             # 检查是否包含搜索关键词
             last_query = initial_state.get("query", [""])[0]
             is_search_query = any(kw in last_query for kw in ["搜索", "查找", "寻找", "京东", "购买", "商品"])
-            is_search_query and print(f"🔍 检测到搜索查询: {last_query}")
+            if is_search_query:
+                log.debug("🔍 检测到搜索查询: %s", last_query)
+            current_span().set_attributes(query=last_query[:100], search_query=is_search_query)
             
             # 生成一个唯一标识符避免重复处理
             fingerprint = hash(str(time.time()) + str(initial_state.get("query", [])))
             
             # 重复处理检查
-            if fingerprint == self.context.get("history_hash"):
-                print("⚠️ 检测到重复请求，忽略")
+            if fingerprint == context.get("history_hash"):
+                log.warning("⚠️ 检测到重复请求，忽略")
                 return
                 
             # 更新上下文
-            self.context["current_turn"] = self.context.get("current_turn", 0) + 1
-            self.context["history_hash"] = fingerprint
-            self.context["response_cache"] = set()  # 重置响应缓存
+            context["current_turn"] = context.get("current_turn", 0) + 1
+            context["history_hash"] = fingerprint
+            context["response_cache"] = BoundedSet(self.sessions.max_cache_entries)  # 重置响应缓存
             
-            turn = self.context["current_turn"]
-            print(f"🔄 开始处理第{turn}轮对话...")
+            turn = context["current_turn"]
+            log.info("🔄 开始处理第%d轮对话...", turn, extra={"session": session_key})
             
             # 用于存储当前轮次的所有消息片段
             current_response_parts = []
             tool_called, tool_call_start_time = False, None
             step_count = 0
             
-            print("🚀 准备调用state_graph.astream处理流程...")
+            log.debug("🚀 准备调用state_graph.astream处理流程...")
             
             # 直接使用流式调用获取回复
             try:
-                async for step in self.state_graph.astream(initial_state, {"recursion_limit": 100}):
+                graph_config = {"recursion_limit": 100}
+                if thread_id:
+                    graph_config.update(configurable={"thread_id": thread_id})
+                stream = self.state_graph.astream(
+                    initial_state, graph_config, stream_mode=["updates", "messages", "custom"]
+                )
+                async for stream_mode, payload in stream:
+                    # 搜索工具边抓取边推送的商品
+                    if stream_mode == "custom":
+                        if isinstance(payload, dict) and payload.get("type") == "product":
+                            yield ProductRow(payload["product"])
+                        continue
+                    
+                    # chatbot节点的LLM增量输出直接推送给界面
+                    if stream_mode == "messages":
+                        message_chunk, metadata = payload
+                        if isinstance(message_chunk, AIMessageChunk) and metadata.get("langgraph_node") == "chatbot":
+                            delta = message_chunk_text(message_chunk)
+                            if delta:
+                                yield TokenDelta(delta)
+                        continue
+                    
+                    step = payload
                     step_count += 1
-                    print(f"\n📍 执行步骤 {step_count} ...")
+                    log.debug("📍 执行步骤 %d ...", step_count)
                     
-                    # 调试步骤内容
-                    self._debug_step_data(step)
+                    # 调试步骤内容（按采样率输出）
+                    if sampled(log):
+                        self._debug_step_data(step)
                     
                     # 处理工具调用情况
                     if "tool_calls" in step:
@@ -186,7 +341,7 @@ class StreamProcessor:
                         tool_call_start_time = time.time()
                         tool_info = step.get("tool_calls", [{}])[0]
                         tool_name = tool_info.get("name", "未知工具")
-                        print(f"🔧 检测到工具调用: {tool_name}")
+                        log.info("🔧 检测到工具调用: %s", tool_name)
                         yield f"正在执行操作: {tool_name}..."
                         continue
                     
@@ -194,84 +349,111 @@ class StreamProcessor:
                     if tool_called and tool_call_start_time:
                         elapsed = time.time() - tool_call_start_time
                         if elapsed > 60:  # 工具调用60秒超时
-                            print(f"⚠️ 工具调用超时! 已经耗时 {elapsed:.1f} 秒")
+                            log.warning("⚠️ 工具调用超时! 已经耗时 %.1f 秒", elapsed)
                             yield "操作超时，可能是网络问题或京东接口暂时不可用，请稍后再试。"
                             break
                     
-                    # 获取消息内容
-                    step_messages = MessageProcessor.parse(step)
-                    step_messages and print(f"  解析得到 {len(step_messages)} 条消息")
-                    
-                    # 从当前步骤中提取最新的助手消息
-                    latest_assistant_msgs = self._extract_latest_assistant_message(step)
+                    # 只解析本步骤新增的消息，提取需要输出的助手消息
+                    latest_assistant_msgs = self._extract_new_assistant_messages(step, context)
                     
                     # 处理新助手消息
                     if latest_assistant_msgs:
-                        print(f"  ✓ 找到 {len(latest_assistant_msgs)} 条新助手消息")
+                        log.debug("✓ 找到 %d 条新助手消息", len(latest_assistant_msgs))
                         for msg in latest_assistant_msgs:
                             if msg and len(msg.strip()) >= 2:  # 跳过太短的消息
                                 current_response_parts.append(msg.strip())
-                                print(f"  📤 输出消息: {msg.strip()[:50]}...")
+                                if sampled(log):
+                                    log.debug("📤 输出消息: %.50s...", msg.strip())
                                 yield msg.strip()
                     else:
-                        print("  ❌ 未找到新的助手消息")
+                        log.debug("未找到新的助手消息")
                     
                     # 检查是否需要结束
                     if step.get("finished", False):
-                        print("✓ 对话已完成")
+                        log.debug("✓ 对话已完成")
                         break
                     
-                print(f"✅ 流处理完成，共执行了 {step_count} 个步骤")
+                log.info("✅ 流处理完成，共执行了 %d 个步骤", step_count)
                 
             except Exception as stream_error:
-                print(f"❌ 流处理异常: {str(stream_error)}")
-                print(f"异常类型: {type(stream_error).__name__}")
-                import traceback
-                traceback.print_exc()
+                log.exception("❌ 流处理异常: %s", stream_error, extra={"error_type": type(stream_error).__name__})
                 yield f"处理过程中出现错误: {str(stream_error)[:100]}"
                     
             # 处理响应汇总输出
             if current_response_parts:
                 combined = " ".join(current_response_parts)
-                print(f"✓ 本轮回复汇总: {combined[:100]}...")
+                log.debug("✓ 本轮回复汇总: %.100s...", combined)
             else:
-                print("⚠️ 未收集到任何响应片段")
+                log.warning("⚠️ 未收集到任何响应片段")
                 yield "抱歉，我未能生成回复。请检查网络连接或稍后重试。"
                     
         except Exception as e:
-            print(f"❌ 处理器异常: {str(e)}")
-            traceback.print_exc()  # 打印详细错误信息
+            log.exception("❌ 处理器异常: %s", e)
             yield f"很抱歉，处理您的请求时出现问题。({str(e)[:50]})"
             
         finally:
-            print(f"✓ 第{self.context.get('current_turn', 0)}轮对话处理完成")
+            log.debug("✓ 第%d轮对话处理完成", context.get("current_turn", 0))
             
     def _debug_step_data(self, step):
         """调试步骤数据的辅助方法"""
         try:
             step_keys = list(step.keys()) if isinstance(step, dict) else "非字典类型"
-            print(f"  步骤数据类型: {type(step).__name__}, 包含键: {step_keys}")
+            log.debug("步骤数据类型: %s, 包含键: %s", type(step).__name__, step_keys)
             
             # 处理消息数据
             if isinstance(step, dict) and "messages" in step:
                 msgs = step["messages"]
-                print(f"  消息列表长度: {len(msgs)}")
+                log.debug("消息列表长度: %d", len(msgs))
                 if msgs:
                     last_msg = msgs[-1]
                     msg_role = last_msg.get("role", "未知") if isinstance(last_msg, dict) else type(last_msg).__name__
                     msg_content = str(last_msg.get("content", ""))[:50] if isinstance(last_msg, dict) else str(last_msg)[:50]
-                    print(f"  最新消息: {msg_role} -> {msg_content}...")
+                    log.debug("最新消息: %s -> %s...", msg_role, msg_content)
             
             # 检查节点信息
-            isinstance(step, dict) and "node_name" in step and print(f"  当前节点: {step['node_name']}")
+            if isinstance(step, dict) and "node_name" in step:
+                log.debug("当前节点: %s", step["node_name"])
             
             # 检查完成状态
-            isinstance(step, dict) and "finished" in step and print(f"  完成状态: {step['finished']}")
+            if isinstance(step, dict) and "finished" in step:
+                log.debug("完成状态: %s", step["finished"])
             
         except Exception as detail_e:
-            print(f"  ⚠️ 解析步骤详情失败: {str(detail_e)}")
+            log.debug("⚠️ 解析步骤详情失败: %s", detail_e)
+
+    # 输出消息的节点（compact节点只改写历史，不产生新回复）
+    DISPLAY_NODES = ("chatbot", "tools")
+
+    def _extract_new_assistant_messages(self, step_data: Dict, context: Dict) -> List[str]:
+        """
+        从 stream_mode="updates" 的步骤中提取新增的助手消息。
+
+        节点只返回本步新增的消息（由 add_messages 追加到状态），因此更新中的消息都是新消息，无需再与历史比对。
+        """
+        if not isinstance(step_data, dict):
+            return []
+        if "tool_calls" in step_data or "tool_response" in step_data:
+            return self._extract_latest_assistant_message(step_data, context)
+        
+        new_messages = []
+        for node_name, update in step_data.items():
+            if node_name in self.DISPLAY_NODES and isinstance(update, dict):
+                new_messages.extend(update.get("messages", []))
+        
+        parsed = MessageProcessor._parse_level(new_messages)
+        assistant_messages = [content for role, content in parsed if role == "assistant"]
+        
+        output = []
+        for content in assistant_messages:
+            # 内容去重：节点原样返回的旧消息不会重复输出
+            msg_hash = hash(content)
+            if msg_hash in context["response_cache"]:
+                continue
+            context["response_cache"].add(msg_hash)
+            output.append(content)
+        return output
 
-    def _extract_latest_assistant_message(self, step_data: Dict) -> List[str]:
+    def _extract_latest_assistant_message(self, step_data: Dict, context: Dict) -> List[str]:
         """从步骤数据中提取最新的助手消息，优化工具调用处理"""
         # 处理工具调用
         if "tool_calls" in step_data:
@@ -289,11 +471,11 @@ class StreamProcessor:
                 tool_msg = f"正在使用{tool_name}工具，参数: {tool_args[:50]}..."
                 
                 msg_hash = hash(tool_msg)
-                if msg_hash not in self.context.get("response_cache", set()):
-                    self.context.setdefault("response_cache", set()).add(msg_hash)
+                if msg_hash not in context["response_cache"]:
+                    context["response_cache"].add(msg_hash)
                     return [tool_msg]
             except Exception as e:
-                print(f"⚠️ 解析工具调用出错: {str(e)}")
+                log.warning("⚠️ 解析工具调用出错: %s", e)
             
             return []
             
@@ -305,16 +487,17 @@ class StreamProcessor:
                 
                 if content:
                     msg_hash = hash(content)
-                    if msg_hash not in self.context.get("response_cache", set()):
-                        self.context.setdefault("response_cache", set()).add(msg_hash)
+                    if msg_hash not in context["response_cache"]:
+                        context["response_cache"].add(msg_hash)
                         return [f"工具执行结果: {str(content)[:200]}..."]
             except Exception as e:
-                print(f"⚠️ 解析工具响应出错: {str(e)}")
+                log.warning("⚠️ 解析工具响应出错: %s", e)
             
             return []
         
         # 检查完成状态
-        step_data.get("finished", False) and print("✓ 检测到对话完成标志")
+        if step_data.get("finished", False):
+            log.debug("✓ 检测到对话完成标志")
         
         # 处理普通消息
         parsed_messages = MessageProcessor.parse(step_data)
@@ -329,18 +512,18 @@ class StreamProcessor:
             
         # 检查是否已处理过
         msg_hash = hash(latest_message)
-        if msg_hash in self.context.get("response_cache", set()):
+        if msg_hash in context["response_cache"]:
             return []
             
         # 添加到缓存并返回
-        self.context.setdefault("response_cache", set()).add(msg_hash)
+        context["response_cache"].add(msg_hash)
         return [latest_message]
 
     async def _process_with_timeout(self, task, timeout_seconds):
         """带超时控制的异步迭代器包装器"""
         accumulated_chunks = []
         start_time = time.time()
-        print(f"⏱️ 启动超时保护，最大处理时间: {timeout_seconds}秒")
+        log.debug("⏱️ 启动超时保护，最大处理时间: %s秒", timeout_seconds)
         
         try:
             # 处理任务流
@@ -352,11 +535,12 @@ class StreamProcessor:
                 elapsed = current_time - start_time
                 
                 # 记录第一个响应时间
-                chunk_count == 1 and print(f"⏱️ 收到第一个响应，耗时: {elapsed:.2f}秒")
+                if chunk_count == 1:
+                    log.info("⏱️ 收到第一个响应", extra={"elapsed": round(elapsed, 3)})
                 
                 # 超时检查
                 if elapsed > timeout_seconds:
-                    print(f"⚠️ 处理超时! 已经耗时 {elapsed:.1f} 秒")
+                    log.warning("⚠️ 处理超时! 已经耗时 %.1f 秒", elapsed)
                     raise asyncio.TimeoutError(f"处理时间超过{timeout_seconds}秒")
                 
                 # 收集并返回块
@@ -365,52 +549,78 @@ class StreamProcessor:
                 
             # 记录完成情况
             completion_time = time.time() - start_time
-            print(f"✅ 处理成功完成，总耗时: {completion_time:.2f}秒，处理了{len(accumulated_chunks)}个响应片段")
+            log.info("✅ 处理成功完成", extra={"elapsed": round(completion_time, 3), "chunks": len(accumulated_chunks)})
                 
         except asyncio.TimeoutError:
             elapsed = time.time() - start_time
-            print(f"⚠️ 处理超时! 已经耗时 {elapsed:.1f} 秒，已收集 {len(accumulated_chunks)} 个回复片段")
+            log.warning("⚠️ 处理超时! 已经耗时 %.1f 秒，已收集 %d 个回复片段", elapsed, len(accumulated_chunks))
             
             # 返回部分结果
-            accumulated_chunks and (yield "由于操作时间过长，处理被中断。以下是已获取的部分信息：")
+            if accumulated_chunks:
+                yield "由于操作时间过长，处理被中断。以下是已获取的部分信息："
             raise
             
         except Exception as e:
             elapsed = time.time() - start_time
-            print(f"❌ 处理过程中出现异常: {str(e)}")
-            print(f"  处理已进行 {elapsed:.1f} 秒，收集了 {len(accumulated_chunks)} 个片段")
-            import traceback
-            traceback.print_exc()
+            log.exception("❌ 处理过程中出现异常: %s", e, extra={
+                "elapsed": round(elapsed, 3), "chunks": len(accumulated_chunks)
+            })
             
             # 返回部分结果
-            accumulated_chunks and (yield "处理过程中出现错误，以下是部分结果：")
+            if accumulated_chunks:
+                yield "处理过程中出现错误，以下是部分结果："
             raise
 
 # ================== 稳健界面系统 ==================
+# 会话配置：空闲淘汰时间(秒)、最大会话数、单会话响应缓存上限、队列并发数，
+# 以及整轮超时在最长工具超时之外留给LLM调用（历史摘要、chatbot）的时间(秒)
+SESSION_CONFIG = {
+    "idle_timeout": 1800,
+    "max_sessions": 200,
+    "max_cache_entries": 256,
+    "queue_concurrency": 10,
+    "llm_time_allowance": 60
+}
+
+def turn_timeout() -> float:
+    """整轮对话的超时：最长的工具超时加上LLM调用的时间，工具在自身超时前完成的结果不会被界面丢弃"""
+    try:
+        from app import TOOL_EXECUTION_CONFIG
+        tool_timeout = max([TOOL_EXECUTION_CONFIG["default_timeout"], *TOOL_EXECUTION_CONFIG["timeouts"].values()])
+    except ImportError:
+        tool_timeout = 120
+    return tool_timeout + SESSION_CONFIG["llm_time_allowance"]
+
 class GradioUI:
-    def __init__(self, state_graph: StateGraph):
+    def __init__(self, state_graph: StateGraph, on_shutdown: List = None):
         self.state_graph = state_graph
-        self.processor = StreamProcessor(state_graph)
+        # 处理器上下文按Gradio会话隔离，空闲会话自动淘汰
+        self.processor = StreamProcessor(state_graph, SessionContextStore(
+            idle_timeout=SESSION_CONFIG["idle_timeout"],
+            max_sessions=SESSION_CONFIG["max_sessions"],
+            max_cache_entries=SESSION_CONFIG["max_cache_entries"]
+        ))
+        # 服务退出时依次调用的清理函数（如关闭浏览器池）
+        self.on_shutdown = list(on_shutdown or [])
         self.interface = self._build_interface()
+        self._register_metrics()
         
-    # 添加代理管理相关方法
-    def _enable_proxy(self):
-        """启用HTTP和HTTPS代理"""
-        import os
-        # 为LLM调用设置代理
-        os.environ["http_proxy"] = "http://127.0.0.1:7890"
-        os.environ["https_proxy"] = "http://127.0.0.1:7890"
-        print("✅ 已启用网络代理")
+    def _register_metrics(self):
+        """采集时读取的实时指标：会话数、Gradio队列深度和执行中的任务数"""
+        metrics.ACTIVE_SESSIONS.set_function(lambda: len(self.processor.sessions))
+        # 队列指标读取Gradio的私有属性，升级后不可用时记录警告并报告0，不影响其他指标
+        queue = getattr(self.interface, "_queue", None)
+        if queue is None or not hasattr(queue, "__len__") or not hasattr(queue, "get_active_worker_count"):
+            log.warning("⚠️ 当前Gradio版本不支持读取队列状态，队列指标固定为0")
+        metrics.QUEUE_DEPTH.set_function(lambda: self._queue_stat(len))
+        metrics.QUEUE_ACTIVE_WORKERS.set_function(lambda: self._queue_stat(lambda queue: queue.get_active_worker_count()))
 
-    def _disable_proxy(self):
-        """禁用HTTP和HTTPS代理"""
-        import os
-        # 暂时清除代理设置
-        if "http_proxy" in os.environ:
-            del os.environ["http_proxy"]
-        if "https_proxy" in os.environ:
-            del os.environ["https_proxy"]
-        print("❌ 已禁用网络代理，本地服务可正常启动")
+    def _queue_stat(self, read):
+        queue = getattr(self.interface, "_queue", None)
+        try:
+            return read(queue) if queue is not None else 0
+        except (AttributeError, TypeError):
+            return 0
 
     def _build_interface(self):
         """构建抗卡顿界面"""
@@ -593,31 +803,71 @@ class GradioUI:
         
     def _setup_queue(self, interface):
         """设置队列兼容不同版本"""
-        queue_config = {"concurrency_count": 5, "max_size": 20}
+        concurrency = SESSION_CONFIG.get("queue_concurrency", 5)
+        queue_configs = [
+            {"default_concurrency_limit": concurrency, "max_size": concurrency * 4},  # Gradio 4+
+            {"concurrency_count": concurrency, "max_size": concurrency * 4}           # Gradio 3
+        ]
         
+        for queue_config in queue_configs:
+            try:
+                # 直接尝试设置队列
+                interface.queue(**queue_config)
+                return True
+            except Exception as e:
+                log.debug("无法使用队列参数%s: %s", list(queue_config), e)
+            
+        # 尝试兼容模式
         try:
-            # 直接尝试设置队列
-            interface.queue(**queue_config)
+            interface.queue()  # 不带参数的调用
+            log.info("使用兼容模式设置队列")
             return True
-        except Exception as e:
-            print(f"无法使用新版队列API: {str(e)}")
-            
-            # 尝试兼容模式
+        except:
+            log.warning("警告: 无法设置队列，UI响应可能较慢")
+            return False
+
+    @staticmethod
+    def _session_key(request: gr.Request = None) -> str:
+        """获取Gradio会话标识"""
+        return getattr(request, "session_hash", None) or "default"
+
+    def _thread_id_for(self, request: gr.Request = None, new_conversation: bool = False) -> str:
+        """获取会话对应的thread_id，新对话（首条消息或清空后）生成新的thread_id"""
+        session_key = self._session_key(request)
+        context = self.processor.sessions.get(session_key)
+        if new_conversation or not context.get("thread_id"):
+            context["thread_id"] = f"{session_key}-{uuid.uuid4().hex[:8]}"
+        return context["thread_id"]
+
+    async def _evict_idle_sessions(self):
+        """淘汰空闲会话，并删除其检查点数据释放内存"""
+        for context in self.processor.sessions.evict_idle():
+            thread_id = context.get("thread_id")
+            checkpointer = getattr(self.state_graph, "checkpointer", None)
+            if not thread_id or checkpointer is None:
+                continue
             try:
-                interface.queue()  # 不带参数的调用
-                print("使用兼容模式设置队列")
-                return True
-            except:
-                print("警告: 无法设置队列，UI响应可能较慢")
-                return False
+                await checkpointer.adelete_thread(thread_id)
+            except Exception as e:
+                log.warning("⚠️ 删除会话检查点失败(%s): %s", thread_id, e)
 
-    def _user_input_handler(self, user_input: str, history: list):
+    async def _get_checkpoint_messages(self, thread_id: str):
+        """读取检查点中已保存的消息，图未配置检查点或没有记录时返回None"""
+        try:
+            snapshot = await self.state_graph.aget_state({"configurable": {"thread_id": thread_id}})
+            return snapshot.values.get("messages") or None
+        except Exception:
+            return None
+
+    def _user_input_handler(self, user_input: str, history: list, request: gr.Request = None):
         """用户输入处理（带消毒）"""
-        # 当开启新对话时重置处理器
-        len(history) == 0 and self.processor.reset_context()
+        # 当开启新对话时重置该会话的处理器上下文，并分配新的检查点thread_id
+        if len(history) == 0:
+            self.processor.reset_context(self._session_key(request))
+            self._thread_id_for(request, new_conversation=True)
     
         sanitized_input = user_input.strip()[:500]
-        print(f"\n👤 用户输入（{len(sanitized_input)}字）：{sanitized_input[:50]}...")
+        log.info("👤 用户输入（%d字）：%.50s...", len(sanitized_input), sanitized_input)
         
         # 构建兼容 messages 类型的消息格式
         new_message = {"role": "user", "content": sanitized_input}
@@ -625,103 +875,149 @@ class GradioUI:
         # 返回空文本框和更新的历史记录
         return "", history + [new_message]
 
-    async def _bot_response_handler(self, history: list):
+    async def _bot_response_handler(self, history: list, request: gr.Request = None):
         """简化的响应处理器，兼容messages类型"""
         if not history:
-            print("❌ 错误: 空历史记录")
+            log.error("❌ 错误: 空历史记录")
             yield []
             return
             
+        handler_start = time.perf_counter()
         try:
-            # 确保启用代理以便LLM调用
-            self._enable_proxy()
-            print("✅ 已确保代理启用")
-            
             # 获取最后一条用户消息
             last_message = history[-1]
             if last_message["role"] != "user":
-                print("❌ 错误: 最后一条消息不是用户消息")
+                log.error("❌ 错误: 最后一条消息不是用户消息")
                 yield history
                 return
                 
             last_user_message = last_message["content"]
-            print(f"用户问题: {last_user_message}")
+            log.debug("用户问题: %s", last_user_message)
             
             # 检查是否触发了搜索关键词
             search_keywords = ["搜索", "查找", "找一下", "寻找", "查询", "找找"]
             is_search_query = any(keyword in last_user_message for keyword in search_keywords)
             
-            # 构建完整的消息历史
+            # 检查点中已有会话状态时只发送新的用户消息
+            await self._evict_idle_sessions()
+            session_key = self._session_key(request)
+            thread_id = self._thread_id_for(request)
+            checkpoint_messages = await self._get_checkpoint_messages(thread_id)
+            
             full_messages = []
-            for msg in history[:-1]:  # 不包括最后一条待处理的消息
-                # 转换为app.py中JD_QueryState接受的格式
-                role = msg.get("role", "user")
-                content = msg.get("content", "")
-                full_messages.append({"role": role, "content": content})
+            if checkpoint_messages:
+                log.debug("💾 会话%s已有%d条检查点消息，仅发送新消息", thread_id, len(checkpoint_messages))
+            else:
+                # 没有检查点（新会话或服务重启）时用界面历史初始化
+                for msg in history[:-1]:  # 不包括最后一条待处理的消息
+                    # 转换为app.py中JD_QueryState接受的格式
+                    role = msg.get("role", "user")
+                    content = msg.get("content", "")
+                    full_messages.append({"role": role, "content": content})
                 
             # 添加最后一条用户消息
             full_messages.append({"role": "user", "content": last_user_message})
             
-            print(f"📚 构建了完整历史上下文，共{len(full_messages)}条消息")
+            log.debug("📚 本轮发送%d条消息", len(full_messages))
             
-            # 创建带有完整历史的状态
+            # 创建本轮输入状态
             initial_state = JD_QueryState(
                 messages=full_messages,
                 query=[last_user_message],  # 当前查询仍然只包含最新消息
                 finished=False
             )
             
-            print(f"🔄 创建初始状态: {str(initial_state)[:100]}...")
+            log.debug("🔄 创建初始状态: %.100s...", initial_state)
             
             # 标记当前响应为处理中
             thinking_content = "正在搜索商品，请稍候...这可能需要一点时间" if is_search_query else "思考中..."
             history.append({"role": "assistant", "content": thinking_content})
             yield history
             
-            print("⌛ 显示思考中状态，开始处理...")
+            log.debug("⌛ 显示思考中状态，开始处理...")
             
             # 收集完整响应
             full_response = ""
             response_success = False
             
             # 带超时的流式处理
-            timeout = 120  # 统一超时时间
-            print(f"📡 准备调用处理器...设置超时时间: {timeout}秒")
+            timeout = turn_timeout()
+            log.debug("📡 准备调用处理器...设置超时时间: %s秒", timeout)
+            
+            # 正在逐token显示的LLM输出
+            streaming_text = ""
+            
+            # 搜索工具逐个推送、尚未被完整结果替换的商品
+            product_rows = []
+            
+            first_chunk_time = None
             
             try:
-                process_task = self.processor.process(initial_state)
+                process_task = self.processor.process(initial_state, thread_id=thread_id, session_key=session_key)
                 response_chunk_count = 0
                 
                 async for chunk in self.processor._process_with_timeout(process_task, timeout):
+                    # 记录首个回复片段的耗时
+                    if first_chunk_time is None:
+                        first_chunk_time = time.perf_counter() - handler_start
+                        metrics.FIRST_CHUNK_LATENCY.observe(first_chunk_time)
+                    
+                    # 搜索结果逐行显示，完整的结果消息到达后被替换
+                    if isinstance(chunk, ProductRow):
+                        product_rows.append(chunk)
+                        progress = render_product_rows(product_rows)
+                        history[-1] = {"role": "assistant", "content": (full_response + "\n\n" + progress).strip()}
+                        yield history
+                        continue
+                    product_rows = []
+                    
+                    # LLM增量输出：拼接后立即刷新界面
+                    if isinstance(chunk, TokenDelta):
+                        streaming_text += chunk
+                        history[-1] = {"role": "assistant", "content": (full_response + streaming_text).strip()}
+                        yield history
+                        continue
+                    
                     response_chunk_count += 1
                     
                     # 处理有效片段
                     chunk_text = chunk.strip()
+                    
+                    # 完整消息到达：与已流式显示的内容相同则不重复添加
+                    if streaming_text:
+                        full_response += streaming_text.strip() + " "
+                        same_as_streamed = chunk_text == streaming_text.strip()
+                        streaming_text = ""
+                        if same_as_streamed:
+                            continue
+                    
                     if chunk_text:
                         # 添加到完整响应
                         full_response += chunk_text + " "
                         # 更新历史并显示
                         history[-1] = {"role": "assistant", "content": full_response.strip()}
-                        print(f"📤 接收到第{response_chunk_count}个响应片段: {chunk_text[:30]}...")
+                        if sampled(log):
+                            log.debug("📤 接收到第%d个响应片段: %.30s...", response_chunk_count, chunk_text)
                         yield history
                         # 轻微延迟使界面更流畅
                         await asyncio.sleep(0.05)
                 
-                print(f"✅ 流处理完成，共接收{response_chunk_count}个响应片段")
+                full_response += streaming_text
+                log.debug("✅ 流处理完成，共接收%d个响应片段", response_chunk_count)
                 response_success = True
                 
             except (asyncio.TimeoutError, Exception) as process_error:
                 # 错误类型标识
                 error_type = "超时" if isinstance(process_error, asyncio.TimeoutError) else "异常"
-                print(f"❌ 处理{error_type}: {str(process_error)}")
-                
-                # 记录详细错误信息
-                isinstance(process_error, asyncio.TimeoutError) or traceback.print_exc()
+                # 超时只记录说明，其他异常附带详细堆栈
+                log.error("❌ 处理%s: %s", error_type, process_error,
+                          exc_info=not isinstance(process_error, asyncio.TimeoutError))
                 
                 # 构建错误消息
                 error_prefix = "搜索操作超时。京东搜索可能暂时不可用，请稍后再试。" if isinstance(process_error, asyncio.TimeoutError) else f"处理请求时出错: {str(process_error)[:100]}"
                 
                 # 构建最终响应
+                full_response += streaming_text
                 final_content = full_response.strip() + "\n\n" + error_prefix if full_response else error_prefix
                 history[-1] = {"role": "assistant", "content": final_content}
                 yield history
@@ -735,22 +1031,22 @@ class GradioUI:
                 if not clean_response:
                     fallback_msg = "抱歉，我无法完成商品搜索。可能是网络问题或者京东接口暂时不可用。请稍后再试。" if is_search_query else "抱歉，我没能找到相关信息，请换个问题试试。"
                     history[-1] = {"role": "assistant", "content": fallback_msg}
-                    print("⚠️ 未收集到任何有效响应")
+                    log.warning("⚠️ 未收集到任何有效响应")
                 else:
                     history[-1] = {"role": "assistant", "content": clean_response}
-                    print(f"✅ 成功生成回复，长度:{len(clean_response)}")
+                    log.info("✅ 成功生成回复，长度:%d", len(clean_response))
                 
-                print(f"回复: {history[-1]['content'][:50]}...")
+                log.debug("回复: %.50s...", history[-1]["content"])
                 yield history
                 
         except Exception as e:
             # 处理最外层异常
-            print(f"❌ 处理器整体异常: {str(e)}")
-            traceback.print_exc()
+            log.exception("❌ 处理器整体异常: %s", e)
             
             # 尝试添加错误响应
             error_msg = f"处理您的请求时出错，请重试。错误: {str(e)[:100]}"
-            history and history.append({"role": "assistant", "content": error_msg})
+            if history:
+                history.append({"role": "assistant", "content": error_msg})
             
             yield history
 
@@ -762,11 +1058,12 @@ class GradioUI:
         local_addresses = ["localhost", "127.0.0.1", "0.0.0.0", "::1"]
         os.environ["NO_PROXY"] = ",".join(local_addresses)
         os.environ["no_proxy"] = os.environ["NO_PROXY"]
-        print(f"🔒 已设置NO_PROXY={os.environ['NO_PROXY']}，确保本地连接不经过代理")
+        log.info("🔒 已设置NO_PROXY=%s，确保本地连接不经过代理", os.environ["NO_PROXY"])
         
         # 删除可能干扰的代理设置
         for proxy_var in ["HTTP_PROXY", "HTTPS_PROXY"]:
-            proxy_var in os.environ and os.environ.pop(proxy_var)
+            if proxy_var in os.environ:
+                os.environ.pop(proxy_var)
         
         # 设置Gradio环境变量
         gradio_env_settings = {
@@ -800,24 +1097,35 @@ class GradioUI:
             **kwargs                   # 合并传入的参数
         }
         
-        print(f"🚀 正在启动UI服务，参数: {launch_kwargs}")
-        
-        # 临时禁用代理以启动服务器
-        self._disable_proxy()
+        log.info("🚀 正在启动UI服务", extra={"launch_kwargs": launch_kwargs})
         
-        # 确保启动后恢复代理
+        # 代理由 app.PROXY_CONFIG 按客户端显式设置，本地地址已加入NO_PROXY，启动服务无需改动代理环境变量
         result = None
         try:
-            result = self.interface.launch(**launch_kwargs)
+            # 非阻塞启动，挂载 /metrics 后再按原参数决定是否阻塞主线程
+            result = self.interface.launch(**{**launch_kwargs, "prevent_thread_lock": True})
+            metrics.mount_metrics(self.interface.app)
+            log.info("📈 指标接口已挂载: /metrics")
+            if not launch_kwargs.get("prevent_thread_lock"):
+                self.interface.block_thread()
         except Exception as e:
-            print(f"❌ 启动出错: {str(e)}")
+            log.error("❌ 启动出错: %s", e)
             raise
         finally:
-            # 无论成功与否，都恢复代理设置
-            self._enable_proxy()
+            # 服务已停止（非Notebook等非阻塞启动）时执行退出清理
+            if not getattr(self.interface, "is_running", False):
+                self._run_shutdown_hooks()
             
         return result
 
+    def _run_shutdown_hooks(self):
+        """执行退出清理函数"""
+        for hook in self.on_shutdown:
+            try:
+                hook()
+            except Exception as e:
+                log.warning("⚠️ 退出清理失败: %s", e)
+
     @staticmethod
     def is_search_query(query: str) -> bool:
         """检查是否是搜索查询"""
@@ -835,22 +1143,21 @@ class GradioUI:
 
 if __name__ == "__main__":
     # 导入必要模块
-    import os, sys, traceback
+    import os
     
     try:
         # 创建UI实例
-        from app import graph_with_tools
-        ui = GradioUI(graph_with_tools)
+        from app import (graph_with_tools, shutdown_browser_pool, shutdown_http_search, shutdown_ocr_client,
+                         shutdown_checkpointer, shutdown_tracing)
+        ui = GradioUI(graph_with_tools, on_shutdown=[
+            shutdown_browser_pool, shutdown_http_search, shutdown_ocr_client, shutdown_checkpointer, shutdown_tracing
+        ])
         
         # 配置环境
         # 设置NO_PROXY环境变量
         local_addresses = ["localhost", "127.0.0.1", "0.0.0.0", "::1"]
         os.environ["NO_PROXY"] = os.environ["no_proxy"] = ",".join(local_addresses)
-        print(f"🔒 已设置NO_PROXY={os.environ['NO_PROXY']}，确保本地连接不经过代理")
-        
-        # 环境准备
-        ui._disable_proxy()
-        print("✅ 临时取消代理设置，防止本地访问冲突")
+        log.info("🔒 已设置NO_PROXY=%s，确保本地连接不经过代理", os.environ["NO_PROXY"])
         
         # 设置Gradio环境变量
         os.environ.update({
@@ -859,17 +1166,15 @@ if __name__ == "__main__":
         })
         
         # 显示版本信息
-        print(f"✓ Gradio版本: {gr.__version__}")
-        print("✅ 成功导入图对象")
+        log.info("✓ Gradio版本: %s", gr.__version__)
+        log.info("✅ 成功导入图对象")
         
         # 启动UI
         ui.launch()
         
     except Exception as e:
-        print(f"\n❌ 启动失败: {str(e)}")
-        print("\n--- 详细错误信息 ---")
-        traceback.print_exc()
-        print("""
+        log.exception("❌ 启动失败: %s", e)
+        log.error("""
         ===== 解决建议 =====
         1. 检查是否安装了所有依赖: pip install -r requirements.txt
         2. 验证gradio安装: pip install --upgrade gradio
@@ -877,10 +1182,3 @@ if __name__ == "__main__":
         4. 尝试其他端口: export GRADIO_SERVER_PORT=8000
         5. 如果使用Clash，尝试在Clash设置中添加"localhost,127.0.0.1"到绕过代理列表
         """)
-    finally:
-        # 确保恢复代理设置
-        try:
-            ui._enable_proxy()
-            print("✓ 代理设置已恢复")
-        except:
-            pass
@@ -1,5 +1,5 @@
 from typing import Annotated
-from typing_extensions import TypedDict
+from typing_extensions import TypedDict, NotRequired
 from langgraph.graph.message import add_messages
 
 class JD_QueryState(TypedDict):
@@ -7,6 +7,8 @@ class JD_QueryState(TypedDict):
     messages: Annotated[list, add_messages]
     query: list[str]
     finished: bool
+    summary: NotRequired[str]
+    context_tokens: NotRequired[dict]
 
 
 JD_QueryBot_SYSINT = (
@@ -25,7 +27,9 @@ JD_QueryBot_SYSINT = (
     "生成的json文件会被保存在当前目录下，你可以通过read_product_details(file_path)函数读取json文件，"
     "部分产品的具体信息可能会在图片中，你将运用你的视觉能力，提取出产品有关的具体信息。"
     "你可以用工具函数 extract_text_from_image_url(image_url)来帮助你完成图片内容提取的任务。"
+    "需要处理多张图片时，请使用 extract_text_from_image_urls(image_urls) 一次性批量提取，结果以图片链接为键返回。"
     "注意：京东上面的部分产品可能有国家补贴，实际价格以国补后为准。"
+    "搜索结果中排名靠前的商品会附带详情页的规格参数、到手价、国补信息和评价数，请优先依据这些信息比较和推荐。"
     "保存的商品信息内容可能不会太完整，你可以结合自身的语料库知识，或者使用其他搜索引擎收集相关内容来补充。"
     "\n\n"
     "如果任何工具不可用，或者客户的问题不明确，任何报错你都可以打破次元壁随时反馈给用户。"
@@ -43,17 +47,31 @@ from langgraph.graph import StateGraph, START, END
 from langchain_google_genai import ChatGoogleGenerativeAI
 from llama_index.core.base.llms.types import ChatMessage
 from langchain_core.messages.ai import AIMessage
+from langchain_core.messages import RemoveMessage, ToolMessage, message_chunk_to_message
 from typing import Literal
 from langchain_core.tools import tool
-from playwright.async_api import async_playwright
-import asyncio, random, json, nest_asyncio, time
-from openai import OpenAI
+import asyncio, contextvars, copy, json, logging, re, time
+from structured_log import get_logger, sampled
+from tracing import configure_tracing, current_span, shutdown_tracing, span, traced
+from metrics import ENRICH_PAGES, LLM_TOKENS, SCRAPE_ITEMS, SEARCH_NAVIGATION, TOOL_CALLS, TOOL_ERRORS, TOOL_LATENCY
+
+log = get_logger("app")
+# 追踪导出方式见 tracing.TRACE_CONFIG（默认写入 jd_traces.jsonl，可用 python tracing.py 查看各阶段耗时）
+configure_tracing()
 
 ########上传Kaggle前注释掉########
 import os
-# 设置 HTTP 和 HTTPS 代理
-os.environ["http_proxy"] = "http://127.0.0.1:7890"
-os.environ["https_proxy"] = "http://127.0.0.1:7890"
+# 代理：llm 用于Gemini和图片文字提取，scrape 用于京东抓取（浏览器池、HTTP快速路径），None 表示直连。
+# 各客户端显式使用这里的设置；多个会话在同一事件循环上并发执行，运行期间不能再修改进程的代理环境变量
+PROXY_CONFIG = {
+    "llm": "http://127.0.0.1:7890",
+    "scrape": None
+}
+
+# Gemini 客户端没有单独的代理参数，只能读取环境变量：启动时设置一次，之后不再改动
+if PROXY_CONFIG["llm"]:
+    os.environ["http_proxy"] = PROXY_CONFIG["llm"]
+    os.environ["https_proxy"] = PROXY_CONFIG["llm"]
 
 # 设置NO_PROXY环境变量以避免代理冲突
 local_addresses = ["localhost", "127.0.0.1", "0.0.0.0", "::1"]
@@ -64,6 +82,105 @@ secret_value_0 = <your_GOOGLE_API_KEY_here>
 
 llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key=secret_value_0)
 
+# 上下文窗口策略：控制每轮发送给LLM的历史消息
+CONTEXT_WINDOW_CONFIG = {
+    "policy": "truncate",  # "truncate": 只发送最近的消息；"summarize": 将更早的对话压缩为摘要
+    "max_messages": 20,    # 历史消息超过该数量时触发截断或摘要
+    "keep_recent": 10,     # 摘要策略下保留原文的最近消息数量
+    "token_budget": 6000   # 发送给LLM的历史消息token预算（估算值）
+}
+
+# 会话检查点：每个Gradio会话对应一个thread_id，只需向图中传入新的用户消息
+CHECKPOINT_CONFIG = {
+    "backend": "memory",   # "memory" 或 "sqlite"
+    "sqlite_path": "jd_checkpoints.db"
+}
+
+from history_compaction import (
+    get_message_role, get_message_content, select_recent_messages,
+    count_message_tokens, compact_history
+)
+
+async def summarize_messages(messages, previous_summary=""):
+    """将较早的对话压缩成摘要"""
+    transcript = "\n".join(
+        f"{get_message_role(msg)}: {get_message_content(msg)[:500]}" for msg in messages
+    )
+    prompt = (
+        "请将以下京东导购对话压缩为简洁的中文摘要，保留用户的需求、预算、偏好，"
+        "以及已经推荐过的商品（标题、价格、链接）。"
+    )
+    summary_input = f"已有摘要：{previous_summary}\n\n新增对话：\n{transcript}" if previous_summary else transcript
+    with span("llm.summarize", messages=len(messages)) as llm_span:
+        response = await llm.ainvoke([("system", prompt), ("human", summary_input)])
+        llm_span.set_attributes(**usage_attributes(response))
+    return get_message_content(response).strip()
+
+@traced("node.compact")
+async def compact_history_node(state: JD_QueryState) -> JD_QueryState:
+    """
+    在chatbot之前压缩会话历史，使其不超过token预算。
+
+    1. 较早的搜索结果表格替换为 标题/价格/链接 摘要
+    2. 删除重复的欢迎语
+    3. 仍超出预算且策略为summarize时，把更早的对话合并进滚动摘要
+    """
+    messages = list(state["messages"])
+    summary = state.get("summary", "")
+    token_budget = CONTEXT_WINDOW_CONFIG["token_budget"]
+    tokens_before = count_message_tokens(messages) + count_message_tokens([("system", summary)])
+
+    replaced, removed = compact_history(messages, WELCOME_MSG)
+    replaced_by_id = {msg.id: msg for msg in replaced}
+    removed_ids = {msg.id for msg in removed}
+    messages = [replaced_by_id.get(getattr(msg, "id", None), msg) for msg in messages
+                if getattr(msg, "id", None) not in removed_ids]
+
+    update = {}
+    if CONTEXT_WINDOW_CONFIG["policy"] == "summarize" and (
+        count_message_tokens(messages) > token_budget or len(messages) > CONTEXT_WINDOW_CONFIG["max_messages"]
+    ):
+        recent = select_recent_messages(messages, CONTEXT_WINDOW_CONFIG["keep_recent"], token_budget)
+        older = messages[:len(messages) - len(recent)]
+        if older:
+            try:
+                summary = await summarize_messages(older, summary)
+                update["summary"] = summary
+                # 已摘要的消息从会话状态中移除，后续轮次不再重复发送
+                removed.extend(msg for msg in older if getattr(msg, "id", None) not in removed_ids)
+                messages = recent
+                log.info("🗜️ 已将%d条早期消息合并进对话摘要", len(older))
+            except Exception as e:
+                log.warning("⚠️ 生成对话摘要失败，本轮仅做截断: %s", e)
+
+    tokens_after = count_message_tokens(messages) + count_message_tokens([("system", summary)])
+    log.info("📏 历史压缩", extra={
+        "tokens_before": tokens_before, "tokens_after": tokens_after,
+        "replaced": len(replaced), "removed": len(removed)
+    })
+
+    removed_messages = [RemoveMessage(id=msg.id) for msg in removed if getattr(msg, "id", None)]
+    return {
+        "messages": replaced + removed_messages,
+        "context_tokens": {"before": tokens_before, "after": tokens_after},
+        **update
+    }
+
+def apply_context_window(state: JD_QueryState):
+    """按上下文窗口策略生成发送给LLM的消息（最近的消息 + 对话摘要）"""
+    messages = state["messages"]
+    summary = state.get("summary", "")
+    recent = select_recent_messages(
+        messages, CONTEXT_WINDOW_CONFIG["max_messages"], CONTEXT_WINDOW_CONFIG["token_budget"]
+    )
+    if len(recent) < len(messages):
+        log.info("✂️ 上下文截断: 发送最近%d/%d条消息", len(recent), len(messages))
+
+    llm_messages = [JD_QueryBot_SYSINT]
+    if summary:
+        llm_messages.append(("system", f"此前对话的摘要：{summary}"))
+    return llm_messages + recent
+
 # test_app.py 关键修改部分
 
 # 修改chatbot函数的消息处理
@@ -73,24 +190,18 @@ def chatbot(state: JD_QueryState) -> JD_QueryState:
     
     # 确保返回的消息格式统一
     response = llm.invoke(message_history)
-    return {
-        "messages": state["messages"] + [{"role": "assistant", "content": response.content}],
-        "query": state["query"],
-        "finished": state["finished"]
-    }
+    # 只返回新增消息，由 add_messages 合并到历史中
+    return {"messages": [{"role": "assistant", "content": response.content}]}
 
 # 修改human_node的消息格式
+@traced("node.human")
 def human_node(state: JD_QueryState) -> JD_QueryState:
     """直接从状态中获取用户输入（无需终端交互）"""
     # 确保消息列表中最后一条是用户输入
     user_input = state["query"][-1] if state["query"] else ""
     
-    # 更新状态（直接传递用户输入）
-    return {
-        "messages": state["messages"] + [{"role": "user", "content": user_input}],
-        "query": state["query"],
-        "finished": state["finished"]
-    }
+    # 更新状态（只返回新增的用户消息）
+    return {"messages": [{"role": "user", "content": user_input}]}
 
 # 修改chatbot_with_welcome_msg的消息处理
 def chatbot_with_welcome_msg(state: JD_QueryState) -> JD_QueryState:
@@ -101,20 +212,42 @@ def chatbot_with_welcome_msg(state: JD_QueryState) -> JD_QueryState:
         new_msg = AIMessage(content=WELCOME_MSG)
     
     # 统一转换为字典格式
-    return {
-        "messages": state["messages"] + [{"role": "assistant", "content": new_msg.content}],
-        "query": state["query"],
-        "finished": state["finished"]
-    }
+    return {"messages": [{"role": "assistant", "content": new_msg.content}]}
+
+def usage_attributes(message) -> dict:
+    """从LLM响应中提取token用量（模型未返回时为空），同时计入token用量指标"""
+    usage = getattr(message, "usage_metadata", None) or {}
+    for kind in ("input", "output"):
+        if usage.get(f"{kind}_tokens"):
+            LLM_TOKENS.inc(usage[f"{kind}_tokens"], kind=kind)
+    return {key: usage[key] for key in ("input_tokens", "output_tokens", "total_tokens") if key in usage}
+
+async def stream_llm_response(llm_messages):
+    """
+    流式调用带工具的LLM，并把增量块（含工具调用块）合并为完整消息。
 
-def chatbot_with_tools(state: JD_QueryState) -> JD_QueryState:
+    图以 stream_mode="messages" 运行时，每个增量块会经回调实时推送给界面。
+    """
+    merged = None
+    with span("llm.chat", messages=len(llm_messages)) as llm_span:
+        start = time.time()
+        async for chunk in llm_with_tools.astream(llm_messages):
+            if merged is None:
+                llm_span.set_attribute("first_token_ms", round((time.time() - start) * 1000, 1))
+            merged = chunk if merged is None else merged + chunk
+        response = message_chunk_to_message(merged) if merged is not None else AIMessage(content="")
+        llm_span.set_attributes(tool_calls=len(getattr(response, "tool_calls", None) or []), **usage_attributes(response))
+    return response
+
+@traced("node.chatbot")
+async def chatbot_with_tools(state: JD_QueryState) -> JD_QueryState:
     """确保每次响应后终止对话"""
-    print(f"🤖 Chatbot节点: 消息数量={len(state.get('messages', []))}")
+    log.debug("🤖 Chatbot节点: 消息数量=%d", len(state.get("messages", [])))
     
     # 检测到对话已完成则直接返回
     if state.get("finished", False):
-        print("🛑 检测到对话已完成标记，不进行LLM调用")
-        return state
+        log.debug("🛑 检测到对话已完成标记，不进行LLM调用")
+        return {"finished": True}
     
     # 默认响应值
     response_content = WELCOME_MSG
@@ -123,27 +256,27 @@ def chatbot_with_tools(state: JD_QueryState) -> JD_QueryState:
     
     # 检查代理设置
     import os
-    print(f"🔐 LLM调用前代理状态: HTTP={'http_proxy' in os.environ}, HTTPS={'https_proxy' in os.environ}")
+    log.debug("🔐 LLM调用前代理状态", extra={"http_proxy": "http_proxy" in os.environ, "https_proxy": "https_proxy" in os.environ})
     
     # 处理有消息的情况
     if state["messages"]:
         try:
-            print("🚀 调用LLM处理用户消息...")
-            new_output = llm_with_tools.invoke([JD_QueryBot_SYSINT] + state["messages"])
+            log.debug("🚀 调用LLM处理用户消息...")
+            llm_messages = apply_context_window(state)
+            new_output = await stream_llm_response(llm_messages)
             
             # 提取响应内容
             response_content = getattr(new_output, "content", str(new_output))
-            print(f"✅ LLM响应成功: {response_content[:50]}...")
+            log.info("✅ LLM响应成功: %.50s...", response_content)
             
             # 检测工具调用
             has_tool_calls = hasattr(new_output, "tool_calls") and new_output.tool_calls
             
             # 根据响应类型返回不同结果
             if has_tool_calls:
-                print(f"🔧 检测到LLM响应中包含工具调用 (AIMessage格式)")
+                log.info("🔧 检测到LLM响应中包含工具调用", extra={"tools": [call["name"] for call in new_output.tool_calls]})
                 return {
-                    "messages": state["messages"] + [new_output],
-                    "query": state.get("query", []),
+                    "messages": [new_output],
                     "finished": False  # 允许工具处理
                 }
             
@@ -151,9 +284,7 @@ def chatbot_with_tools(state: JD_QueryState) -> JD_QueryState:
             response_dict = {"role": "assistant", "content": response_content}
             
         except Exception as e:
-            print(f"❌ LLM调用异常: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            log.exception("❌ LLM调用异常: %s", e)
             
             # 设置错误消息
             response_dict = {
@@ -161,18 +292,17 @@ def chatbot_with_tools(state: JD_QueryState) -> JD_QueryState:
                 "content": f"对不起，处理您的请求时出现问题: {str(e)[:100]}"
             }
     else:
-        print("ℹ️ 使用欢迎消息响应")
+        log.info("ℹ️ 使用欢迎消息响应")
     
-    # 返回更新的状态
+    # 返回更新的状态（只包含新增消息，历史由 add_messages 合并）
     return {
-        "messages": state["messages"] + [response_dict],
-        "query": state.get("query", []),
+        "messages": [response_dict],
         "finished": is_finished  # 标记对话完成
     }
 
 
 @tool
-def JD_search_general(search_keyword: str) -> str:
+async def JD_search_general(search_keyword: str) -> str:
     """
     使用 Playwright 打开浏览器并在京东官网搜索指定关键词。
 
@@ -184,59 +314,69 @@ def JD_search_general(search_keyword: str) -> str:
     """
     import os
     import json
-    import sys
     
-    print("=" * 50)
-    print(f"🚀 开始执行京东搜索工具: 关键词='{search_keyword}'")
-    print(f"🔍 Python版本: {sys.version}")
+    log.info("🚀 开始执行京东搜索工具: 关键词='%s'", search_keyword)
     
     # 检查playwright依赖
     try:
         import playwright
     except ImportError:
         error_message = "错误: 需要安装Playwright。请运行: pip install playwright && playwright install chromium"
-        print(f"❌ {error_message}")
+        log.error("❌ %s", error_message)
         return json.dumps([{"title": error_message, "price": "N/A"}], ensure_ascii=False)
     
-    # 代理处理
-    proxies = handle_proxy_settings()
-    
-    try:
-        # 确保cookie文件存在
-        cookies_file = ensure_cookies_file()
-        
-        # 执行搜索流程
-        search_results = execute_jd_search(search_keyword, cookies_file)
-        
-        # 返回JSON格式的结果
-        return json.dumps(search_results, ensure_ascii=False, indent=4)
-    finally:
-        # 恢复代理设置
-        restore_proxy_settings(proxies)
+    # 确保cookie文件存在
+    cookies_file = ensure_cookies_file()
+
+    # 优先读取搜索缓存
+    search_cache = get_search_cache()
+    search_results = await search_cache.aget(search_keyword)
+    cache_hit = search_results is not None
+    if cache_hit:
+        log.info("⚡ 命中搜索缓存: '%s'", search_keyword, extra={"cache": search_cache.stats()})
+        save_product_details(search_results)
+    else:
+        # 执行搜索流程，商品一提取出来就推送给界面逐行显示；返回和缓存的以搜索的最终结果为准
+        streamed, search_results = [], []
+        write = product_stream_writer()
+        async for kind, payload in iter_search_results(search_keyword, cookies_file):
+            if kind == "result":
+                search_results = payload
+                continue
+            streamed.append(payload)
+            write({"type": "product", "keyword": search_keyword, "index": len(streamed), "product": payload})
+
+        complete = is_complete_search_result(search_results)
+        if not is_valid_search_result(search_results) and streamed:
+            # 推送过部分商品后搜索失败或超时：返回已推送的商品，不混入错误记录，也不缓存
+            log.warning("⚠️ 搜索'%s'未完成，返回已获取的%d个商品", search_keyword, len(streamed),
+                        extra={"error": search_results[0].get("title") if search_results else None})
+            search_results = streamed
+            save_product_details(search_results)
+
+        # 打开排名靠前商品的详情页补充规格、促销价和评价数（先用已缓存的详情）
+        pending = []
+        if ENRICHMENT_CONFIG["enabled"] and is_valid_search_result(search_results):
+            pending = apply_cached_details(search_results)
+            if pending and not ENRICHMENT_CONFIG["background"]:
+                await enrich_products(search_results, cookies_file, pending)
+                pending = []
+            save_product_details(search_results)
+
+        # 只缓存完整的搜索结果（不含任何错误记录）
+        if complete:
+            await search_cache.aset(search_keyword, search_results)
+
+        if pending:
+            # 其余详情页在后台打开，工具立即返回；补充完成后刷新搜索缓存，之后相同的搜索直接带上详情
+            spawn_background(refresh_enrichment(
+                search_keyword, copy.deepcopy(search_results), cookies_file, pending, complete
+            ))
 
-def handle_proxy_settings():
-    """临时禁用代理并保存原始设置"""
-    import os
-    
-    # 保存原始代理设置
-    http_proxy = os.environ.pop("http_proxy", None)
-    https_proxy = os.environ.pop("https_proxy", None)
-    
-    print("ℹ️ 临时取消代理设置以访问京东")
-    print(f"🔐 当前代理状态: HTTP={'http_proxy' in os.environ}, HTTPS={'https_proxy' in os.environ}")
-    
-    return {"http": http_proxy, "https": https_proxy}
+    current_span().set_attributes(keyword=search_keyword, cache_hit=cache_hit, item_count=len(search_results))
 
-def restore_proxy_settings(proxies):
-    """恢复原始代理设置"""
-    import os
-    
-    # 恢复代理设置
-    if proxies["http"]:
-        os.environ["http_proxy"] = proxies["http"]
-    if proxies["https"]:
-        os.environ["https_proxy"] = proxies["https"]
-    print("ℹ️ 已恢复原始代理设置")
+    # 返回JSON格式的结果
+    return json.dumps(search_results, ensure_ascii=False, indent=4)
 
 def ensure_cookies_file():
     """确保京东cookie文件存在"""
@@ -250,46 +390,108 @@ def ensure_cookies_file():
         return cookies_file
         
     # 创建空cookie文件
-    print(f"⚠️ 京东Cookie文件'{cookies_file}'不存在，将创建一个空的Cookie文件")
+    log.warning("⚠️ 京东Cookie文件'%s'不存在，将创建一个空的Cookie文件", cookies_file)
     try:
         with open(cookies_file, "w", encoding="utf-8") as f:
             json.dump([], f)
-        print(f"✅ 已创建空Cookie文件: {cookies_file}")
+        log.info("✅ 已创建空Cookie文件: %s", cookies_file)
         return cookies_file
     except Exception as e:
         error_message = f"错误: 无法创建Cookie文件: {str(e)}"
-        print(error_message)
+        log.error(error_message)
         raise Exception(error_message)
 
-def execute_jd_search(search_keyword, cookies_file):
-    """执行京东搜索流程"""
-    import json
-    import asyncio
-    import nest_asyncio
+# 当前流式搜索的商品监听者；抓取函数通过 publish_products 推送刚提取到的商品
+_product_listener = contextvars.ContextVar("jd_product_listener", default=None)
+
+def publish_products(raw_items):
+    """把刚提取到的原始商品交给当前流式搜索（不在 iter_search_results 中时不做任何事）"""
+    listener = _product_listener.get()
+    if listener is not None and raw_items:
+        listener(raw_items)
 
+def product_stream_writer():
+    """当前图运行的自定义流写入器（不在图中执行时返回空操作）"""
+    try:
+        from langgraph.config import get_stream_writer
+        return get_stream_writer()
+    except Exception:
+        return lambda chunk: None
+
+async def iter_search_results(search_keyword, cookies_file):
+    """
+    流式执行京东搜索的异步生成器。
+
+    商品一被提取出来就产出 ("product", 规范化后的商品记录)（按SKU去重，最多 HARVEST_CONFIG["max_results"] 个，
+    只用于界面逐行显示）；搜索结束后产出 ("result", 最终结果列表)。最终结果按页面顺序合并，
+    与保存的 jd_product_details.json 一致，失败时为错误记录。
+    """
+    max_results = HARVEST_CONFIG["max_results"]
+    pending = asyncio.Queue()
+    seen = set()
+    
+    # 监听者随上下文传入搜索任务及其创建的子任务
+    token = _product_listener.set(pending.put_nowait)
+    try:
+        search_task = asyncio.ensure_future(execute_jd_search(search_keyword, cookies_file))
+    finally:
+        _product_listener.reset(token)
+    
+    def unseen(products):
+        for product in products:
+            key = product_sku(product)
+            if product.get("price") != "N/A" and key not in seen and len(seen) < max_results:
+                seen.add(key)
+                yield product
+    
+    try:
+        while not search_task.done() or not pending.empty():
+            if pending.empty():
+                getter = asyncio.ensure_future(pending.get())
+                await asyncio.wait({getter, search_task}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    continue
+                raw_items = getter.result()
+            else:
+                raw_items = pending.get_nowait()
+            for product in unseen(process_product_item(item, index) for index, item in enumerate(raw_items)):
+                yield "product", product
+        
+        yield "result", search_task.result()
+    finally:
+        # 调用方提前停止读取时不再继续等待
+        if not search_task.done():
+            search_task.cancel()
+
+async def execute_jd_search(search_keyword, cookies_file):
+    """执行京东搜索流程（直接运行在服务器事件循环上，不阻塞其他会话）"""
     try:
         # 设置全局超时
-        print(f"🔍 开始执行搜索京东商品: {search_keyword}")
-        nest_asyncio.apply()
+        log.debug("🔍 开始执行搜索京东商品: %s", search_keyword)
         
         # 执行搜索，添加超时保护
         try:
-            # 修正函数名使用，确保与实际定义的异步函数名匹配
-            search_func = jd_search_general
-            jd_product_details = asyncio.run(asyncio.wait_for(
-                search_func(search_keyword, cookies_file), 
+            # 相同关键词的并发搜索合并为一次抓取
+            from search_cache import normalize_keyword
+            jd_product_details = await asyncio.wait_for(
+                get_search_flight().do(
+                    normalize_keyword(search_keyword),
+                    lambda: jd_search_general(search_keyword, cookies_file)
+                ), 
                 timeout=120.0
-            ))
-            print(f"✅ 搜索完成，获取到{len(jd_product_details)}个商品信息")
+            )
+            jd_product_details = copy.deepcopy(jd_product_details)
+            log.info("✅ 搜索完成，获取到%d个商品信息", len(jd_product_details))
             return jd_product_details
         except asyncio.TimeoutError:
             error_message = f"搜索'{search_keyword}'操作超时(120秒)，请稍后再试"
-            print(f"⚠️ {error_message}")
+            log.warning("⚠️ %s", error_message)
             return [{"title": error_message, "price": "N/A"}]
         
     except Exception as e:
         error_message = f"搜索'{search_keyword}'时发生错误: {str(e)}"
-        print(f"❌ {error_message}")
+        log.error("❌ %s", error_message)
         return [{"title": error_message, "price": "N/A"}]
 
 
@@ -309,8 +511,46 @@ def read_product_details(file_path: str) -> str:
     return product_details
 
 
+# 图片文字提取（OpenAI兼容接口），base_url 可改为本地模拟服务用于测试
+OCR_CONFIG = {
+    "base_url": "https://openrouter.ai/api/v1",
+    "api_key": <your_OpenRouter_API_KEY_here>,
+    "model": "qwen/qwen2.5-vl-32b-instruct:free",
+    "max_concurrency": 4,
+    "timeout": 60.0,
+    "hash_content": False  # 下载图片按内容哈希查缓存（不同URL的相同促销图也能命中）
+}
+
+# 图片文字缓存：内存LRU条目数、磁盘缓存目录（None表示只用内存）、过期时间(秒)、磁盘最多保留的记录数
+OCR_CACHE_CONFIG = {
+    "max_entries": 1024,
+    "cache_dir": ".ocr_cache",
+    "ttl": 7 * 24 * 3600,
+    "max_disk_entries": 5000
+}
+
+_ocr_client = None
+_ocr_cache = None
+
+def get_ocr_cache():
+    """获取全局共享的图片文字缓存"""
+    global _ocr_cache
+    if _ocr_cache is None:
+        from ocr_cache import OCRCache
+        _ocr_cache = OCRCache(**OCR_CACHE_CONFIG)
+    return _ocr_cache
+
+def get_ocr_client():
+    """获取全局共享的图片文字提取客户端"""
+    global _ocr_client
+    if _ocr_client is None:
+        from image_ocr import ImageOCRClient
+        _ocr_client = ImageOCRClient(cache=get_ocr_cache(), proxy=PROXY_CONFIG["llm"], **OCR_CONFIG)
+    return _ocr_client
+
+
 @tool
-def extract_text_from_image_url(image_url: str) -> str:
+async def extract_text_from_image_url(image_url: str) -> str:
     """
     调用 OpenRouter API 提取图片 URL 中的文字信息
     image_url 可以是来自 JD_search_general() 函数的返回结果，
@@ -320,35 +560,45 @@ def extract_text_from_image_url(image_url: str) -> str:
     Returns:
         str: 提取的文字信息。
     """
-    # 初始化 OpenAI 客户端
-    client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=<your_OpenRouter_API_KEY_here>)
+    return await get_ocr_client().extract_text(image_url)
 
-    # 构造请求消息
-    messages = [{"role": "user","content": 
-                [{"type": "text", "text": "仅提取图片中的文字内容，不要添加任何其他信息。"},
-                {"type": "image_url", "image_url": {"url": image_url}}]}]
 
-    # 调用 OpenRouter API
-    completion = client.chat.completions.create(model="qwen/qwen2.5-vl-32b-instruct:free", messages=messages)
-
-    # 提取响应中的文字内容
-    return completion.choices[0].message.content.strip()
+@tool
+async def extract_text_from_image_urls(image_urls: list[str]) -> dict:
+    """
+    批量并发提取多张图片中的文字信息，适合一次性处理整页搜索结果的商品图片。
+    image_urls 可以是 JD_search_general() 返回结果或 read_product_details() 读取的json文件中的图片链接。
+    Args:
+        image_urls (list[str]): 图片 URL 列表。
+    Returns:
+        dict: 以图片 URL 为键、提取的文字为值的字典。
+    """
+    return await get_ocr_client().extract_texts(image_urls)
 
 
 from langgraph.prebuilt import ToolNode
 
-tools = [JD_search_general, read_product_details, extract_text_from_image_url]
+# 工具执行：同一条AI消息中多个工具调用的最大并发数，以及各工具的超时时间(秒)
+TOOL_EXECUTION_CONFIG = {
+    "max_concurrency": 4,
+    "default_timeout": 60,
+    "timeouts": {
+        "JD_search_general": 160,
+        "extract_text_from_image_urls": 120
+    }
+}
+
+tools = [JD_search_general, read_product_details, extract_text_from_image_url, extract_text_from_image_urls]
 
 # 修改ToolNode的消息处理
 # 修改 tool_node 函数
 # 在工具节点返回更易读的内容
-def tool_node(state: JD_QueryState) -> JD_QueryState:
+@traced("node.tools")
+async def tool_node(state: JD_QueryState) -> JD_QueryState:
     """Execute tools and return results."""
     # 获取最后一个消息
     last_message = state["messages"][-1]
-    print(f"🔍 工具节点接收到消息: {last_message}")
+    log.debug("🔍 工具节点接收到消息: %s", last_message)
     
     # 从不同类型的消息中获取工具调用
     tool_calls = []
@@ -356,12 +606,12 @@ def tool_node(state: JD_QueryState) -> JD_QueryState:
     # 处理字典类型消息
     if isinstance(last_message, dict):
         tool_calls = last_message.get("tool_calls", [])
-        print(f"📦 从字典中提取工具调用: {len(tool_calls)}个")
-        return process_tool_calls(state, tool_calls)
+        log.debug("📦 从字典中提取工具调用: %d个", len(tool_calls))
+        return await process_tool_calls(state, tool_calls)
     
     # 处理AIMessage或其他对象类型
     tool_calls = extract_tool_calls_from_object(last_message)
-    return process_tool_calls(state, tool_calls)
+    return await process_tool_calls(state, tool_calls)
 
 def extract_tool_calls_from_object(message_obj):
     """从消息对象中提取工具调用"""
@@ -374,7 +624,7 @@ def extract_tool_calls_from_object(message_obj):
                 tool_call_info = extract_single_tool_call(tool_call)
                 if tool_call_info:
                     tool_calls.append(tool_call_info)
-                    print(f"✅ 成功提取工具调用: {tool_call_info['name']}")
+                    log.debug("✅ 成功提取工具调用: %s", tool_call_info["name"])
         
         # 检查OpenAI旧格式的function_call
         if not tool_calls and hasattr(message_obj, "additional_kwargs"):
@@ -389,13 +639,11 @@ def extract_tool_calls_from_object(message_obj):
                             "name": func_call["name"],
                             "args": args
                         })
-                        print(f"✅ 从function_call中提取工具调用: {func_call['name']}")
+                        log.debug("✅ 从function_call中提取工具调用: %s", func_call["name"])
                     except Exception as e:
-                        print(f"⚠️ 解析function_call参数时出错: {str(e)}")
+                        log.warning("⚠️ 解析function_call参数时出错: %s", e)
     except Exception as e:
-        print(f"⚠️ 提取工具调用时出错: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("⚠️ 提取工具调用时出错: %s", e)
         
     return tool_calls
 
@@ -407,72 +655,113 @@ def extract_single_tool_call(tool_call):
     if hasattr(tool_call, "name") and hasattr(tool_call, "args"):
         tool_call_dict = {
             "name": tool_call.name,
-            "args": tool_call.args
+            "args": tool_call.args,
+            "id": getattr(tool_call, "id", None)
         }
     # 方式2: 有name和args作为字典项
     elif isinstance(tool_call, dict) and "name" in tool_call and "args" in tool_call:
         tool_call_dict = {
             "name": tool_call["name"],
-            "args": tool_call["args"]
+            "args": tool_call["args"],
+            "id": tool_call.get("id")
         }
     # 方式3: 处理特殊的Gemini/Google AI格式
     elif hasattr(tool_call, "type") and getattr(tool_call, "type") == "tool_call":
         if hasattr(tool_call, "name") and hasattr(tool_call, "args"):
             tool_call_dict = {
                 "name": tool_call.name,
-                "args": tool_call.args
+                "args": tool_call.args,
+                "id": getattr(tool_call, "id", None)
             }
     
     return tool_call_dict if tool_call_dict and "name" in tool_call_dict else None
 
-def process_tool_calls(state: JD_QueryState, tool_calls: list) -> JD_QueryState:
-    """处理提取到的工具调用"""
-    tool_outputs = []
-    
-    print(f"⚙️ 工具调用节点接收到 {len(tool_calls)} 个工具调用请求")
+async def process_tool_calls(state: JD_QueryState, tool_calls: list) -> JD_QueryState:
+    """处理提取到的工具调用（并发执行，结果按调用顺序返回）"""
+    log.info("⚙️ 工具调用节点接收到 %d 个工具调用请求", len(tool_calls))
     
     # 如果没有工具调用，返回错误消息
     if not tool_calls:
         error_msg = "工具调用过程中出现问题，未能获取结果。"
-        print(f"⚠️ {error_msg}")
+        log.warning("⚠️ %s", error_msg)
         return {
-            "messages": state["messages"] + [{"role": "assistant", "content": error_msg}],
-            "query": state["query"],
+            "messages": [{"role": "assistant", "content": error_msg}],
             "finished": True
         }
     
-    for tool_call in tool_calls:
+    # 并发执行相互独立的工具调用，结果仍按调用顺序返回
+    semaphore = asyncio.Semaphore(TOOL_EXECUTION_CONFIG["max_concurrency"])
+    batch_start = time.time()
+    
+    async def run_tool_call(index, tool_call):
         # 提取工具信息
         tool_info = get_tool_info(tool_call)
         tool_name, args = tool_info["name"], tool_info["args"]
-        print(f"🔧 正在执行工具: {tool_name}, 参数: {str(args)[:100]}...")
+        timeout = TOOL_EXECUTION_CONFIG["timeouts"].get(tool_name, TOOL_EXECUTION_CONFIG["default_timeout"])
         
-        # 查找并执行工具
-        tool_output = execute_tool(tool_name, args)
-        tool_outputs.append(tool_output)
+        async with semaphore:
+            log.info("🔧 正在执行工具[%d]: %s, 参数: %.100s...", index + 1, tool_name, args)
+            call_start = time.time()
+            with span(f"tool.{tool_name}", tool=tool_name, args=str(args)[:200]) as tool_span:
+                try:
+                    # 查找并执行工具
+                    tool_output = await asyncio.wait_for(execute_tool(tool_name, args), timeout=timeout)
+                except asyncio.TimeoutError:
+                    error_msg = f"工具'{tool_name}'执行超时({timeout}秒)，请稍后再试"
+                    log.warning("⚠️ %s", error_msg)
+                    tool_span.set_attribute("timeout", True)
+                    TOOL_ERRORS.inc(tool=tool_name, reason="timeout")
+                    tool_output = {"role": "assistant", "content": error_msg}
+            log.info("⏱️ 工具执行耗时", extra={"index": index + 1, "tool": tool_name, "elapsed": round(time.time() - call_start, 3)})
+            return tool_output
+    
+    tool_outputs = await asyncio.gather(*[run_tool_call(i, call) for i, call in enumerate(tool_calls)])
+    log.info("⏱️ 工具调用全部完成", extra={"count": len(tool_calls), "elapsed": round(time.time() - batch_start, 3)})
+    
+    # 每个工具调用都用ToolMessage应答，否则之后发送给LLM的历史中会留下未应答的函数调用；
+    # 格式化后的结果合并为一条助手消息，保持 模型/用户 消息交替
+    tool_messages = []
+    for tool_call, output in zip(tool_calls, tool_outputs):
+        tool_info = get_tool_info(tool_call)
+        if tool_info["id"]:
+            tool_messages.append(ToolMessage(
+                content=tool_result_summary(output), tool_call_id=tool_info["id"], name=tool_info["name"]
+            ))
+    combined = {"role": "assistant", "content": "\n\n".join(output["content"] for output in tool_outputs)}
     
     # 返回结果并标记为已完成
     return {
-        "messages": state["messages"] + tool_outputs,
-        "query": state["query"],
+        "messages": tool_messages + [combined],
         "finished": True
     }
 
+def tool_result_summary(output) -> str:
+    """ToolMessage的内容：格式化结果的第一行（完整内容在随后的助手消息中，不重复占用上下文）"""
+    return output["content"].strip().split("\n", 1)[0][:200]
+
 def get_tool_info(tool_call):
     """提取工具名称和参数"""
     if isinstance(tool_call, dict):
         return {
             "name": tool_call.get("name", "未知工具"),
-            "args": tool_call.get("args", {})
+            "args": tool_call.get("args", {}),
+            "id": tool_call.get("id")
         }
     else:
         return {
             "name": getattr(tool_call, "name", "未知工具"),
-            "args": getattr(tool_call, "args", {})
+            "args": getattr(tool_call, "args", {}),
+            "id": getattr(tool_call, "id", None)
         }
 
-def execute_tool(tool_name: str, args: dict):
+async def execute_tool(tool_name: str, args: dict):
     """执行工具调用并返回结果"""
+    TOOL_CALLS.inc(tool=tool_name)
+    # 超时取消时同样经过 finally，耗时计入直方图
+    with TOOL_LATENCY.time(tool=tool_name):
+        return await _execute_tool(tool_name, args)
+
+async def _execute_tool(tool_name: str, args: dict):
     # 查找工具
     try:
         tool = next((t for t in tools if t.name == tool_name), None)
@@ -480,37 +769,49 @@ def execute_tool(tool_name: str, args: dict):
         # 工具不存在的情况
         if not tool:
             error_msg = f"错误: 找不到名为'{tool_name}'的工具"
-            print(f"❌ {error_msg}")
+            log.error("❌ %s", error_msg)
+            TOOL_ERRORS.inc(tool=tool_name, reason="not_found")
             return {"role": "assistant", "content": error_msg}
         
-        print(f"✅ 找到工具: {tool_name}")
+        log.debug("✅ 找到工具: %s", tool_name)
         
         # 执行工具调用
         start_time = time.time()
         
         # 检查代理设置
         import os
-        print(f"🔐 工具执行前代理状态: HTTP={'http_proxy' in os.environ}, HTTPS={'https_proxy' in os.environ}")
+        log.debug("🔐 工具执行前代理状态", extra={"http_proxy": "http_proxy" in os.environ, "https_proxy": "https_proxy" in os.environ})
         
-        # 调用工具
-        output = tool.invoke(args)
+        # 调用工具（同步工具由LangChain放入线程池执行，不阻塞事件循环）
+        output = await tool.ainvoke(args)
         elapsed = time.time() - start_time
-        print(f"✓ 工具'{tool_name}'执行完成，耗时: {elapsed:.2f}秒")
+        log.debug("✓ 工具'%s'执行完成，耗时: %.2f秒", tool_name, elapsed)
         
         # 生成响应
         if tool_name == "JD_search_general":
             return format_search_response(output)
+        elif tool_name == "extract_text_from_image_urls":
+            return format_ocr_batch_response(output)
         else:
             return {"role": "assistant", "content": f"已执行操作：{tool.name}\n结果：{str(output)[:200]}..."}
             
     except Exception as e:
         # 处理工具调用异常
         error_msg = f"工具'{tool_name}'调用失败：{str(e)}"
-        print(f"❌ {error_msg}")
-        import traceback
-        traceback.print_exc()
+        log.exception("❌ %s", error_msg)
+        TOOL_ERRORS.inc(tool=tool_name, reason="exception")
         return {"role": "assistant", "content": error_msg}
 
+def format_ocr_batch_response(output):
+    """格式化批量图片文字提取结果"""
+    if not isinstance(output, dict) or not output:
+        return {"role": "assistant", "content": f"批量图片文字提取未返回结果: {str(output)[:200]}"}
+    
+    lines = [f"已提取{len(output)}张图片的文字："]
+    for image_url, text in output.items():
+        lines.append(f"- {image_url}: {str(text).replace(chr(10), ' ')[:200]}")
+    return {"role": "assistant", "content": "\n".join(lines)}
+
 def format_search_response(output):
     """格式化搜索结果响应"""
     try:
@@ -529,7 +830,7 @@ def format_search_response(output):
         # 构建友好响应
         result_count = len(search_results)
         success_msg = f"已找到{result_count}个商品结果，为您整理如下："
-        print(f"✅ {success_msg}")
+        log.debug("✅ %s", success_msg)
         
         # 创建HTML表格
         html_table = "<table border='1' style='width:100%; border-collapse:collapse;'>"
@@ -563,37 +864,44 @@ def format_search_response(output):
         
         # 组合响应
         result_msg = f"{success_msg}\n\n{html_table}\n\n如果表格显示不正确，请参考以下内容：\n\n{markdown_table}"
-        print(f"📊 返回搜索结果: {len(search_results)}条")
+        
+        # 附上详情页补充的信息
+        from product_enrichment import format_enrichment
+        details = [(index, format_enrichment(product)) for index, product in enumerate(search_results[:5], 1)]
+        details = [f"{index}. {text}" for index, text in details if text]
+        if details:
+            result_msg += "\n\n商品详情补充：\n" + "\n".join(details)
+        log.info("📊 返回搜索结果: %d条", len(search_results))
         
         return {"role": "assistant", "content": result_msg}
         
     except Exception as e:
         # 如果解析失败，返回原始输出
         error_msg = f"已执行搜索操作，但结果解析失败: {str(e)}。原始结果: {str(output)[:200]}..."
-        print(f"❌ {error_msg}")
+        log.error("❌ %s", error_msg)
         return {"role": "assistant", "content": error_msg}
 
 llm_with_tools = llm.bind_tools(tools)
 
 def maybe_route_to_tools(state: JD_QueryState) -> Literal["tools", "human", "__end__"]:
     """路由逻辑增加终止判断"""
-    print(f"🔀 状态路由: 消息数量={len(state.get('messages', []))}, 完成状态={state.get('finished', False)}")
+    log.debug("🔀 状态路由: 消息数量=%d, 完成状态=%s", len(state.get("messages", [])), state.get("finished", False))
     
     # 检查完成状态
     if state.get("finished", False):
-        print("🛑 检测到完成标记，结束流程")
+        log.debug("🛑 检测到完成标记，结束流程")
         return "__end__"
 
     # 获取最新消息
     last_msg = state["messages"][-1]
-    print(f"⬆️ 最新消息类型: {type(last_msg).__name__}")
+    log.debug("⬆️ 最新消息类型: %s", type(last_msg).__name__)
     
     # 检测工具调用
     has_tool_calls = check_for_tool_calls(last_msg)
     
     # 确定路由
     route = "tools" if has_tool_calls else "human"
-    print(f"🔀 路由决策: {route}")
+    log.debug("🔀 路由决策: %s", route)
     return route
 
 def check_for_tool_calls(message) -> bool:
@@ -602,7 +910,7 @@ def check_for_tool_calls(message) -> bool:
     if isinstance(message, dict):
         has_tool_calls = "tool_calls" in message and message.get("tool_calls")
         tool_name = message.get("tool_calls", [{}])[0].get("name", "未知工具") if has_tool_calls else "无"
-        print(f"📦 字典消息，包含工具调用: {has_tool_calls}" + (f", 工具: {tool_name}" if has_tool_calls else ""))
+        log.debug("📦 字典消息，包含工具调用: %s, 工具: %s", bool(has_tool_calls), tool_name)
         return has_tool_calls
     
     # 对象类型消息
@@ -613,7 +921,7 @@ def check_for_tool_calls(message) -> bool:
     if hasattr(message, "tool_calls") and message.tool_calls:
         has_tool_calls = True
         tool_name = get_tool_name_from_object(message.tool_calls[0])
-        print(f"🤖 检测到tool_calls格式工具调用: {tool_name}")
+        log.debug("🤖 检测到tool_calls格式工具调用: %s", tool_name)
         return True
     
     # 2. 检查OpenAI旧格式function_call
@@ -624,7 +932,7 @@ def check_for_tool_calls(message) -> bool:
             if isinstance(func_call, dict) and "name" in func_call:
                 has_tool_calls = True
                 tool_name = func_call["name"]
-                print(f"🤖 检测到function_call格式工具调用: {tool_name}")
+                log.debug("🤖 检测到function_call格式工具调用: %s", tool_name)
                 return True
     
     return False
@@ -642,6 +950,7 @@ graph_builder = StateGraph(JD_QueryState)
 
 # 添加核心节点（保持终端对话逻辑）
 graph_builder.add_node("human", human_node)
+graph_builder.add_node("compact", compact_history_node)
 graph_builder.add_node("chatbot", chatbot_with_tools)
 graph_builder.add_node("tools", tool_node)
 
@@ -656,13 +965,17 @@ graph_builder.add_conditional_edges(
     }
 )
 graph_builder.add_edge("tools", "chatbot")
-graph_builder.add_edge("human", "chatbot")
-graph_builder.add_edge(START, "chatbot")  # 初始化入口
+graph_builder.add_edge("human", "compact")
+graph_builder.add_edge("compact", "chatbot")
+graph_builder.add_edge(START, "compact")  # 初始化入口：先压缩历史再调用LLM
+
+from checkpointing import create_checkpointer
 
-graph_with_tools = graph_builder.compile()
+checkpointer = create_checkpointer(**CHECKPOINT_CONFIG)
+graph_with_tools = graph_builder.compile(checkpointer=checkpointer)
 
-mermaid_syntax = graph_with_tools.get_graph().draw_mermaid()
-print(mermaid_syntax)
+if log.isEnabledFor(logging.DEBUG):
+    log.debug("🗺️ 状态图结构:\n%s", graph_with_tools.get_graph().draw_mermaid())
 
 
 config = {"recursion_limit": 100}
@@ -677,142 +990,672 @@ initial_state = JD_QueryState(
     finished=False
 )
 
-# 将直接导入和启动改为条件判断，避免循环导入
-if __name__ == "__main__":
-    from Gradio_UI import GradioUI
-    GradioUI(graph_with_tools).launch(share=True)
+# 浏览器池配置：浏览器数量、每个浏览器预热的上下文数量、上下文最大复用次数
+BROWSER_POOL_CONFIG = {
+    "browsers": 1,
+    "contexts_per_browser": 2,
+    "max_uses": 20,
+    "headless": True
+}
+
+# 每次搜索最多提取的商品数量
+MAX_SEARCH_ITEMS = 10
+
+# 多页结果收集：第一页不足 max_results 时，scroll 为True则滚动触发后半页懒加载，
+# 仍不足时在同一浏览器上下文的新标签页中并发打开第2..max_pages页；结果按SKU去重合并。
+# time_budget 为收集阶段的总时间（秒），用完后停止并返回已收集的商品
+HARVEST_CONFIG = {
+    "max_results": MAX_SEARCH_ITEMS,
+    "max_pages": 1,
+    "scroll": False,
+    "scroll_wait": 3000,  # 等待懒加载商品出现的最长时间(毫秒)
+    "time_budget": 30.0
+}
+
+# 按域名的访问限速：(最小间隔秒数, 随机抖动秒数)
+RATE_LIMIT_CONFIG = {
+    "www.jd.com": (1.0, 2.0),
+    "search.jd.com": (2.0, 3.0)
+}
+
+# 搜索页导航：direct 直接打开搜索结果URL，被拦截（登录/验证页）时退回首页输入搜索；homepage 始终走首页
+# sort 可选 sales/comments/newest/price_asc/price_desc；price_range 为 (最低价, 最高价)，任一端可为None
+SEARCH_NAVIGATION_CONFIG = {
+    "mode": "direct",
+    "search_url": "https://search.jd.com/Search",
+    "sort": None,
+    "price_range": None,
+    "timeout": 20000
+}
+
+# 抓取时拦截的请求：资源类型、统计/广告域名、URL正则；allow_url_patterns 中匹配的请求始终放行
+REQUEST_BLOCKING_CONFIG = {
+    "enabled": True,
+    "block_resource_types": ["image", "media", "font"],
+    "block_domains": [
+        "google-analytics.com", "googletagmanager.com", "doubleclick.net",
+        "hm.baidu.com", "cnzz.com", "wl.jd.com", "mercury.jd.com", "ccc-x.jd.com"
+    ],
+    "block_url_patterns": [r"/(ad|ads|advert)/", r"\.(gif|png|jpe?g|webp|woff2?|ttf|mp4)(\?|$)"],
+    "allow_url_patterns": []
+}
+
+# HTTP快速路径：不启动浏览器，直接请求搜索结果页HTML解析（需安装 selectolax），
+# 遇到登录/风控页或没有商品时自动退回 Playwright
+HTTP_SEARCH_CONFIG = {
+    "enabled": True,
+    "timeout": 15.0,
+    "max_connections": 10
+}
+
+# 京东搜索结果页的排序参数 psort
+JD_SORT_PARAMS = {"price_desc": 1, "price_asc": 2, "sales": 3, "comments": 4, "newest": 5}
+
+# 搜索结果缓存：过期时间(秒)、最大条目数、可选的SQLite持久化文件
+SEARCH_CACHE_CONFIG = {
+    "ttl": 1800,
+    "max_entries": 256,
+    "sqlite_path": None  # 例如 "jd_search_cache.db"
+}
+
+# 商品详情页补充：搜索后在同一浏览器上下文的多个标签页中并发打开前 max_products 个商品的详情页，
+# 提取规格参数、到手价/国补信息和评价数并入商品记录；ttl 秒内补充过的SKU直接复用，不再打开页面。
+# page_timeout 为单个详情页的超时(秒)，其中最后 extract_reserve 秒留给提取：规格或价格到时仍未渲染时提取页面上已有的内容；
+# time_budget 为整个补充阶段的时间(秒)，用完后保留已补充的结果。
+# background 为 True 时工具不等待详情页：本次结果只带已缓存的详情，其余在后台补充后刷新搜索缓存；
+# 为 False 时在工具返回前补充，每次未命中缓存的搜索增加浏览器租用和最多 time_budget 秒的延迟
+ENRICHMENT_CONFIG = {
+    "enabled": True,
+    "background": True,
+    "max_products": 5,
+    "concurrency": 3,
+    "page_timeout": 15,
+    "extract_reserve": 3,
+    "time_budget": 25,
+    "max_specs": 30,
+    "ttl": 6 * 3600,
+    "max_entries": 1024
+}
+
+_browser_pool = None
+_rate_limiter = None
+_request_blocker = None
+_http_search_engine = None
+_search_cache = None
+_search_flight = None
+_enrichment_cache = None
+
+def get_browser_pool(cookies_file="jd_cookies.json"):
+    """获取全局共享的浏览器池（首次调用时创建）"""
+    global _browser_pool
+    if _browser_pool is None:
+        from browser_pool import BrowserPool
+        _browser_pool = BrowserPool(cookies_file=cookies_file, proxy=PROXY_CONFIG["scrape"], **BROWSER_POOL_CONFIG)
+    return _browser_pool
+
+def get_rate_limiter():
+    """获取全局共享的域名限速器"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        from rate_limiter import DomainRateLimiter
+        _rate_limiter = DomainRateLimiter(domain_rules=RATE_LIMIT_CONFIG)
+    return _rate_limiter
+
+def get_request_blocker():
+    """获取全局共享的请求拦截规则（未启用时返回None）"""
+    global _request_blocker
+    if _request_blocker is None and REQUEST_BLOCKING_CONFIG["enabled"]:
+        from request_blocking import RequestBlocker
+        _request_blocker = RequestBlocker(**{k: v for k, v in REQUEST_BLOCKING_CONFIG.items() if k != "enabled"})
+    return _request_blocker
+
+def get_http_search_engine(cookies_file="jd_cookies.json"):
+    """获取全局共享的HTTP搜索引擎（未启用或缺少依赖时返回None）"""
+    global _http_search_engine
+    if not HTTP_SEARCH_CONFIG["enabled"]:
+        return None
+    if _http_search_engine is None:
+        try:
+            from http_search import HttpSearchEngine
+            _http_search_engine = HttpSearchEngine(
+                cookies_file,
+                timeout=HTTP_SEARCH_CONFIG["timeout"],
+                max_connections=HTTP_SEARCH_CONFIG["max_connections"],
+                proxy=PROXY_CONFIG["scrape"]
+            )
+        except ImportError:
+            log.warning("⚠️ 未安装selectolax，HTTP快速搜索已禁用。请运行: pip install selectolax")
+            HTTP_SEARCH_CONFIG["enabled"] = False
+    return _http_search_engine
+
+def get_search_cache():
+    """获取全局共享的搜索结果缓存"""
+    global _search_cache
+    if _search_cache is None:
+        from search_cache import SearchCache
+        _search_cache = SearchCache(**SEARCH_CACHE_CONFIG)
+    return _search_cache
+
+def get_enrichment_cache():
+    """获取全局共享的详情页补充结果缓存（按SKU）"""
+    global _enrichment_cache
+    if _enrichment_cache is None:
+        from search_cache import SearchCache
+        _enrichment_cache = SearchCache(
+            ttl=ENRICHMENT_CONFIG["ttl"], max_entries=ENRICHMENT_CONFIG["max_entries"], name="enrichment"
+        )
+    return _enrichment_cache
+
+def get_search_flight():
+    """获取全局的搜索请求合并器"""
+    global _search_flight
+    if _search_flight is None:
+        from single_flight import SingleFlight
+        _search_flight = SingleFlight()
+    return _search_flight
+
+def is_valid_search_result(search_results):
+    """判断搜索结果是否为有效商品列表（错误信息的价格均为N/A）"""
+    return (
+        isinstance(search_results, list)
+        and bool(search_results)
+        and any(item.get("price") != "N/A" for item in search_results)
+    )
+
+def is_complete_search_result(search_results):
+    """判断搜索结果是否可以缓存：有效且不含任何错误记录"""
+    return is_valid_search_result(search_results) and all(item.get("price") != "N/A" for item in search_results)
+
+def shutdown_browser_pool():
+    """应用退出时关闭浏览器池"""
+    if _browser_pool is not None:
+        _browser_pool.close_sync()
+
+def shutdown_http_search():
+    """应用退出时关闭HTTP搜索的连接池"""
+    if _http_search_engine is not None:
+        _http_search_engine.close_sync()
+
+def shutdown_ocr_client():
+    """应用退出时关闭图片文字提取客户端的连接池"""
+    if _ocr_client is not None:
+        _ocr_client.close_sync()
+
+def shutdown_checkpointer():
+    """应用退出时关闭检查点存储（SQLite后端需要关闭连接）"""
+    if hasattr(checkpointer, "close_sync"):
+        checkpointer.close_sync()
+
+@traced("scrape.http_search")
+async def http_search(search_keyword, cookies_file):
+    """HTTP快速路径搜索，成功返回商品列表，需要退回浏览器抓取时返回None"""
+    engine = get_http_search_engine(cookies_file)
+    if engine is None:
+        return None
+    
+    max_results = HARVEST_CONFIG["max_results"]
+    deadline = time.monotonic() + HARVEST_CONFIG["time_budget"]
+    url = build_search_url(search_keyword, SEARCH_NAVIGATION_CONFIG["sort"], SEARCH_NAVIGATION_CONFIG["price_range"])
+    current_span().set_attributes(keyword=search_keyword, url=url)
+    await get_rate_limiter().acquire(url)
+    raw_items, failure = await engine.search(url, max_results)
+    if raw_items:
+        publish_products(raw_items)
+    
+    if raw_items is None:
+        log.info("↩️ HTTP快速搜索未成功(%s)，改用浏览器抓取", failure)
+        current_span().set_attribute("fallback_reason", failure)
+        SEARCH_NAVIGATION.inc(mode="http", result=failure)
+        return None
+    
+    SEARCH_NAVIGATION.inc(mode="http", result="ok")
+    pages = []
+    if len(raw_items) < max_results and HARVEST_CONFIG["max_pages"] > 1:
+        # 后续页并发请求，失败或超出时间预算的页直接跳过
+        async def fetch_page(page_number):
+            page_url = build_search_url(search_keyword, SEARCH_NAVIGATION_CONFIG["sort"],
+                                        SEARCH_NAVIGATION_CONFIG["price_range"], page_number)
+            await get_rate_limiter().acquire(page_url)
+            items, _ = await engine.search(page_url, max_results)
+            if items:
+                publish_products(items)
+            return items
+        
+        pages = await gather_within_budget(
+            [fetch_page(n) for n in range(2, HARVEST_CONFIG["max_pages"] + 1)], deadline
+        )
+        current_span().set_attribute("pages", 1 + sum(page is not None for page in pages))
+    raw_items = merge_unique_items([raw_items, *pages], max_results)
+    
+    SCRAPE_ITEMS.observe(len(raw_items))
+    current_span().set_attribute("item_count", len(raw_items))
+    log.info("⚡ HTTP快速搜索提取到%d个商品", len(raw_items))
+    product_details = [process_product_item(item, index) for index, item in enumerate(raw_items)]
+    save_product_details(product_details)
+    return product_details
 
+@traced("scrape.jd_search")
 async def jd_search_general(search_keyword, cookies_file):
-    """异步执行京东商品搜索"""
-    print(f"🔍 开始搜索京东商品: {search_keyword}")
+    """异步执行京东商品搜索（优先HTTP快速路径，失败时使用浏览器）"""
+    log.info("🔍 开始搜索京东商品: %s", search_keyword)
+    current_span().set_attribute("keyword", search_keyword)
+    
+    product_details = await http_search(search_keyword, cookies_file)
+    if product_details is not None:
+        current_span().set_attribute("engine", "http")
+        return product_details
+    current_span().set_attribute("engine", "playwright")
     
     try:
-        async with async_playwright() as playwright:
-            # 初始化浏览器环境
-            browser_context = await setup_browser(playwright)
-            
-            # 加载Cookie
-            await load_cookies(browser_context, cookies_file)
-            
+        # 从浏览器池租用已加载Cookie的上下文
+        lease_start = time.time()
+        async with get_browser_pool(cookies_file).lease() as browser_context:
+            current_span().set_attribute("lease_wait_ms", round((time.time() - lease_start) * 1000, 1))
             # 创建页面并导航到京东
             page = await browser_context.new_page()
             
-            # 执行搜索流程
-            search_result = await perform_search(
-                page, 
-                search_keyword, 
-                browser_context
-            )
+            # 拦截图片、字体、广告和统计请求
+            request_blocker = get_request_blocker()
+            page_stats = await request_blocker.install(page) if request_blocker else None
             
-            return search_result
+            try:
+                # 执行搜索流程
+                return await perform_search(page, search_keyword)
+            finally:
+                if page_stats:
+                    log.info("🚫 已拦截%d个请求（约%dKB），放行%d个", page_stats["blocked"],
+                             page_stats["blocked_bytes"] // 1024, page_stats["allowed"])
+                    current_span().set_attributes(
+                        blocked_requests=page_stats["blocked"], allowed_requests=page_stats["allowed"],
+                        blocked_bytes_estimated=page_stats["blocked_bytes"]
+                    )
+                await page.close()
             
     except Exception as e:
         error_msg = f"搜索过程中发生错误: {str(e)}"
-        print(f"❌ {error_msg}")
+        log.error("❌ %s", error_msg)
         return [{"title": error_msg, "price": "N/A"}]
 
-async def setup_browser(playwright):
-    """设置浏览器环境"""
-    print("🌐 启动浏览器中...")
-    browser = await playwright.chromium.launch(headless=True)
-    return await browser.new_context()
-
-async def load_cookies(browser_context, cookies_file):
-    """加载Cookie文件"""
-    try:
-        with open(cookies_file, "r") as f:
-            cookies = json.load(f)
-            await browser_context.add_cookies(cookies)
-        print(f"🍪 已加载Cookie文件: {cookies_file}")
-    except Exception as e:
-        print(f"⚠️ 读取Cookie文件时出错: {str(e)}")
-
-async def perform_search(page, search_keyword, browser_context):
-    """在京东执行搜索流程"""
-    # 访问京东首页
-    if not await navigate_to_jd(page):
-        await browser_context.browser.close()
-        return [{"title": "访问京东首页失败", "price": "N/A"}]
+async def perform_search(page, search_keyword):
+    """在京东执行搜索流程（优先直接打开搜索结果页，失败时走首页搜索）"""
+    direct_ok = SEARCH_NAVIGATION_CONFIG["mode"] == "direct" and await navigate_to_search_results(page, search_keyword)
     
-    # 执行搜索
-    if not await execute_search_query(page, search_keyword):
-        await browser_context.browser.close()
-        return [{"title": f"搜索'{search_keyword}'失败", "price": "N/A"}]
+    if not direct_ok:
+        # 访问京东首页
+        if not await navigate_to_jd(page):
+            return [{"title": "访问京东首页失败", "price": "N/A"}]
+        
+        # 执行搜索
+        if not await execute_search_query(page, search_keyword):
+            return [{"title": f"搜索'{search_keyword}'失败", "price": "N/A"}]
     
-    # 提取商品信息
-    product_details = await extract_product_details(page, search_keyword)
+    # 提取商品信息（按 HARVEST_CONFIG 触发懒加载和抓取后续页）
+    product_details = await extract_product_details(page, search_keyword, HARVEST_CONFIG["max_results"])
     
     # 保存结果
     save_product_details(product_details)
-    
-    # 关闭浏览器
-    await browser_context.browser.close()
     return product_details
 
+def build_search_url(search_keyword, sort=None, price_range=None, page_number=1):
+    """
+    构造京东搜索结果页URL。
+
+    Args:
+        sort (str): 排序方式，见 JD_SORT_PARAMS
+        price_range (tuple): (最低价, 最高价)，任一端为None表示不限
+        page_number (int): 结果页码（京东每个可见页对应两个page参数，奇数为上半页）
+    """
+    from urllib.parse import urlencode
+    params = {"keyword": search_keyword, "enc": "utf-8"}
+    if sort in JD_SORT_PARAMS:
+        params.update(psort=JD_SORT_PARAMS[sort])
+    if price_range and any(bound is not None for bound in price_range):
+        low, high = price_range
+        params["ev"] = f"exprice_{'' if low is None else low}-{'' if high is None else high}^"
+    if page_number > 1:
+        params.update(page=page_number * 2 - 1)
+    return f"{SEARCH_NAVIGATION_CONFIG['search_url']}?{urlencode(params)}"
+
+def is_challenge_page(url):
+    """判断是否被重定向离开搜索域名（登录页、风控验证页等）"""
+    from urllib.parse import urlparse
+    return urlparse(url).netloc != urlparse(SEARCH_NAVIGATION_CONFIG["search_url"]).netloc
+
+@traced("playwright.direct_search")
+async def navigate_to_search_results(page, search_keyword):
+    """直接打开搜索结果URL并等待商品列表渲染，被拦截或超时时返回False"""
+    url = build_search_url(
+        search_keyword, SEARCH_NAVIGATION_CONFIG["sort"], SEARCH_NAVIGATION_CONFIG["price_range"]
+    )
+    current_span().set_attributes(keyword=search_keyword, url=url)
+    try:
+        rate_limit_wait = await get_rate_limiter().acquire(url)
+        current_span().set_attribute("rate_limit_wait_ms", round(rate_limit_wait * 1000, 1))
+        await page.goto(url, wait_until="domcontentloaded", timeout=SEARCH_NAVIGATION_CONFIG["timeout"])
+        if is_challenge_page(page.url):
+            log.warning("⚠️ 搜索结果页被重定向到验证页，改走首页搜索: %s", page.url)
+            current_span().set_attribute("challenged", True)
+            SEARCH_NAVIGATION.inc(mode="direct", result="challenged")
+            return False
+        await page.wait_for_selector(".gl-item", timeout=SEARCH_NAVIGATION_CONFIG["timeout"])
+        log.debug("✅ 搜索结果页已直接加载")
+        SEARCH_NAVIGATION.inc(mode="direct", result="ok")
+        return True
+    except Exception as e:
+        log.warning("⚠️ 直接打开搜索结果页失败，改走首页搜索: %s", e)
+        SEARCH_NAVIGATION.inc(mode="direct", result="failed")
+        return False
+
+@traced("playwright.navigate")
 async def navigate_to_jd(page):
     """导航到京东首页"""
     try:
-        print("🌐 正在导航到京东首页...")
+        log.debug("🌐 正在导航到京东首页...")
+        rate_limit_wait = await get_rate_limiter().acquire("https://www.jd.com")
+        current_span().set_attribute("rate_limit_wait_ms", round(rate_limit_wait * 1000, 1))
         await page.goto("https://www.jd.com", timeout=30000)
-        print("✅ 京东首页加载完成")
+        log.debug("✅ 京东首页加载完成")
         return True
     except Exception as e:
         error_msg = f"访问京东首页失败: {str(e)}"
-        print(f"❌ {error_msg}")
+        log.error("❌ %s", error_msg)
         return False
 
+@traced("playwright.search_query")
 async def execute_search_query(page, search_keyword):
     """执行搜索查询"""
+    current_span().set_attribute("keyword", search_keyword)
     # 填充搜索框
     try:
-        print("🔍 等待搜索框加载...")
+        log.debug("🔍 等待搜索框加载...")
         search_box_selector = "#key"
         await page.wait_for_selector(search_box_selector, timeout=10000)
         await page.fill(search_box_selector, search_keyword)
-        print(f"✓ 已输入搜索关键词: {search_keyword}")
+        log.debug("✓ 已输入搜索关键词: %s", search_keyword)
     except Exception as e:
-        print(f"❌ 找不到或无法填充搜索框: {str(e)}")
+        log.error("❌ 找不到或无法填充搜索框: %s", e)
         return False
     
     # 点击搜索并等待结果
     try:
-        print("🔍 点击搜索按钮...")
+        log.debug("🔍 点击搜索按钮...")
         search_button_selector = ".button"
+        rate_limit_wait = await get_rate_limiter().acquire("https://search.jd.com")
+        current_span().set_attribute("rate_limit_wait_ms", round(rate_limit_wait * 1000, 1))
         await page.click(search_button_selector)
-        print("⏳ 等待搜索结果加载...")
+        log.debug("⏳ 等待搜索结果加载...")
         await page.wait_for_selector(".gl-item", timeout=15000)
-        print("✅ 搜索结果已加载完成")
+        log.debug("✅ 搜索结果已加载完成")
+        SEARCH_NAVIGATION.inc(mode="homepage", result="ok")
         return True
     except Exception as e:
-        print(f"❌ 搜索结果加载失败: {str(e)}")
+        log.error("❌ 搜索结果加载失败: %s", e)
+        SEARCH_NAVIGATION.inc(mode="homepage", result="failed")
         return False
 
-async def extract_product_details(page, search_keyword):
-    """提取商品详情"""
-    product_details = []
+# 在页面内一次性提取所有商品卡片的标题、价格、图片和链接
+EXTRACT_ITEMS_JS = """
+(items, maxItems) => items.slice(0, maxItems).map(item => {
+    const titleEl = item.querySelector('.p-name a');
+    const priceEl = item.querySelector('.p-price strong i');
+    const imageEl = item.querySelector('.p-img img');
+    return {
+        sku: item.getAttribute('data-sku'),
+        title: titleEl ? titleEl.innerText : null,
+        purchase_link: titleEl ? titleEl.getAttribute('href') : null,
+        price: priceEl ? priceEl.innerText : null,
+        image_url: imageEl ? (imageEl.getAttribute('src') || imageEl.getAttribute('data-lazy-img')) : null
+    };
+})
+"""
+
+SKU_PATTERN = re.compile(r"/(\d+)\.html")
+
+def product_sku(item):
+    """商品的去重键：优先使用卡片上的 data-sku，其次从购买链接中解析，都没有时退回链接或标题"""
+    if item.get("sku"):
+        return str(item["sku"])
+    match = SKU_PATTERN.search(item.get("purchase_link") or "")
+    return match.group(1) if match else (item.get("purchase_link") or item.get("title"))
+
+def merge_unique_items(item_lists, max_items):
+    """按SKU合并多页的商品（保持页面顺序，重复时保留先出现的），最多返回max_items个"""
+    merged = {}
+    for items in item_lists:
+        for item in items or []:
+            merged.setdefault(product_sku(item), item)
+    return list(merged.values())[:max_items]
+
+async def gather_within_budget(coroutines, deadline):
+    """并发执行，到截止时间（time.monotonic）时取消未完成的任务；按输入顺序返回结果，未完成或出错的为None"""
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    if not tasks:
+        return []
+    done, pending = await asyncio.wait(tasks, timeout=max(0.0, deadline - time.monotonic()))
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    if pending:
+        log.info("⌛ 时间预算用完，放弃%d个未完成的结果页", len(pending))
+    return [task.result() if task in done and task.exception() is None else None for task in tasks]
+
+@traced("playwright.lazy_load")
+async def load_lazy_items(page, deadline):
+    """滚动到页面底部触发后半页商品的懒加载，等待新商品出现（不超过 scroll_wait 和剩余时间预算）"""
+    before = await page.eval_on_selector_all(".gl-item", "items => items.length")
+    timeout = min(HARVEST_CONFIG["scroll_wait"], (deadline - time.monotonic()) * 1000)
+    if timeout <= 0:
+        return before
+    await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+    try:
+        await page.wait_for_function(
+            "count => document.querySelectorAll('.gl-item').length > count", arg=before, timeout=timeout
+        )
+    except Exception:
+        log.debug("⌛ %dms内没有加载出新商品", timeout)
+    after = await page.eval_on_selector_all(".gl-item", "items => items.length")
+    current_span().set_attributes(before=before, after=after)
+    return after
+
+@traced("playwright.result_page")
+async def fetch_result_page(context, search_keyword, page_number, max_items, deadline):
+    """在同一浏览器上下文的新标签页中打开第page_number页并提取原始商品数据，失败时返回空列表"""
+    current_span().set_attribute("page_number", page_number)
+    page = await context.new_page()
+    try:
+        request_blocker = get_request_blocker()
+        if request_blocker:
+            await request_blocker.install(page)
+        url = build_search_url(
+            search_keyword, SEARCH_NAVIGATION_CONFIG["sort"], SEARCH_NAVIGATION_CONFIG["price_range"], page_number
+        )
+        await get_rate_limiter().acquire(url)
+        await page.goto(url, wait_until="domcontentloaded", timeout=SEARCH_NAVIGATION_CONFIG["timeout"])
+        if is_challenge_page(page.url):
+            log.warning("⚠️ 第%d页被重定向到验证页，跳过", page_number)
+            return []
+        await page.wait_for_selector(".gl-item", timeout=SEARCH_NAVIGATION_CONFIG["timeout"])
+        if HARVEST_CONFIG["scroll"]:
+            await load_lazy_items(page, deadline)
+        raw_items = await page.eval_on_selector_all(".gl-item", EXTRACT_ITEMS_JS, max_items)
+        current_span().set_attribute("item_count", len(raw_items))
+        publish_products(raw_items)
+        return raw_items
+    except Exception as e:
+        log.warning("⚠️ 抓取第%d页失败: %s", page_number, e)
+        return []
+    finally:
+        await page.close()
+
+@traced("playwright.detail_page")
+async def fetch_product_detail(context, purchase_link, deadline):
+    """
+    在新标签页中打开商品详情页并提取补充字段，被重定向到登录/验证页时返回None。
+
+    页面加载和等待渲染都在 deadline（time.monotonic）前 extract_reserve 秒结束，留出提取的时间。
+    """
+    from urllib.parse import urlparse
+    from product_enrichment import DETAIL_EXTRACT_JS, parse_detail_page
+    
+    def remaining_ms():
+        # Playwright 的 timeout=0 表示不限时，至少保留1毫秒
+        return max(1, (deadline - ENRICHMENT_CONFIG["extract_reserve"] - time.monotonic()) * 1000)
+    
+    current_span().set_attribute("url", purchase_link)
+    page = await context.new_page()
+    try:
+        request_blocker = get_request_blocker()
+        if request_blocker:
+            await request_blocker.install(page)
+        await get_rate_limiter().acquire(purchase_link)
+        await page.goto(purchase_link, wait_until="domcontentloaded", timeout=remaining_ms())
+        if urlparse(page.url).netloc != urlparse(purchase_link).netloc:
+            log.warning("⚠️ 详情页被重定向到 %s", page.url)
+            return None
+        try:
+            # 规格表和价格由脚本渲染，等到任一出现即可提取
+            await page.wait_for_selector(".Ptable-item, .parameter2, .p-price .price", timeout=remaining_ms())
+        except Exception:
+            log.debug("⌛ 详情页未渲染出规格或价格: %s", purchase_link)
+        detail = parse_detail_page(await page.evaluate(DETAIL_EXTRACT_JS), ENRICHMENT_CONFIG["max_specs"])
+        current_span().set_attribute("fields", ",".join(detail))
+        return detail
+    finally:
+        await page.close()
+
+def apply_cached_details(products):
+    """用详情缓存补充前 max_products 个商品（原地更新，只查内存），返回仍需打开详情页的商品下标"""
+    cache = get_enrichment_cache()
+    pending, cached_count = [], 0
+    for index, product in enumerate(products[:ENRICHMENT_CONFIG["max_products"]]):
+        if product.get("purchase_link", "#") == "#":
+            continue
+        cached = cache.get(product_sku(product))
+        if cached is not None:
+            product.update(cached)
+            cached_count += 1
+            ENRICH_PAGES.inc(result="cached")
+        else:
+            pending.append(index)
+    current_span().set_attributes(enrich_cached=cached_count, enrich_pending=len(pending))
+    return pending
+
+_background_tasks = set()
+
+def spawn_background(coroutine):
+    """在后台执行协程，完成前保留任务引用（避免被垃圾回收）"""
+    task = asyncio.ensure_future(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def refresh_enrichment(search_keyword, products, cookies_file, pending, cache_result):
+    """后台补充详情页信息，完成后用补充后的商品刷新搜索缓存"""
+    try:
+        await enrich_products(products, cookies_file, pending)
+        if cache_result:
+            await get_search_cache().aset(search_keyword, products)
+    except Exception as e:
+        log.warning("⚠️ 后台补充商品详情失败: %s", e)
+
+@traced("enrich.products")
+async def enrich_products(products, cookies_file, pending=None):
+    """
+    为前 max_products 个商品补充详情页信息（原地更新商品记录）。
+
+    pending 为需要打开详情页的商品下标，为None时先用详情缓存补充。
+    每个详情页有单独的超时，并发数受 concurrency 限制；整个阶段超出 time_budget 时
+    放弃未完成的页面，已补充的商品保持更新后的内容。
+    """
+    if pending is None:
+        pending = apply_cached_details(products)
+    pending = [products[index] for index in pending]
+    current_span().set_attribute("fetched", len(pending))
+    if not pending:
+        return products
+    
+    cache = get_enrichment_cache()
+    deadline = time.monotonic() + ENRICHMENT_CONFIG["time_budget"]
+    semaphore = asyncio.Semaphore(ENRICHMENT_CONFIG["concurrency"])
+    
+    async def enrich_one(context, product):
+        async with semaphore:
+            # 单页的时间从拿到并发名额时开始计算，且不超过整个阶段的截止时间
+            page_deadline = min(time.monotonic() + ENRICHMENT_CONFIG["page_timeout"], deadline)
+            try:
+                detail = await asyncio.wait_for(
+                    fetch_product_detail(context, product["purchase_link"], page_deadline),
+                    timeout=ENRICHMENT_CONFIG["page_timeout"]
+                )
+            except asyncio.TimeoutError:
+                log.warning("⚠️ 详情页超时(%d秒): %s", ENRICHMENT_CONFIG["page_timeout"], product["purchase_link"])
+                ENRICH_PAGES.inc(result="timeout")
+                return False
+            except Exception as e:
+                log.warning("⚠️ 详情页补充失败: %s", e)
+                ENRICH_PAGES.inc(result="failed")
+                return False
+        if not detail:
+            ENRICH_PAGES.inc(result="failed")
+            return False
+        product.update(detail)
+        cache.set(product_sku(product), detail)
+        ENRICH_PAGES.inc(result="ok")
+        return True
+    
+    try:
+        async with get_browser_pool(cookies_file).lease() as browser_context:
+            results = await gather_within_budget([enrich_one(browser_context, p) for p in pending], deadline)
+    except Exception as e:
+        log.error("❌ 商品详情补充失败: %s", e)
+        return products
+    
+    skipped = sum(result is None for result in results)
+    if skipped:
+        ENRICH_PAGES.inc(skipped, result="skipped")
+    log.info("🧾 已补充%d/%d个商品的详情页信息", sum(bool(result) for result in results), len(pending))
+    return products
+
+@traced("playwright.extract")
+async def extract_product_details(page, search_keyword, max_items=None):
+    """
+    提取商品详情（单次页面内 evaluate 完成全部商品卡片的提取）。
+
+    当前页不足max_items时按 HARVEST_CONFIG 滚动触发懒加载、并发抓取后续页，按SKU去重合并；
+    超出时间预算时返回已收集的商品。
+    """
+    max_items = max_items or MAX_SEARCH_ITEMS
+    deadline = time.monotonic() + HARVEST_CONFIG["time_budget"]
     
     try:
-        # 获取商品列表
-        print("🔍 获取商品列表...")
-        product_items = await page.query_selector_all(".gl-item")
+        # 一次往返获取所有商品卡片的原始数据
+        log.debug("🔍 获取商品列表...")
+        raw_items = await page.eval_on_selector_all(".gl-item", EXTRACT_ITEMS_JS, max_items)
+        publish_products(raw_items)
+        
+        if len(raw_items) < max_items and HARVEST_CONFIG["scroll"]:
+            await load_lazy_items(page, deadline)
+            raw_items = await page.eval_on_selector_all(".gl-item", EXTRACT_ITEMS_JS, max_items)
+            publish_products(raw_items)
         
-        # 只处理前3个商品
-        items_to_process = product_items[:min(3, len(product_items))]
-        print(f"✓ 找到{len(product_items)}个商品，将处理前{len(items_to_process)}个")
+        pages = []
+        if len(raw_items) < max_items and HARVEST_CONFIG["max_pages"] > 1:
+            pages = await gather_within_budget([
+                fetch_result_page(page.context, search_keyword, page_number, max_items, deadline)
+                for page_number in range(2, HARVEST_CONFIG["max_pages"] + 1)
+            ], deadline)
+        raw_items = merge_unique_items([raw_items, *pages], max_items)
+        log.info("✓ 提取到%d个商品（上限%d个）", len(raw_items), max_items)
+        current_span().set_attribute("item_count", len(raw_items))
+        SCRAPE_ITEMS.observe(len(raw_items))
         
         # 无商品情况处理
-        if not items_to_process:
-            print("⚠️ 未找到任何商品")
+        if not raw_items:
+            log.warning("⚠️ 未找到任何商品")
             return [{"title": f"没有找到与'{search_keyword}'相关的商品", "price": "N/A"}]
         
-        # 处理每个商品
-        for index, item in enumerate(items_to_process):
-            print(f"🔍 处理商品 {index + 1}/{len(items_to_process)}...")
-            await asyncio.sleep(random.uniform(3, 10))
-            
-            # 提取商品信息
-            product_info = await process_product_item(item, index)
-            product_details.append(product_info)
+        # 规范化每个商品的字段
+        product_details = [process_product_item(item, index) for index, item in enumerate(raw_items)]
             
         # 确保至少有一个结果
         if not product_details:
@@ -822,35 +1665,33 @@ async def extract_product_details(page, search_keyword):
         
     except Exception as e:
         error_msg = f"提取商品信息时出错: {str(e)}"
-        print(f"❌ {error_msg}")
+        log.error("❌ %s", error_msg)
         return [{"title": error_msg, "price": "N/A"}]
 
-async def process_product_item(item, index):
-    """处理单个商品项"""
+def process_product_item(item, index):
+    """处理单个商品项（item为页面内提取的原始字段字典）"""
     try:
         # 提取商品标题
-        title_element = await item.query_selector(".p-name a")
-        title = await title_element.inner_text() if title_element else "标题获取失败"
+        title = item.get("title") or "标题获取失败"
 
         # 获取商品的购买链接
-        purchase_link = await title_element.get_attribute("href") if title_element else "#"
+        purchase_link = item.get("purchase_link") or "#"
         purchase_link = f"https:{purchase_link}" if purchase_link.startswith("//") else purchase_link
 
         # 提取商品价格
-        price_element = await item.query_selector(".p-price strong i")
-        price = await price_element.inner_text() if price_element else "价格获取失败"
+        price = item.get("price") or "价格获取失败"
 
         # 提取商品图片链接
-        image_element = await item.query_selector(".p-img img")
-        image_url = await image_element.get_attribute("src") if image_element else "#"
-        image_url = f"https:{image_url}" if image_url and image_url.startswith("//") else image_url
+        image_url = item.get("image_url") or "#"
+        image_url = f"https:{image_url}" if image_url.startswith("//") else image_url
         
-        # 不在这里直接调用图像处理函数，避免同步/异步混用问题
-        # 只保存图片URL，后续可以使用tool再处理
-        image_text = "图片内容将在查看时提取"
+        # 不在这里调用图像处理模型；图片文字在内存缓存中时直接填入（不读磁盘，不计入命中率），否则后续可以使用tool再处理
+        cached_text = get_ocr_cache().peek_by_url(image_url) if image_url != "#" else None
+        image_text = cached_text if cached_text is not None else "图片内容将在查看时提取"
         
-        # 构建商品信息
+        # 构建商品信息（保留SKU，流式去重和多页合并使用同一个键）
         product_info = {
+            "sku": str(item.get("sku") or ""),
             "title": title.strip(),
             "price": price.strip(),
             "image_url": image_url.strip(),
@@ -858,12 +1699,13 @@ async def process_product_item(item, index):
             "purchase_link": purchase_link.strip()
         }
         
-        print(f"✓ 商品 {index + 1}: {title.strip()[:30]}..., 价格: {price.strip()}")
+        if sampled(log):
+            log.debug("✓ 商品 %d: %.30s..., 价格: %s", index + 1, title.strip(), price.strip())
         return product_info
         
     except Exception as e:
         error_msg = f"处理商品{index+1}时出错: {str(e)}"
-        print(f"⚠️ {error_msg}")
+        log.warning("⚠️ %s", error_msg)
         return {
             "title": f"商品{index+1}信息提取失败: {str(e)}",
             "price": "N/A",
@@ -878,6 +1720,14 @@ def save_product_details(product_details):
         output_file = "jd_product_details.json"
         with open(output_file, "w", encoding="utf-8") as f:
             json.dump(product_details, f, ensure_ascii=False, indent=4)
-        print(f"✅ 商品详细信息已保存到 {output_file}")
+        log.debug("✅ 商品详细信息已保存到 %s", output_file)
     except Exception as e:
-        print(f"⚠️ 保存JSON文件失败: {str(e)}")
+        log.warning("⚠️ 保存JSON文件失败: %s", e)
+
+
+# 将直接导入和启动改为条件判断，避免循环导入
+if __name__ == "__main__":
+    from Gradio_UI import GradioUI
+    GradioUI(graph_with_tools, on_shutdown=[
+        shutdown_browser_pool, shutdown_http_search, shutdown_ocr_client, shutdown_checkpointer, shutdown_tracing
+    ]).launch(share=True)
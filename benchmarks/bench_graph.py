@@ -0,0 +1,298 @@
+"""
+对话流水线端到端基准测试（不调用Gemini、不访问网络）。
+
+把 app.llm / app.llm_with_tools 替换为按固定规则回复的假模型，把京东抓取替换为返回固定商品的桩函数，
+通过 Gradio_UI.StreamProcessor 驱动 app.graph_with_tools 执行多轮对话，测量：
+- 各节点/阶段耗时（来自 tracing 的Span：node.compact / node.chatbot / llm.chat / node.tools / tool.* 等）
+- 每秒对话轮数
+- 每轮内存分配峰值、会话内存增长（tracemalloc，单独跑一遍，避免影响耗时数据）
+- 以上指标随会话历史长度的变化
+
+假模型规则：用户消息含"搜索"时返回 JD_search_general 工具调用，否则按词流式输出固定回复。
+工具输出经过真实的 JD_search_general → 搜索缓存 → format_search_response 路径，只替换抓取本身并关闭详情页补充；
+商品详情文件写入临时目录，不覆盖仓库中的 jd_product_details.json。
+
+用法:
+    python benchmarks/bench_graph.py
+    python benchmarks/bench_graph.py --sessions 3 --turns 60 --search-every 2 --bucket 10
+    python benchmarks/bench_graph.py --output bench_graph_results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class ScriptedChatModel(BaseChatModel):
+    """按最后一条用户消息决定回复的假模型：含"搜索"时调用搜索工具，否则输出固定文本"""
+
+    reply_words: int = 40
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    @staticmethod
+    def _last_user_text(messages):
+        for message in reversed(messages):
+            if getattr(message, "type", None) == "human":
+                return str(message.content)
+        return ""
+
+    def _reply(self, messages):
+        text = self._last_user_text(messages)
+        if "搜索" in text:
+            keyword = text.replace("搜索", "").strip() or "手机"
+            return AIMessage(content="", tool_calls=[{
+                "name": "JD_search_general", "args": {"search_keyword": keyword}, "id": f"call_{uuid.uuid4().hex[:8]}"
+            }])
+        words = [f"推荐{i}" for i in range(self.reply_words)]
+        return AIMessage(content=" ".join(words), usage_metadata={
+            "input_tokens": sum(len(str(m.content)) for m in messages), "output_tokens": len(words),
+            "total_tokens": sum(len(str(m.content)) for m in messages) + len(words),
+        })
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        reply = self._reply(messages)
+        for word in reply.content.split(" ") if reply.content else []:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+        for index, call in enumerate(reply.tool_calls):
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[{
+                "name": call["name"], "args": json.dumps(call["args"], ensure_ascii=False),
+                "id": call["id"], "index": index,
+            }]))
+        if reply.usage_metadata:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=reply.usage_metadata))
+
+
+def make_search_stub(item_count):
+    """替换 app.jd_search_general：不启动浏览器，返回固定数量的商品"""
+    async def fake_jd_search_general(search_keyword, cookies_file):
+        return [{
+            "title": f"{search_keyword} 测试商品{i} 高性能 大容量 官方旗舰店",
+            "price": f"{1999 + i}.00",
+            "image_url": f"https://img.example.com/{i}.jpg",
+            "image_text": "图片内容将在查看时提取",
+            "purchase_link": f"https://item.jd.com/{100000 + i}.html",
+        } for i in range(item_count)]
+    return fake_jd_search_general
+
+
+def make_save_stub(output_dir):
+    """替换 app.save_product_details：保留写文件的开销，但写到临时目录"""
+    output_file = os.path.join(output_dir, "jd_product_details.json")
+
+    def save_product_details(product_details):
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(product_details, f, ensure_ascii=False, indent=4)
+    return save_product_details
+
+
+def install_fakes(app, args, output_dir):
+    model = ScriptedChatModel(reply_words=args.reply_words)
+    app.llm = model
+    app.llm_with_tools = model
+    app.jd_search_general = make_search_stub(args.items)
+    app.save_product_details = make_save_stub(output_dir)
+    # 详情页补充同样需要浏览器，与抓取一起排除在外
+    app.ENRICHMENT_CONFIG["enabled"] = False
+    app.RATE_LIMIT_CONFIG.clear()
+
+
+async def run_turn(processor, graph, thread_id, session_key, query):
+    """按界面的方式执行一轮：读取检查点，只发送新的用户消息，消费全部流式输出"""
+    snapshot = await graph.aget_state({"configurable": {"thread_id": thread_id}})
+    checkpoint_messages = snapshot.values.get("messages") or []
+    initial_state = {"messages": [{"role": "user", "content": query}], "query": [query], "finished": False}
+    chunks = 0
+    async for _ in processor.process(initial_state, thread_id=thread_id, session_key=session_key):
+        chunks += 1
+    return chunks, len(checkpoint_messages)
+
+
+def turn_query(turn, search_every):
+    if search_every and turn % search_every == 0:
+        return f"搜索 商品{turn}"
+    return f"第{turn}个问题：这些商品哪个性价比更高？"
+
+
+async def run_sessions(app, processor, args, collector=None, trace_memory=False):
+    """执行所有会话，返回每轮记录"""
+    records = []
+    for session in range(args.sessions):
+        thread_id = f"bench-{session}-{uuid.uuid4().hex[:8]}"
+        session_key = f"bench-session-{session}"
+        processor.reset_context(session_key)
+        session_start_memory = tracemalloc.get_traced_memory()[0] if trace_memory else 0
+
+        for turn in range(args.turns):
+            if collector:
+                collector.drain()
+            if trace_memory:
+                tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0] if trace_memory else 0
+            start = time.perf_counter()
+            chunks, history = await run_turn(processor, app.graph_with_tools, thread_id, session_key,
+                                             turn_query(turn, args.search_every))
+            record = {"session": session, "turn": turn, "history": history,
+                      "latency_ms": (time.perf_counter() - start) * 1000, "chunks": chunks}
+            if trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                record["alloc_peak_kb"] = (peak - before) / 1024
+                record["retained_kb"] = (current - session_start_memory) / 1024
+            if collector:
+                record["spans"] = collector.drain()
+            records.append(record)
+    return records
+
+
+def bucket_rows(records, bucket):
+    """按轮次区间汇总（同一区间内的历史长度相近）"""
+    from tracing import phase_breakdown
+    groups = {}
+    for record in records:
+        groups.setdefault(record["turn"] // bucket, []).append(record)
+
+    rows = []
+    for index in sorted(groups):
+        group = groups[index]
+        latencies = [record["latency_ms"] for record in group]
+        row = {
+            "turns": f"{index * bucket}-{index * bucket + bucket - 1}",
+            "history": round(sum(record["history"] for record in group) / len(group), 1),
+            "latency_ms": round(sum(latencies) / len(latencies), 3),
+            "turns_per_sec": round(len(latencies) / (sum(latencies) / 1000), 2),
+        }
+        spans = [span for record in group for span in record.get("spans", [])]
+        if spans:
+            row["phases_ms"] = {
+                name: round(sum(phase["durations"]) / len(group), 3)
+                for name, phase in phase_breakdown(spans).items()
+            }
+        if "alloc_peak_kb" in group[0]:
+            row["alloc_peak_kb"] = round(sum(record["alloc_peak_kb"] for record in group) / len(group), 1)
+            row["retained_kb"] = round(sum(record["retained_kb"] for record in group) / len(group), 1)
+        rows.append(row)
+    return rows
+
+
+def phase_totals(records):
+    from tracing import phase_breakdown
+    spans = [span for record in records for span in record.get("spans", [])]
+    turns = max(1, len(records))
+    return {
+        name: {
+            "count": phase["count"],
+            "mean_ms": round(sum(phase["durations"]) / phase["count"], 3),
+            "per_turn_ms": round(sum(phase["durations"]) / turns, 3),
+            "self_per_turn_ms": round(phase["self_ms"] / turns, 3),
+            "errors": phase["errors"],
+        }
+        for name, phase in phase_breakdown(spans).items()
+    }
+
+
+def print_report(results):
+    summary = results["summary"]
+    print(f"\n共{summary['turns']}轮，{summary['turns_per_sec']} 轮/秒，平均 {summary['latency_ms']} ms/轮")
+
+    print(f"\n{'阶段':<36}{'次数':>6}{'平均ms':>10}{'每轮ms':>10}{'自身ms/轮':>12}")
+    for name, phase in sorted(results["phases"].items(), key=lambda kv: -kv[1]["self_per_turn_ms"]):
+        print(f"{name:<36}{phase['count']:>6}{phase['mean_ms']:>10}{phase['per_turn_ms']:>10}"
+              f"{phase['self_per_turn_ms']:>12}")
+
+    memory_rows = {row["turns"]: row for row in results.get("memory", [])}
+    print(f"\n{'轮次':<10}{'历史消息':>8}{'ms/轮':>10}{'轮/秒':>9}{'分配峰值KB':>12}{'会话增长KB':>12}")
+    for row in results["buckets"]:
+        memory = memory_rows.get(row["turns"], {})
+        print(f"{row['turns']:<10}{row['history']:>8}{row['latency_ms']:>10}{row['turns_per_sec']:>9}"
+              f"{memory.get('alloc_peak_kb', '-'):>12}{memory.get('retained_kb', '-'):>12}")
+
+
+async def run_benchmark(args):
+    import app
+    from Gradio_UI import StreamProcessor
+    from tracing import MemoryExporter, configure_tracing
+
+    output_dir = tempfile.TemporaryDirectory(prefix="bench_graph_")
+    install_fakes(app, args, output_dir.name)
+    processor = StreamProcessor(app.graph_with_tools)
+    # 同一遍内每轮关键词按轮次编号生成、互不相同，搜索缓存不会命中；
+    # 两遍测量使用相同的关键词，每遍开始前清空搜索缓存
+    app.get_search_cache().clear()
+
+    # 耗时：开启内存追踪器收集Span，不开启tracemalloc
+    collector = MemoryExporter()
+    configure_tracing(collector)
+    records = await run_sessions(app, processor, args, collector=collector)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "sessions": args.sessions, "turns": args.turns, "search_every": args.search_every,
+            "items": args.items, "reply_words": args.reply_words,
+            "checkpoint_backend": app.CHECKPOINT_CONFIG["backend"],
+            "context_policy": app.CONTEXT_WINDOW_CONFIG["policy"],
+        },
+        "summary": {
+            "turns": len(records),
+            "latency_ms": round(sum(r["latency_ms"] for r in records) / len(records), 3),
+            "turns_per_sec": round(len(records) / (sum(r["latency_ms"] for r in records) / 1000), 2),
+        },
+        "phases": phase_totals(records),
+        "buckets": bucket_rows(records, args.bucket),
+    }
+
+    # 内存：关闭追踪，单独用tracemalloc再跑一遍
+    if not args.skip_memory:
+        configure_tracing("none")
+        app.get_search_cache().clear()
+        tracemalloc.start()
+        try:
+            memory_records = await run_sessions(app, processor, args, trace_memory=True)
+        finally:
+            tracemalloc.stop()
+        results["memory"] = bucket_rows(memory_records, args.bucket)
+    output_dir.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对话流水线端到端基准测试（假LLM，无网络）")
+    parser.add_argument("--sessions", type=int, default=2, help="会话数（依次执行）")
+    parser.add_argument("--turns", type=int, default=40, help="每个会话的对话轮数")
+    parser.add_argument("--search-every", type=int, default=2, help="每N轮中有一轮触发搜索工具，0表示不搜索")
+    parser.add_argument("--items", type=int, default=10, help="每次搜索返回的商品数")
+    parser.add_argument("--reply-words", type=int, default=40, help="普通回复流式输出的词数")
+    parser.add_argument("--bucket", type=int, default=10, help="按多少轮汇总一行")
+    parser.add_argument("--skip-memory", action="store_true", help="不运行tracemalloc内存测量")
+    parser.add_argument("--output", help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(args))
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ 结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
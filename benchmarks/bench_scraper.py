@@ -0,0 +1,264 @@
+"""
+京东搜索抓取基准测试（回放录制的页面，不访问线上京东）。
+
+对每种抓取方式重复执行搜索，统计：
+- 端到端耗时（mean/p50/p95/min/max）
+- 各阶段耗时（来自 tracing 的Span，如 playwright.direct_search / playwright.extract）
+- 每秒商品数
+- 峰值内存（安装 psutil 时统计本进程及浏览器子进程的RSS总和，否则只统计本进程）
+
+抓取方式：
+- http                 HTTP快速路径（请求本地 ReplayServer）
+- playwright-direct    浏览器直接打开搜索结果页
+- playwright-homepage  浏览器从首页输入关键词搜索
+
+结果写入JSON文件，可用 --compare 与之前的结果对比。页面需先用 jd_replay.py record 录制。
+基准测试期间关闭域名限速，测的是抓取本身的耗时；商品详情文件写入临时目录，不覆盖仓库中的 jd_product_details.json。
+
+用法:
+    python benchmarks/bench_scraper.py benchmarks/fixtures/phone
+    python benchmarks/bench_scraper.py benchmarks/fixtures/phone --engines http playwright-direct --repeat 20
+    python benchmarks/bench_scraper.py benchmarks/fixtures/phone --output new.json --compare old.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_graph import make_save_stub
+from jd_replay import ReplayServer, install_playwright_replay, load_manifest
+
+ENGINES = ("http", "playwright-direct", "playwright-homepage")
+
+
+class RssSampler:
+    """运行期间定时采样内存，记录峰值（字节）"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._task = None
+        try:
+            import psutil
+            self._process = psutil.Process()
+            self.scope = "process_tree"
+        except ImportError:
+            self._process = None
+            self.scope = "python_only"
+
+    def sample(self):
+        if self._process is None:
+            # ru_maxrss 在Linux上单位为KB，在macOS上为字节
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+        total = self._process.memory_info().rss
+        for child in self._process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except Exception:
+                pass
+        return total
+
+    async def _run(self):
+        while True:
+            self.peak = max(self.peak, self.sample())
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak = self.sample()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+        self.peak = max(self.peak, self.sample())
+
+
+def summarize(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def percentile(pct):
+        return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+    return {
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": round(percentile(50), 3),
+        "p95": round(percentile(95), 3),
+        "min": round(ordered[0], 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def configure_engine(app, engine, server, replay, jd_search_url):
+    """按抓取方式调整 app 中的配置"""
+    app.HTTP_SEARCH_CONFIG["enabled"] = engine == "http"
+    app.SEARCH_NAVIGATION_CONFIG["mode"] = "homepage" if engine == "playwright-homepage" else "direct"
+    use_server = engine == "http" or replay == "server"
+    app.SEARCH_NAVIGATION_CONFIG["search_url"] = server.search_url if use_server else jd_search_url
+
+
+async def run_once(app, engine, keyword, cookies_file):
+    """执行一次搜索，返回 (商品数, 是否成功)"""
+    if engine == "http":
+        results = await app.http_search(keyword, cookies_file)
+    else:
+        results = await app.jd_search_general(keyword, cookies_file)
+    ok = app.is_valid_search_result(results)
+    return (len(results) if ok else 0), ok
+
+
+def phase_summary(runs_spans):
+    """汇总所有运行中各阶段的耗时（毫秒，按每次运行平均）"""
+    from tracing import phase_breakdown
+    all_spans = [span for spans in runs_spans for span in spans]
+    phases = {}
+    for name, phase in phase_breakdown(all_spans).items():
+        phases[name] = {
+            "count": phase["count"],
+            **{f"{key}_ms": value for key, value in summarize(phase["durations"]).items()},
+            "self_ms_per_run": round(phase["self_ms"] / max(1, len(runs_spans)), 3),
+            "errors": phase["errors"],
+        }
+    return phases
+
+
+async def bench_engine(app, engine, keyword, cookies_file, repeat, warmup, collector):
+    latencies, items, runs_spans = [], 0, []
+    failures = 0
+    with RssSampler() as sampler:
+        for index in range(warmup + repeat):
+            collector.drain()
+            start = time.perf_counter()
+            count, ok = await run_once(app, engine, keyword, cookies_file)
+            elapsed = time.perf_counter() - start
+            if index < warmup:
+                continue
+            latencies.append(elapsed * 1000)
+            items += count
+            failures += not ok
+            runs_spans.append(collector.drain())
+
+    total_seconds = sum(latencies) / 1000
+    return {
+        "runs": repeat,
+        "failures": failures,
+        "items": items,
+        "items_per_run": round(items / repeat, 2),
+        "items_per_sec": round(items / total_seconds, 2) if total_seconds else 0.0,
+        "latency_ms": summarize(latencies),
+        "phases": phase_summary(runs_spans),
+        "peak_rss_mb": round(sampler.peak / 1024 / 1024, 1),
+        "rss_scope": sampler.scope,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+async def run_benchmark(args):
+    import app
+    from tracing import MemoryExporter, configure_tracing
+
+    manifest = load_manifest(args.fixture)
+    keyword = args.keyword or manifest.get("keyword") or "手机"
+    collector = MemoryExporter()
+    configure_tracing(collector)
+    app.RATE_LIMIT_CONFIG.clear()
+    output_dir = tempfile.TemporaryDirectory(prefix="bench_scraper_")
+    app.save_product_details = make_save_stub(output_dir.name)
+    jd_search_url = app.SEARCH_NAVIGATION_CONFIG["search_url"]
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "fixture": os.path.abspath(args.fixture),
+            "recorded_at": manifest.get("recorded_at"),
+            "keyword": keyword,
+            "replay": args.replay,
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+        },
+        "engines": {},
+    }
+
+    with ReplayServer(args.fixture) as server:
+        passthrough = (urlparse(server.base_url).netloc,)
+        app.BROWSER_POOL_CONFIG["context_setup"] = lambda context: install_playwright_replay(
+            context, args.fixture, passthrough
+        )
+        pool = app.get_browser_pool(args.cookies)
+        try:
+            for engine in args.engines:
+                configure_engine(app, engine, server, args.replay, jd_search_url)
+                print(f"⏱️ {engine}: 预热{args.warmup}次，测量{args.repeat}次...")
+                results["engines"][engine] = await bench_engine(
+                    app, engine, keyword, args.cookies, args.repeat, args.warmup, collector
+                )
+        finally:
+            await pool.close()
+            output_dir.cleanup()
+    return results
+
+
+def print_results(results, baseline=None):
+    print(f"\n{'抓取方式':<22}{'失败':>6}{'商品/次':>9}{'商品/秒':>10}{'p50ms':>10}{'p95ms':>10}{'峰值MB':>9}")
+    for engine, result in results["engines"].items():
+        latency = result["latency_ms"]
+        print(f"{engine:<22}{result['failures']:>6}{result['items_per_run']:>9}{result['items_per_sec']:>10}"
+              f"{latency.get('p50', 0):>10}{latency.get('p95', 0):>10}{result['peak_rss_mb']:>9}")
+        old = (baseline or {}).get("engines", {}).get(engine)
+        if old and old["latency_ms"].get("p50") and latency.get("p50"):
+            change = latency["p50"] / old["latency_ms"]["p50"] - 1
+            print(f"{'  对比基线':<22}p50 {old['latency_ms']['p50']} → {latency['p50']} ms ({change:+.1%})，"
+                  f"峰值 {old['peak_rss_mb']} → {result['peak_rss_mb']} MB")
+        for name, phase in sorted(result["phases"].items(), key=lambda kv: -kv[1]["self_ms_per_run"]):
+            print(f"    {name:<32}{phase['count']:>5}次  平均{phase.get('mean_ms', 0):>9}ms  "
+                  f"p95 {phase.get('p95_ms', 0):>9}ms  自身{phase['self_ms_per_run']:>9}ms/次")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="京东搜索抓取基准测试（回放录制页面）")
+    parser.add_argument("fixture", help="jd_replay.py record 生成的目录")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--replay", choices=("playwright", "server"), default="playwright",
+                        help="浏览器方式的回放途径：playwright 路由或本地HTTP服务（http方式总是用本地服务）")
+    parser.add_argument("--keyword", help="搜索关键词，默认取录制时的关键词")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1, help="不计入统计的预热次数（含浏览器池启动）")
+    parser.add_argument("--cookies", default="jd_cookies.json")
+    parser.add_argument("--output", default="bench_scraper_results.json")
+    parser.add_argument("--compare", help="之前的结果文件，打印p50和峰值内存的变化")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ 结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
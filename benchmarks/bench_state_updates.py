@@ -0,0 +1,129 @@
+"""
+节点状态更新开销基准测试。
+
+对比两种节点返回方式随会话历史增长的单步耗时：
+- full : 节点返回 state["messages"] + [新消息]（旧写法，add_messages 每步重新合并整个历史）
+- delta: 节点只返回新消息（当前写法）
+
+图结构与 app.py 一致（human → chatbot → tools → chatbot），节点用桩函数代替LLM和工具，
+只测量状态合并与检查点本身的开销。
+
+用法:
+    python benchmarks/bench_state_updates.py
+    python benchmarks/bench_state_updates.py --sizes 100 200 400 800 --repeat 200
+"""
+import argparse
+import time
+from typing import Annotated
+from typing_extensions import TypedDict, NotRequired
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import StateGraph, START, END
+from langgraph.graph.message import add_messages
+
+
+class BenchState(TypedDict):
+    messages: Annotated[list, add_messages]
+    query: list[str]
+    finished: bool
+    summary: NotRequired[str]
+
+
+def make_history(size):
+    """构造指定长度的会话历史（用户/助手消息交替）"""
+    history = []
+    for i in range(size):
+        if i % 2 == 0:
+            history.append(HumanMessage(content=f"帮我搜索第{i}个商品", id=f"h{i}"))
+        else:
+            history.append(AIMessage(content=f"<table><tr><td>商品{i}</td><td>99</td></tr></table>", id=f"a{i}"))
+    return history
+
+
+def bench_reducer(sizes, repeat):
+    """只测量 add_messages 合并一条新消息的耗时"""
+    print("== add_messages 合并耗时（每次新增1条消息） ==")
+    print(f"{'历史长度':>8} {'full(µs)':>10} {'delta(µs)':>10} {'倍数':>6}")
+    for size in sizes:
+        history = make_history(size)
+        new_msg = AIMessage(content="好的", id="new")
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            add_messages(history, history + [new_msg])
+        full_cost = (time.perf_counter() - start) / repeat * 1e6
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            add_messages(history, [new_msg])
+        delta_cost = (time.perf_counter() - start) / repeat * 1e6
+
+        print(f"{size:>8} {full_cost:>10.1f} {delta_cost:>10.1f} {full_cost / delta_cost:>6.1f}")
+
+
+def build_graph(mode):
+    """构造与 app.py 相同拓扑的图，节点按 mode 返回完整列表或增量"""
+
+    def wrap(state, new_messages, **fields):
+        messages = state["messages"] + new_messages if mode == "full" else new_messages
+        return {"messages": messages, **fields}
+
+    def human_node(state):
+        return wrap(state, [HumanMessage(content=state["query"][-1])])
+
+    def chatbot(state):
+        if state.get("finished"):
+            return state if mode == "full" else {"finished": True}
+        call = {"name": "JD_search_general", "args": {"search_keyword": state["query"][-1]}, "id": "call_1"}
+        return wrap(state, [AIMessage(content="", tool_calls=[call])], finished=False)
+
+    def tools(state):
+        return wrap(state, [ToolMessage(content="<table></table>", tool_call_id="call_1")], finished=True)
+
+    def route(state):
+        if state.get("finished"):
+            return END
+        return "tools"
+
+    builder = StateGraph(BenchState)
+    builder.add_node("human", human_node)
+    builder.add_node("chatbot", chatbot)
+    builder.add_node("tools", tools)
+    builder.add_edge(START, "human")
+    builder.add_edge("human", "chatbot")
+    builder.add_edge("tools", "chatbot")
+    builder.add_conditional_edges("chatbot", route, ["tools", END])
+    return builder.compile(checkpointer=MemorySaver())
+
+
+def bench_graph(sizes, turns):
+    """测量完整对话轮次（4个节点步）在不同历史长度下的耗时"""
+    print("\n== 图执行耗时（每轮 human → chatbot → tools → chatbot） ==")
+    print(f"{'历史长度':>8} {'full(ms/步)':>12} {'delta(ms/步)':>13}")
+    graphs = {mode: build_graph(mode) for mode in ("full", "delta")}
+    for size in sizes:
+        costs = {}
+        for mode, graph in graphs.items():
+            config = {"configurable": {"thread_id": f"{mode}-{size}"}}
+            graph.update_state(config, {"messages": make_history(size), "query": [], "finished": False})
+            start = time.perf_counter()
+            for turn in range(turns):
+                graph.invoke({"query": [f"关键词{turn}"], "finished": False}, config)
+            costs[mode] = (time.perf_counter() - start) / (turns * 4) * 1e3
+        print(f"{size:>8} {costs['full']:>12.3f} {costs['delta']:>13.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="节点状态更新开销基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100, 200, 400, 800])
+    parser.add_argument("--repeat", type=int, default=500, help="合并耗时测量的重复次数")
+    parser.add_argument("--turns", type=int, default=10, help="每个历史长度下执行的对话轮数")
+    args = parser.parse_args()
+
+    bench_reducer(args.sizes, args.repeat)
+    bench_graph(args.sizes, args.turns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+京东搜索页录制与回放。
+
+录制：用已登录的Cookie打开京东首页和搜索结果页，保存
+- recording.har   完整HAR（含响应内容），Playwright 按URL精确回放
+- home.html       首页渲染后的HTML
+- search.html     搜索结果页渲染后的HTML
+- manifest.json   关键词、搜索URL、录制时间、商品数
+
+回放：
+- Playwright 路由：install_playwright_replay(context, fixture_dir)，HAR 中有的请求按原样返回，
+  其余搜索页/首页请求用保存的HTML返回，其他请求一律中止，不会访问线上京东
+- 本地HTTP服务：ReplayServer(fixture_dir)，/Search 返回 search.html，/ 返回 home.html，
+  把 SEARCH_NAVIGATION_CONFIG["search_url"] 指向它即可测试HTTP快速路径和直达搜索
+
+用法:
+    python benchmarks/jd_replay.py record 手机 benchmarks/fixtures/phone
+    python benchmarks/jd_replay.py serve benchmarks/fixtures/phone --port 8765
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HAR_FILE = "recording.har"
+HOME_FILE = "home.html"
+SEARCH_FILE = "search.html"
+MANIFEST_FILE = "manifest.json"
+
+JD_HOME_HOST = "www.jd.com"
+JD_SEARCH_HOST = "search.jd.com"
+
+
+def load_manifest(fixture_dir) -> dict:
+    path = os.path.join(fixture_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_fixture_file(fixture_dir, name):
+    """读取录制的HTML文件，不存在时返回None"""
+    path = os.path.join(fixture_dir, name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def record_fixture(keyword, fixture_dir, cookies_file="jd_cookies.json", headless=True):
+    """录制首页、首页搜索和直达搜索结果页（需要有效的京东Cookie）"""
+    from playwright.async_api import async_playwright
+    import app
+
+    os.makedirs(fixture_dir, exist_ok=True)
+    search_url = app.build_search_url(
+        keyword, app.SEARCH_NAVIGATION_CONFIG["sort"], app.SEARCH_NAVIGATION_CONFIG["price_range"]
+    )
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(headless=headless)
+        context = await browser.new_context(
+            record_har_path=os.path.join(fixture_dir, HAR_FILE), record_har_content="embed"
+        )
+        if os.path.exists(cookies_file):
+            with open(cookies_file, "r", encoding="utf-8") as f:
+                await context.add_cookies(json.load(f))
+        page = await context.new_page()
+
+        print(f"🌐 录制京东首页和首页搜索: {keyword}")
+        await page.goto("https://www.jd.com", timeout=30000)
+        home_html = await page.content()
+        await app.execute_search_query(page, keyword)
+
+        print(f"🌐 录制搜索结果页: {search_url}")
+        await page.goto(search_url, wait_until="domcontentloaded", timeout=30000)
+        await page.wait_for_selector(".gl-item", timeout=30000)
+        search_html = await page.content()
+        raw_items = await page.eval_on_selector_all(".gl-item", app.EXTRACT_ITEMS_JS, app.MAX_SEARCH_ITEMS)
+
+        # 关闭上下文时才写出HAR文件
+        await context.close()
+        await browser.close()
+
+    for name, html in ((HOME_FILE, home_html), (SEARCH_FILE, search_html)):
+        with open(os.path.join(fixture_dir, name), "w", encoding="utf-8") as f:
+            f.write(html)
+    manifest = {
+        "keyword": keyword,
+        "search_url": search_url,
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "item_count": len(raw_items),
+    }
+    with open(os.path.join(fixture_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"✅ 已保存到 {fixture_dir}，搜索页共{len(raw_items)}个商品")
+    return manifest
+
+
+async def install_playwright_replay(context, fixture_dir, passthrough_hosts=()):
+    """
+    在浏览器上下文上安装回放路由。
+
+    先匹配HAR（URL和参数完全一致时返回录制的响应），未命中的首页/搜索页请求用保存的HTML返回，
+    passthrough_hosts 中的主机（如本地 ReplayServer）正常访问，其余请求中止。
+    页面上的拦截路由需要用 route.fallback() 才会继续交给这里处理。
+    """
+    home_html = read_fixture_file(fixture_dir, HOME_FILE)
+    search_html = read_fixture_file(fixture_dir, SEARCH_FILE)
+
+    async def handle(route):
+        parts = urlparse(route.request.url)
+        if parts.netloc in passthrough_hosts:
+            await route.continue_()
+        elif parts.netloc == JD_SEARCH_HOST and parts.path == "/Search" and search_html:
+            await route.fulfill(status=200, content_type="text/html; charset=utf-8", body=search_html)
+        elif parts.netloc == JD_HOME_HOST and parts.path in ("", "/") and home_html:
+            await route.fulfill(status=200, content_type="text/html; charset=utf-8", body=home_html)
+        else:
+            await route.abort()
+
+    # 后注册的路由先执行：HAR 未命中时落到保存的HTML
+    await context.route("**/*", handle)
+    har_path = os.path.join(fixture_dir, HAR_FILE)
+    if os.path.exists(har_path):
+        await context.route_from_har(har_path, not_found="fallback")
+
+
+class ReplayServer:
+    """
+    在本地端口上返回录制的页面：/Search 为搜索结果页，/ 为首页，其余路径404。
+
+    用法:
+        with ReplayServer("benchmarks/fixtures/phone") as server:
+            app.SEARCH_NAVIGATION_CONFIG["search_url"] = server.search_url
+    """
+
+    def __init__(self, fixture_dir, host="127.0.0.1", port=0):
+        pages = {
+            "/Search": read_fixture_file(fixture_dir, SEARCH_FILE),
+            "/": read_fixture_file(fixture_dir, HOME_FILE),
+        }
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                body = pages.get(urlparse(self.path).path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def search_url(self) -> str:
+        return f"{self.base_url}/Search"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="jd-replay", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="录制/回放京东搜索页")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record = subparsers.add_parser("record", help="录制搜索页")
+    record.add_argument("keyword")
+    record.add_argument("fixture_dir")
+    record.add_argument("--cookies", default="jd_cookies.json")
+    record.add_argument("--headed", action="store_true", help="显示浏览器窗口")
+
+    serve = subparsers.add_parser("serve", help="用本地HTTP服务回放录制的页面")
+    serve.add_argument("fixture_dir")
+    serve.add_argument("--port", type=int, default=8765)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        asyncio.run(record_fixture(args.keyword, args.fixture_dir, args.cookies, headless=not args.headed))
+    else:
+        server = ReplayServer(args.fixture_dir, port=args.port).start()
+        print(f"🔁 回放服务已启动: {server.search_url}（Ctrl+C 退出）")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import asyncio, json, os, signal
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright
+from structured_log import get_logger
+
+log = get_logger("browser_pool")
+
+
+class _PooledContext:
+    """池中的单个浏览器上下文及其使用计数"""
+    def __init__(self, browser, context):
+        self.browser = browser
+        self.context = context
+        self.uses = 0
+        self.broken = False
+
+
+class BrowserPool:
+    """
+    常驻的 Chromium 浏览器池。
+
+    启动时预先拉起若干浏览器，每个浏览器预热若干已加载京东Cookie的 BrowserContext，
+    调用方通过 lease() 租用上下文，用完后归还；上下文达到最大使用次数或崩溃时自动重建。
+
+    context_setup 为可选的 async 回调，每个新建的上下文加载Cookie后都会调用一次
+    （例如基准测试中安装录制页面的回放路由）。
+    proxy 为浏览器使用的代理地址，None 时强制直连，不读取环境变量中的代理。
+    """
+
+    def __init__(self, cookies_file="jd_cookies.json", browsers=1, contexts_per_browser=2,
+                 max_uses=20, headless=True, context_setup=None, proxy=None):
+        self.cookies_file = cookies_file
+        self.browsers = max(1, browsers)
+        self.contexts_per_browser = max(1, contexts_per_browser)
+        self.max_uses = max(1, max_uses)
+        self.headless = headless
+        self.context_setup = context_setup
+        self.proxy = proxy
+
+        self._playwright = None
+        self._browser_list = []
+        self._idle = None
+        self._all = []
+        self._loop = None
+        self._start_lock = None
+        self._closed = False
+
+    @property
+    def started(self) -> bool:
+        return self._playwright is not None
+
+    async def start(self):
+        """启动 Playwright 并预热所有浏览器上下文"""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self.started:
+                return
+            log.info("🌐 启动浏览器池", extra={"browsers": self.browsers, "contexts_per_browser": self.contexts_per_browser})
+            self._loop = asyncio.get_running_loop()
+            self._playwright = await async_playwright().start()
+            self._idle = asyncio.Queue()
+            self._closed = False
+
+            for _ in range(self.browsers):
+                browser = await self._launch_browser()
+                self._browser_list.append(browser)
+                for _ in range(self.contexts_per_browser):
+                    entry = _PooledContext(browser, await self._new_context(browser))
+                    self._all.append(entry)
+                    self._idle.put_nowait(entry)
+            log.info("✅ 浏览器池已就绪，共%d个预热上下文", len(self._all))
+
+    async def _launch_browser(self):
+        if self.proxy:
+            return await self._playwright.chromium.launch(headless=self.headless, proxy={"server": self.proxy})
+        return await self._playwright.chromium.launch(headless=self.headless, args=["--no-proxy-server"])
+
+    async def _new_context(self, browser):
+        """新建上下文并加载Cookie"""
+        context = await browser.new_context()
+        cookies = self._read_cookies()
+        if cookies:
+            await context.add_cookies(cookies)
+        if self.context_setup is not None:
+            await self.context_setup(context)
+        return context
+
+    def _read_cookies(self):
+        try:
+            if not os.path.exists(self.cookies_file):
+                return []
+            with open(self.cookies_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            log.warning("⚠️ 读取Cookie文件时出错: %s", e)
+            return []
+
+    @asynccontextmanager
+    async def lease(self):
+        """
+        租用一个预热的 BrowserContext。
+
+        用法:
+            async with pool.lease() as context:
+                page = await context.new_page()
+        """
+        if self._loop is not None and self._loop is not asyncio.get_running_loop():
+            # 事件循环已变化，旧的 Playwright 对象不可再用
+            log.warning("⚠️ 事件循环已变化，重建浏览器池")
+            self._abandon_loop()
+        if not self.started:
+            await self.start()
+
+        entry = await self._idle.get()
+        try:
+            if not entry.browser.is_connected():
+                entry.broken = True
+            if entry.broken:
+                await self._recycle(entry)
+            entry.uses += 1
+            yield entry.context
+        except Exception:
+            # 浏览器断开视为崩溃，其余异常属于页面逻辑，上下文仍可复用
+            if not entry.browser.is_connected():
+                entry.broken = True
+            raise
+        finally:
+            await self._release(entry)
+
+    async def _release(self, entry):
+        """归还上下文，必要时重建"""
+        if self._closed:
+            await self._safe_close(entry.context)
+            return
+        try:
+            if entry.broken or entry.uses >= self.max_uses:
+                await self._recycle(entry)
+            else:
+                # 关闭残留页面，保持上下文干净
+                for page in list(entry.context.pages):
+                    await page.close()
+        except Exception as e:
+            log.warning("⚠️ 回收浏览器上下文失败: %s", e)
+            entry.broken = True
+        self._idle.put_nowait(entry)
+
+    async def _recycle(self, entry):
+        """重建上下文，浏览器崩溃时一并重启浏览器"""
+        log.info("♻️ 回收浏览器上下文", extra={"uses": entry.uses, "broken": entry.broken})
+        await self._safe_close(entry.context)
+
+        if not entry.browser.is_connected():
+            old_browser = entry.browser
+            new_browser = await self._launch_browser()
+            self._browser_list = [new_browser if b is old_browser else b for b in self._browser_list]
+            for other in self._all:
+                if other.browser is old_browser:
+                    other.browser = new_browser
+                    other.broken = True
+            entry.browser = new_browser
+
+        entry.context = await self._new_context(entry.browser)
+        entry.uses = 0
+        entry.broken = False
+
+    @staticmethod
+    async def _safe_close(target):
+        try:
+            await target.close()
+        except Exception:
+            pass
+
+    def _detach_state(self):
+        """取出当前的 Playwright、浏览器和上下文，并重置池状态"""
+        state = (self._playwright, self._browser_list, self._all)
+        self._playwright = None
+        self._browser_list = []
+        self._all = []
+        self._idle = None
+        self._loop = None
+        self._start_lock = None
+        return state
+
+    async def _close_state(self, playwright, browsers, entries):
+        for entry in entries:
+            await self._safe_close(entry.context)
+        for browser in browsers:
+            await self._safe_close(browser)
+        try:
+            if playwright is not None:
+                await playwright.stop()
+        except Exception as e:
+            log.warning("⚠️ 停止Playwright失败: %s", e)
+
+    def _abandon_loop(self):
+        """
+        丢弃绑定在旧事件循环上的浏览器池。
+
+        旧循环仍在运行时把关闭任务调度到旧循环上执行；
+        旧循环已停止时无法再驱动 Playwright，直接结束驱动进程，由它关闭启动的浏览器。
+        """
+        old_loop = self._loop
+        state = self._detach_state()
+        if old_loop is not None and old_loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._close_state(*state), old_loop)
+        else:
+            self._terminate_driver(state[0])
+
+    @staticmethod
+    def _terminate_driver(playwright):
+        """向 Playwright 驱动进程发送 SIGTERM，驱动退出前会关闭它启动的所有浏览器"""
+        connection = getattr(getattr(playwright, "_impl_obj", None), "_connection", None)
+        proc = getattr(getattr(connection, "_transport", None), "_proc", None)
+        if proc is None:
+            if playwright is not None:
+                log.warning("⚠️ 未找到旧的Playwright驱动进程，浏览器可能未关闭")
+            return
+        try:
+            os.kill(proc.pid, signal.SIGTERM)
+            log.info("🛑 已结束旧事件循环上的Playwright驱动进程", extra={"pid": proc.pid})
+        except OSError as e:
+            log.warning("⚠️ 结束Playwright驱动进程失败: %s", e)
+
+    async def close(self):
+        """关闭所有上下文、浏览器和 Playwright"""
+        if not self.started:
+            return
+        self._closed = True
+        log.info("🛑 正在关闭浏览器池...")
+        await self._close_state(*self._detach_state())
+        log.info("✅ 浏览器池已关闭")
+
+    def close_sync(self, timeout=30):
+        """在任意线程中同步关闭浏览器池（用于应用退出时）"""
+        loop = self._loop
+        if not self.started or loop is None or loop.is_closed():
+            return
+        try:
+            try:
+                current = asyncio.get_running_loop()
+            except RuntimeError:
+                current = None
+            if current is loop:
+                # 已在池所在的事件循环中，只能调度关闭任务
+                loop.create_task(self.close())
+            elif loop.is_running():
+                asyncio.run_coroutine_threadsafe(self.close(), loop).result(timeout)
+            else:
+                loop.run_until_complete(self.close())
+        except Exception as e:
+            log.warning("⚠️ 关闭浏览器池失败: %s", e)
@@ -0,0 +1,100 @@
+import asyncio
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from structured_log import get_logger
+
+log = get_logger("checkpointing")
+
+
+class LazyAsyncSqliteSaver(BaseCheckpointSaver):
+    """
+    延迟创建的 SQLite 检查点存储。
+
+    AsyncSqliteSaver 必须在运行中的事件循环里构造，而图在模块导入时就已编译，
+    因此这里先占位，第一次被图调用时再在服务器事件循环上打开数据库连接。
+    """
+
+    def __init__(self, sqlite_path):
+        super().__init__()
+        self.sqlite_path = sqlite_path
+        self._saver = None
+        self._lock = None
+        self._loop = None
+
+    async def _get_saver(self):
+        if self._saver is not None:
+            return self._saver
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._saver is None:
+                import aiosqlite
+                from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+                conn = await aiosqlite.connect(self.sqlite_path)
+                saver = AsyncSqliteSaver(conn)
+                await saver.setup()
+                self._saver = saver
+                self._loop = asyncio.get_running_loop()
+                log.info("💾 已打开SQLite检查点存储: %s", self.sqlite_path)
+        return self._saver
+
+    async def aget_tuple(self, config):
+        return await (await self._get_saver()).aget_tuple(config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        saver = await self._get_saver()
+        async for item in saver.alist(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await (await self._get_saver()).aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await (await self._get_saver()).aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await (await self._get_saver()).adelete_thread(thread_id)
+
+    def get_next_version(self, current, channel):
+        if self._saver is not None:
+            return self._saver.get_next_version(current, channel)
+        return super().get_next_version(current, channel)
+
+    async def aclose(self):
+        """关闭数据库连接（aiosqlite 的工作线程不关闭会阻止进程退出）"""
+        if self._saver is not None:
+            await self._saver.conn.close()
+            self._saver = None
+
+    def close_sync(self, timeout=10):
+        """在任意线程中同步关闭（用于应用退出时）"""
+        loop = self._loop
+        if self._saver is None:
+            return
+        try:
+            if loop is not None and loop.is_running():
+                asyncio.run_coroutine_threadsafe(self.aclose(), loop).result(timeout)
+            else:
+                # 原事件循环已停止，aiosqlite 可在新的事件循环中完成关闭
+                asyncio.run(self.aclose())
+        except Exception as e:
+            log.warning("⚠️ 关闭SQLite检查点存储失败: %s", e)
+
+
+def create_checkpointer(backend="memory", sqlite_path="jd_checkpoints.db"):
+    """
+    创建会话检查点存储。
+
+    Args:
+        backend (str): "memory" 使用进程内存；"sqlite" 持久化到本地SQLite文件（需安装 langgraph-checkpoint-sqlite）。
+        sqlite_path (str): SQLite 文件路径。
+    """
+    if backend == "sqlite":
+        try:
+            import aiosqlite
+            import langgraph.checkpoint.sqlite.aio
+            return LazyAsyncSqliteSaver(sqlite_path)
+        except ImportError:
+            log.warning("⚠️ 未安装SQLite检查点依赖，改用内存检查点。请运行: pip install langgraph-checkpoint-sqlite")
+
+    from langgraph.checkpoint.memory import MemorySaver
+    return MemorySaver()
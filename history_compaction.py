@@ -0,0 +1,103 @@
+import re
+
+
+def get_message_role(message) -> str:
+    """统一获取字典消息和消息对象的角色"""
+    if isinstance(message, dict):
+        return message.get("role", "unknown")
+    if isinstance(message, tuple) and len(message) == 2:
+        return str(message[0])
+    return {"human": "user", "ai": "assistant"}.get(getattr(message, "type", ""), getattr(message, "type", "unknown"))
+
+
+def get_message_content(message) -> str:
+    """统一获取消息文本内容"""
+    if isinstance(message, dict):
+        return str(message.get("content", ""))
+    if isinstance(message, tuple) and len(message) == 2:
+        return str(message[1])
+    return str(getattr(message, "content", ""))
+
+
+_CJK_PATTERN = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中日韩字符按1个token计，其余字符按4个字符1个token计"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_message_tokens(messages) -> int:
+    """估算消息列表的总token数（每条消息额外计4个token的格式开销）"""
+    return sum(estimate_tokens(get_message_content(msg)) + 4 for msg in messages)
+
+
+def select_recent_messages(messages, count, token_budget=None):
+    """取最近最多count条消息（可选token预算），并保证窗口从用户消息开始"""
+    window = list(messages[-count:]) if count > 0 else []
+    if token_budget is not None:
+        kept, used = [], 0
+        for msg in reversed(window):
+            used += estimate_tokens(get_message_content(msg)) + 4
+            if kept and used > token_budget:
+                break
+            kept.append(msg)
+        window = kept[::-1]
+    start = next((i for i, msg in enumerate(window) if get_message_role(msg) == "user"), 0)
+    return window[start:]
+
+
+# format_search_response 生成的HTML表格行：标题、价格、图片、购买链接
+_TABLE_ROW_PATTERN = re.compile(
+    r"<tr><td>(.*?)</td><td>(.*?)</td><td>.*?</td><td>(?:<a href='(.*?)'[^>]*>.*?</a>|[^<]*)</td></tr>",
+    re.S
+)
+
+
+def is_search_table_message(message) -> bool:
+    """判断是否为搜索工具返回的商品表格消息"""
+    content = get_message_content(message)
+    return get_message_role(message) == "assistant" and "<table" in content and "购买链接" in content
+
+
+def summarize_search_table(content: str) -> str:
+    """将商品表格压缩为 标题/价格/链接 的结构化摘要，无法解析时返回空字符串"""
+    rows = _TABLE_ROW_PATTERN.findall(content)
+    if not rows:
+        return ""
+    lines = [f"[已压缩的搜索结果，共{len(rows)}个商品]"]
+    for index, (title, price, link) in enumerate(rows, 1):
+        lines.append(f"{index}. {title.strip()} | ¥{price.strip()} | {link.strip() or '无链接'}")
+    return "\n".join(lines)
+
+
+def compact_history(messages, welcome_msg=""):
+    """
+    压缩会话历史（不调用LLM的部分）。
+
+    - 较早的搜索结果表格替换为结构化摘要（最新的一个保留原样）
+    - 重复的欢迎语只保留第一条
+
+    Returns:
+        tuple: (需要替换内容的消息列表, 需要删除的消息列表)
+    """
+    replaced, removed = [], []
+
+    table_indexes = [i for i, msg in enumerate(messages) if is_search_table_message(msg)]
+    for index in table_indexes[:-1]:
+        msg = messages[index]
+        compact = summarize_search_table(get_message_content(msg))
+        if compact and hasattr(msg, "model_copy"):
+            replaced.append(msg.model_copy(update={"content": compact}))
+
+    welcome_seen = False
+    for msg in messages:
+        if welcome_msg and get_message_role(msg) == "assistant" and get_message_content(msg).strip() == welcome_msg:
+            if welcome_seen:
+                removed.append(msg)
+            welcome_seen = True
+
+    return replaced, removed
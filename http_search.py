@@ -0,0 +1,160 @@
+import asyncio, json, os
+import httpx
+from urllib.parse import urlparse
+from structured_log import get_logger
+
+log = get_logger("http_search")
+
+DEFAULT_HEADERS = {
+    "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                   "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+    "Referer": "https://www.jd.com/",
+}
+
+
+def parse_search_items(html, max_items):
+    """
+    从搜索结果页HTML中解析 .gl-item 商品卡片。
+
+    返回字段与页面内提取脚本 EXTRACT_ITEMS_JS 相同（sku/title/purchase_link/price/image_url），
+    可直接交给 process_product_item 规范化。
+    """
+    from selectolax.lexbor import LexborHTMLParser
+
+    items = []
+    for card in LexborHTMLParser(html).css(".gl-item")[:max_items]:
+        title_el = card.css_first(".p-name a")
+        price_el = card.css_first(".p-price strong i")
+        image_el = card.css_first(".p-img img")
+        items.append({
+            "sku": card.attributes.get("data-sku"),
+            "title": title_el.text(separator="", strip=True) if title_el else None,
+            "purchase_link": title_el.attributes.get("href") if title_el else None,
+            "price": price_el.text(strip=True) if price_el else None,
+            "image_url": (image_el.attributes.get("src") or image_el.attributes.get("data-lazy-img")) if image_el else None,
+        })
+    return items
+
+
+class HttpSearchEngine:
+    """
+    不启动浏览器的京东搜索：用带连接池的HTTP客户端（携带 jd_cookies.json 中的Cookie）
+    获取搜索结果页HTML并直接解析。
+
+    遇到登录/风控页、非200响应或页面中没有商品时返回失败原因，由调用方退回 Playwright 抓取。
+    proxy 为None时直连，不读取环境变量中的代理。
+    """
+
+    def __init__(self, cookies_file="jd_cookies.json", timeout=15.0, max_connections=10, headers=None, proxy=None):
+        # 未安装解析库时直接报错，由调用方决定是否禁用该路径
+        import selectolax.lexbor
+        self.cookies_file = cookies_file
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.headers = {**DEFAULT_HEADERS, **(headers or {})}
+        self.proxy = proxy
+        self._http = None
+        self._loop = None
+        self._closing = set()
+
+    def _load_cookies(self) -> httpx.Cookies:
+        """读取 Playwright 格式的Cookie文件"""
+        cookies = httpx.Cookies()
+        try:
+            if os.path.exists(self.cookies_file):
+                with open(self.cookies_file, "r", encoding="utf-8") as f:
+                    for cookie in json.load(f):
+                        cookies.set(cookie["name"], cookie["value"],
+                                    domain=cookie.get("domain", ""), path=cookie.get("path", "/"))
+        except Exception as e:
+            log.warning("⚠️ 读取Cookie文件时出错: %s", e)
+        return cookies
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """共享的带连接池HTTP客户端（事件循环变化时关闭旧客户端并重建）"""
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop:
+            if self._http is not None:
+                self._retire_client(self._http, self._loop)
+            self._http = httpx.AsyncClient(
+                timeout=self.timeout,
+                headers=self.headers,
+                cookies=self._load_cookies(),
+                follow_redirects=True,
+                proxy=self.proxy,
+                trust_env=False,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections)
+            )
+            self._loop = loop
+        return self._http
+
+    async def search(self, url, max_items):
+        """
+        获取并解析搜索结果页。
+
+        Returns:
+            tuple: (原始商品列表, None)；失败时为 (None, 失败原因)，
+                   原因为 challenged / http_<状态码> / no_items / error
+        """
+        try:
+            response = await self.http.get(url)
+        except httpx.HTTPError as e:
+            log.warning("⚠️ HTTP搜索请求失败: %s", e)
+            return None, "error"
+
+        if urlparse(str(response.url)).netloc != urlparse(url).netloc:
+            log.info("🔒 HTTP搜索被重定向到 %s", response.url)
+            return None, "challenged"
+        if response.status_code != 200:
+            return None, f"http_{response.status_code}"
+
+        items = parse_search_items(response.text, max_items)
+        if not items:
+            return None, "no_items"
+        return items, None
+
+    def _retire_client(self, client, old_loop):
+        """关闭旧事件循环上的客户端：旧循环仍在运行时在旧循环上关闭，否则在当前循环上尽力关闭"""
+        if old_loop is not None and old_loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._close_client(client), old_loop)
+            return
+        task = asyncio.get_running_loop().create_task(self._close_client(client))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close_client(client):
+        try:
+            await client.aclose()
+        except Exception as e:
+            # 旧循环已关闭时连接无法正常关闭，套接字由垃圾回收释放
+            log.debug("关闭旧HTTP客户端失败: %s", e)
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+            self._loop = None
+
+    def close_sync(self, timeout=10):
+        """在任意线程中同步关闭HTTP客户端（用于应用退出时）"""
+        loop = self._loop
+        if self._http is None or loop is None or loop.is_closed():
+            return
+        try:
+            try:
+                current = asyncio.get_running_loop()
+            except RuntimeError:
+                current = None
+            if current is loop:
+                loop.create_task(self.aclose())
+            elif loop.is_running():
+                asyncio.run_coroutine_threadsafe(self.aclose(), loop).result(timeout)
+            else:
+                loop.run_until_complete(self.aclose())
+        except Exception as e:
+            log.warning("⚠️ 关闭HTTP搜索客户端失败: %s", e)
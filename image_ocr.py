@@ -0,0 +1,160 @@
+import asyncio
+import httpx
+from openai import AsyncOpenAI
+from structured_log import get_logger
+from tracing import span
+from metrics import LLM_TOKENS
+
+log = get_logger("image_ocr")
+
+OCR_PROMPT = "仅提取图片中的文字内容，不要添加任何其他信息。"
+
+
+class ImageOCRClient:
+    """
+    基于 OpenAI 兼容接口（默认 OpenRouter）的图片文字提取客户端。
+
+    进程内共享一个带连接池的 AsyncOpenAI 客户端，批量提取时用信号量限制并发数。
+    base_url 可指向本地的 OpenAI 兼容模拟服务，便于离线测试。
+    传入 cache（OCRCache）后先查缓存；hash_content=True 时还会下载图片按内容哈希查缓存。
+    proxy 为None时直连，不读取环境变量中的代理。
+    """
+
+    def __init__(self, api_key, base_url="https://openrouter.ai/api/v1",
+                 model="qwen/qwen2.5-vl-32b-instruct:free", max_concurrency=4,
+                 timeout=60.0, max_connections=20, cache=None, hash_content=False, proxy=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.cache = cache
+        self.hash_content = hash_content
+        self.proxy = proxy
+        self._http = None
+        self._client = None
+        self._loop = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """共享的带连接池HTTP客户端"""
+        if self._http is None:
+            self._loop = asyncio.get_running_loop()
+            self._http = httpx.AsyncClient(
+                timeout=self.timeout,
+                proxy=self.proxy,
+                trust_env=False,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._http
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """懒加载共享客户端"""
+        if self._client is None:
+            self._client = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key, http_client=self.http)
+        return self._client
+
+    async def _content_hash(self, image_url: str) -> str:
+        """下载图片并计算内容哈希，失败时返回空字符串"""
+        from ocr_cache import hash_bytes
+        try:
+            response = await self.http.get(image_url)
+            response.raise_for_status()
+            return hash_bytes(response.content)
+        except Exception as e:
+            log.warning("⚠️ 下载图片计算哈希失败 %s: %s", image_url[:60], e)
+            return ""
+
+    async def extract_text(self, image_url: str) -> str:
+        """提取单张图片中的文字（优先读取缓存，磁盘缓存在线程中读写）"""
+        if self.cache is None:
+            return await self._extract_text_uncached(image_url)
+
+        cached = await asyncio.to_thread(self.cache.get_by_url, image_url)
+        if cached is not None:
+            self.cache.record(hit=True)
+            return cached
+
+        content_hash = await self._content_hash(image_url) if self.hash_content else ""
+        cached = await asyncio.to_thread(self.cache.get_by_content, content_hash) if content_hash else None
+        self.cache.record(hit=cached is not None)
+        if cached is not None:
+            # 记住新URL，下次无需再下载图片
+            await asyncio.to_thread(self.cache.put, image_url, cached)
+            return cached
+
+        text = await self._extract_text_uncached(image_url)
+        await asyncio.to_thread(self.cache.put, image_url, text, content_hash)
+        return text
+
+    async def _extract_text_uncached(self, image_url: str) -> str:
+        """调用模型提取单张图片中的文字"""
+        messages = [{"role": "user", "content":
+                    [{"type": "text", "text": OCR_PROMPT},
+                     {"type": "image_url", "image_url": {"url": image_url}}]}]
+        with span("llm.ocr", model=self.model, image_url=image_url[:200]) as ocr_span:
+            completion = await self.client.chat.completions.create(model=self.model, messages=messages)
+            usage = getattr(completion, "usage", None)
+            if usage:
+                ocr_span.set_attributes(input_tokens=usage.prompt_tokens, output_tokens=usage.completion_tokens)
+                LLM_TOKENS.inc(usage.prompt_tokens or 0, kind="input")
+                LLM_TOKENS.inc(usage.completion_tokens or 0, kind="output")
+        return (completion.choices[0].message.content or "").strip()
+
+    async def extract_texts(self, image_urls) -> dict:
+        """
+        并发提取多张图片的文字。
+
+        Returns:
+            dict: {图片URL: 提取的文字}，单张失败时值为以"错误:"开头的说明，不影响其他图片。
+        """
+        unique_urls = list(dict.fromkeys(url for url in image_urls if url and url != "#"))
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def _one(url):
+            async with semaphore:
+                try:
+                    return url, await self.extract_text(url)
+                except Exception as e:
+                    log.warning("⚠️ 图片文字提取失败 %s: %s", url[:60], e)
+                    return url, f"错误: {str(e)[:100]}"
+
+        with span("ocr.batch", images=len(unique_urls)) as batch_span:
+            hits_before = self.cache.hits if self.cache is not None else 0
+            results = await asyncio.gather(*[_one(url) for url in unique_urls])
+            if self.cache is not None:
+                batch_span.set_attribute("cache_hits", self.cache.hits - hits_before)
+        return dict(results)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+            self._loop = None
+
+    def close_sync(self, timeout=10):
+        """在任意线程中同步关闭客户端（用于应用退出时）"""
+        loop = self._loop
+        if self._http is None or loop is None or loop.is_closed():
+            return
+        try:
+            try:
+                current = asyncio.get_running_loop()
+            except RuntimeError:
+                current = None
+            if current is loop:
+                loop.create_task(self.aclose())
+            elif loop.is_running():
+                asyncio.run_coroutine_threadsafe(self.aclose(), loop).result(timeout)
+            else:
+                loop.run_until_complete(self.aclose())
+        except Exception as e:
+            log.warning("⚠️ 关闭图片文字提取客户端失败: %s", e)
@@ -0,0 +1,216 @@
+import bisect, threading, time
+from contextlib import contextmanager
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标{self.name}需要标签{self.labelnames}，实际为{tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """可增可减的当前值；也可以设置回调函数在采集时读取"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """采集时调用 function() 作为当前值（仅用于无标签的指标）"""
+        self._function = function
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        if self._function is not None:
+            try:
+                return [f"{self.name} {_format_value(self._function())}"]
+            except Exception:
+                return []
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, float("inf"))
+
+
+class Histogram(_Metric):
+    """按区间统计观测值分布（如延迟），输出 _bucket/_sum/_count"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        buckets = sorted(buckets)
+        if buckets[-1] != float("inf"):
+            buckets.append(float("inf"))
+        self.buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """记录 with 块的执行时间（秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+        return sum(counts)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"指标{metric.name}已注册")
+        self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Prometheus 文本格式（version 0.0.4）"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ================== 智能体运行指标 ==================
+TURN_LATENCY = Histogram("jd_turn_duration_seconds", "一轮对话的总耗时", ["status"])
+TURNS_IN_PROGRESS = Gauge("jd_turns_in_progress", "正在处理中的对话轮数")
+FIRST_CHUNK_LATENCY = Histogram(
+    "jd_time_to_first_chunk_seconds", "从收到用户消息到界面显示第一个回复片段的耗时",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60)
+)
+TOOL_LATENCY = Histogram("jd_tool_duration_seconds", "工具调用耗时", ["tool"])
+TOOL_CALLS = Counter("jd_tool_calls_total", "工具调用次数", ["tool"])
+TOOL_ERRORS = Counter("jd_tool_errors_total", "工具调用失败次数（含超时）", ["tool", "reason"])
+LLM_TOKENS = Counter("jd_llm_tokens_total", "LLM token 用量", ["kind"])
+SCRAPE_ITEMS = Histogram(
+    "jd_scrape_items", "单次京东搜索抓取到的商品数",
+    buckets=(0, 1, 5, 10, 20, 30, 50, 100)
+)
+SEARCH_NAVIGATION = Counter("jd_search_navigation_total", "搜索页导航结果（http快速路径/direct直达/homepage首页搜索）", ["mode", "result"])
+SCRAPE_REQUESTS = Counter("jd_scrape_requests_total", "抓取页面发出的请求（按是否拦截和资源类型）", ["action", "resource_type"])
+SCRAPE_BLOCKED_BYTES = Counter(
+    "jd_scrape_blocked_bytes_estimated_total", "被拦截请求的估算字节数（按典型资源大小估算）", ["reason"]
+)
+SEARCH_CACHE_HITS = Counter("jd_search_cache_hits_total", "搜索/详情补充缓存命中次数", ["cache"])
+SEARCH_CACHE_MISSES = Counter("jd_search_cache_misses_total", "搜索/详情补充缓存未命中次数", ["cache"])
+SEARCH_CACHE_EVICTIONS = Counter("jd_search_cache_evictions_total", "搜索/详情补充缓存因容量上限淘汰的条目数", ["cache"])
+ENRICH_PAGES = Counter("jd_enrich_pages_total", "商品详情页补充结果（ok/cached/timeout/failed/skipped）", ["result"])
+ACTIVE_SESSIONS = Gauge("jd_active_sessions", "当前保留处理器上下文的Gradio会话数")
+QUEUE_DEPTH = Gauge("jd_gradio_queue_depth", "Gradio队列中等待处理的事件数")
+QUEUE_ACTIVE_WORKERS = Gauge("jd_gradio_queue_active_workers", "Gradio队列中正在执行的任务数")
+
+
+def mount_metrics(app, path="/metrics"):
+    """在FastAPI应用（如Gradio的 interface.app）上挂载指标接口，优先于Gradio自身的路由匹配"""
+    from fastapi.responses import Response
+    from fastapi.routing import APIRoute
+
+    def metrics_endpoint():
+        return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+    app.router.routes.insert(0, APIRoute(path, metrics_endpoint, methods=["GET"], include_in_schema=False))
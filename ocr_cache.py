@@ -0,0 +1,173 @@
+import hashlib, json, os, threading, time
+from collections import OrderedDict
+from structured_log import get_logger
+
+log = get_logger("ocr_cache")
+
+
+def hash_bytes(data: bytes) -> str:
+    """图片内容的SHA-256摘要"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class OCRCache:
+    """
+    图片文字提取结果缓存。
+
+    以图片URL为键，也可以以图片内容哈希为键（同一促销图被不同URL引用时也能命中）。
+    两级存储：内存LRU + 可选的磁盘目录（每条记录一个JSON文件，重启后仍可命中）。
+    记录超过 ttl 秒后失效；磁盘目录每写入 prune_every 条清理一次过期记录，
+    并按修改时间删除超出 max_disk_entries 的最旧记录。
+
+    get_by_url/get_by_content 可能读取磁盘，应在线程中调用；peek_by_url 只查内存，可在事件循环中调用。
+    命中率统计由调用方按每次提取调用 record() 计数一次。
+    """
+
+    def __init__(self, max_entries=1024, cache_dir=None, ttl=7 * 24 * 3600, max_disk_entries=5000, prune_every=200):
+        self.max_entries = max(1, max_entries)
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.prune_every = max(1, prune_every)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def url_key(image_url: str) -> str:
+        return f"url:{image_url}"
+
+    @staticmethod
+    def content_key(content_hash: str) -> str:
+        return f"sha256:{content_hash}"
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _expired(self, created) -> bool:
+        return bool(self.ttl) and time.time() - created > self.ttl
+
+    def _get_memory(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[1]):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _get(self, key):
+        text = self._get_memory(key)
+        if text is not None or not self.cache_dir:
+            return text
+
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+            text, created = record["text"], record.get("created", 0)
+        except (OSError, ValueError, KeyError):
+            return None
+        if self._expired(created):
+            self._remove(path)
+            return None
+        with self._lock:
+            self._remember(key, text, created)
+        return text
+
+    def peek_by_url(self, image_url: str):
+        """只查内存中的URL记录（不读磁盘、不计入统计），未命中返回None"""
+        return self._get_memory(self.url_key(image_url)) if image_url else None
+
+    def get_by_url(self, image_url: str):
+        """按图片URL查询，未命中返回None"""
+        return self._get(self.url_key(image_url)) if image_url else None
+
+    def get_by_content(self, content_hash: str):
+        """按图片内容哈希查询，未命中返回None"""
+        return self._get(self.content_key(content_hash)) if content_hash else None
+
+    def record(self, hit: bool):
+        """记录一次提取调用是否命中缓存"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, image_url: str, text: str, content_hash: str = None):
+        """写入缓存（URL和内容哈希两个键指向同一结果）"""
+        keys = [self.url_key(image_url)] if image_url else []
+        if content_hash:
+            keys.append(self.content_key(content_hash))
+        created = time.time()
+        for key in keys:
+            with self._lock:
+                self._remember(key, text, created)
+            if self.cache_dir:
+                try:
+                    with open(self._disk_path(key), "w", encoding="utf-8") as f:
+                        json.dump({"key": key, "text": text, "created": created}, f, ensure_ascii=False)
+                except OSError as e:
+                    log.warning("⚠️ 写入OCR磁盘缓存失败: %s", e)
+                    continue
+                with self._lock:
+                    self._writes += 1
+                    prune = (self._writes - 1) % self.prune_every == 0
+                if prune:
+                    self.prune()
+
+    def prune(self):
+        """清理磁盘目录：删除过期记录，再按修改时间删除超出 max_disk_entries 的最旧记录"""
+        if not self.cache_dir:
+            return 0
+        files = []
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".json"):
+                        files.append((entry.stat().st_mtime, entry.path))
+        except OSError as e:
+            log.warning("⚠️ 清理OCR磁盘缓存失败: %s", e)
+            return 0
+
+        files.sort()
+        cutoff = time.time() - self.ttl if self.ttl else 0
+        expired = [path for mtime, path in files if mtime < cutoff]
+        remaining = [path for mtime, path in files if mtime >= cutoff]
+        overflow = remaining[:max(0, len(remaining) - self.max_disk_entries)] if self.max_disk_entries else []
+        for path in expired + overflow:
+            self._remove(path)
+        removed = len(expired) + len(overflow)
+        if removed:
+            log.info("🧹 已清理%d条OCR磁盘缓存", removed, extra={"expired": len(expired), "overflow": len(overflow)})
+        return removed
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _remember(self, key, text, created):
+        self._entries[key] = (text, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries)
+        }
@@ -0,0 +1,93 @@
+import re, time
+
+# 在商品详情页内一次性提取规格参数、价格区域文字和评价数
+DETAIL_EXTRACT_JS = """
+() => {
+    const text = el => el ? el.innerText.trim() : null;
+    const specs = [];
+    // 规格与包装表格：<dt>参数名</dt><dd class="Ptable-tips">提示</dd><dd>参数值</dd>
+    document.querySelectorAll('.Ptable-item dt').forEach(dt => {
+        let dd = dt.nextElementSibling;
+        while (dd && dd.classList.contains('Ptable-tips')) dd = dd.nextElementSibling;
+        dd && specs.push([dt.innerText.trim(), dd.innerText.trim()]);
+    });
+    // 商品介绍中的参数列表："参数名：参数值"
+    document.querySelectorAll('.parameter2 li, .p-parameter-list li').forEach(li => {
+        const parts = li.innerText.split('：');
+        parts.length > 1 && specs.push([parts[0].trim(), parts.slice(1).join('：').trim()]);
+    });
+    const summary = document.querySelector('.itemInfo-wrap, .product-intro, #summary');
+    return {
+        specs: specs,
+        price: text(document.querySelector('.p-price .price, .summary-price .price, #jd-price')),
+        summary: summary ? summary.innerText.slice(0, 4000) : '',
+        comments: text(document.querySelector('#comment-count, .J-comm-count, #comment .count'))
+    };
+}
+"""
+
+_NUMBER = r"(\d+(?:\.\d{1,2})?)"
+PROMO_PRICE_PATTERN = re.compile(r"(?:到手价|券后价|促销价|秒杀价|活动价)\D{0,6}?" + _NUMBER)
+SUBSIDY_PATTERN = re.compile(r"[^\n]{0,12}(?:国家补贴|政府补贴|国补|以旧换新补贴)[^\n]{0,24}")
+REVIEW_COUNT_PATTERN = re.compile(r"(?:累计评价|商品评价|评价数)\D{0,4}?(\d+(?:\.\d+)?万?\+?)")
+GOOD_RATE_PATTERN = re.compile(r"好评(?:率|度)\D{0,4}?(\d{1,3}(?:\.\d+)?%)")
+
+
+def parse_detail_page(raw, max_specs=30) -> dict:
+    """
+    把 DETAIL_EXTRACT_JS 的结果整理为要并入商品记录的字段（只包含提取到的字段）：
+    specs 规格参数、detail_price 详情页价格、promo_price 到手/券后价、subsidy 国补说明、
+    review_count 累计评价数、good_rate 好评率、enriched_at 补充时间。
+    """
+    detail = {}
+    specs = {}
+    for name, value in raw.get("specs") or []:
+        if name and value and name not in specs:
+            specs[name] = value
+        if len(specs) >= max_specs:
+            break
+    if specs:
+        detail.update(specs=specs)
+
+    if raw.get("price"):
+        detail.update(detail_price=raw["price"].lstrip("¥￥").strip())
+
+    summary = raw.get("summary") or ""
+    promo = PROMO_PRICE_PATTERN.search(summary)
+    if promo:
+        detail.update(promo_price=promo.group(1))
+    subsidy = SUBSIDY_PATTERN.search(summary)
+    if subsidy:
+        detail.update(subsidy=subsidy.group(0).strip())
+
+    review_text = " ".join(filter(None, [raw.get("comments"), summary]))
+    reviews = REVIEW_COUNT_PATTERN.search(review_text)
+    if reviews:
+        detail["review_count"] = reviews.group(1)
+    elif raw.get("comments") and re.fullmatch(r"\d+(?:\.\d+)?万?\+?", raw["comments"]):
+        detail["review_count"] = raw["comments"]
+    good_rate = GOOD_RATE_PATTERN.search(review_text)
+    if good_rate:
+        detail.update(good_rate=good_rate.group(1))
+
+    if detail:
+        detail.update(enriched_at=int(time.time()))
+    return detail
+
+
+def format_enrichment(product, max_specs=6) -> str:
+    """把补充字段格式化为一行说明，没有补充信息时返回空字符串"""
+    parts = []
+    if product.get("detail_price"):
+        parts.append(f"详情页价格¥{product['detail_price']}")
+    if product.get("promo_price"):
+        parts.append(f"到手价¥{product['promo_price']}")
+    if product.get("subsidy"):
+        parts.append(product["subsidy"])
+    if product.get("review_count"):
+        rate = f"，好评率{product['good_rate']}" if product.get("good_rate") else ""
+        parts.append(f"累计评价{product['review_count']}{rate}")
+    specs = product.get("specs") or {}
+    if specs:
+        parts.append("参数：" + "；".join(f"{k}={v}" for k, v in list(specs.items())[:max_specs]))
+    return "，".join(parts)
@@ -0,0 +1,43 @@
+import asyncio, random, time
+from urllib.parse import urlparse
+
+
+class DomainRateLimiter:
+    """
+    按域名限速的异步限流器。
+
+    同一域名的两次请求之间至少间隔 min_interval 秒（再加上 0~jitter 秒的随机抖动），
+    不同域名互不影响。用来替代逐个商品的固定 sleep，礼貌访问的同时不让延迟随商品数线性增长。
+    """
+
+    def __init__(self, default_interval=0.0, default_jitter=0.0, domain_rules=None):
+        self.default_interval = default_interval
+        self.default_jitter = default_jitter
+        # 形如 {"search.jd.com": (最小间隔秒数, 随机抖动秒数)}
+        self.domain_rules = dict(domain_rules or {})
+        self._next_allowed = {}
+        self._locks = {}
+
+    @staticmethod
+    def _domain_of(url_or_domain: str) -> str:
+        netloc = urlparse(url_or_domain).netloc
+        return (netloc or url_or_domain).lower()
+
+    def _rule_for(self, domain):
+        return self.domain_rules.get(domain, (self.default_interval, self.default_jitter))
+
+    async def acquire(self, url_or_domain: str) -> float:
+        """等待直到允许访问该域名，返回实际等待的秒数"""
+        domain = self._domain_of(url_or_domain)
+        interval, jitter = self._rule_for(domain)
+        if interval <= 0 and jitter <= 0:
+            return 0.0
+
+        lock = self._locks.setdefault(domain, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            wait = max(0.0, self._next_allowed.get(domain, 0.0) - now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_allowed[domain] = time.monotonic() + interval + random.uniform(0, jitter)
+            return wait
@@ -0,0 +1,181 @@
+import asyncio, copy, json, os, re, sqlite3, threading, time, unicodedata
+from collections import OrderedDict
+from metrics import SEARCH_CACHE_EVICTIONS, SEARCH_CACHE_HITS, SEARCH_CACHE_MISSES
+
+
+def normalize_keyword(keyword: str) -> str:
+    """
+    规范化搜索关键词，作为缓存键。
+
+    - NFKC 归一化：全角字母/数字/空格转为半角
+    - 统一小写
+    - 合并连续空白并去掉首尾空白
+    """
+    text = unicodedata.normalize("NFKC", keyword or "")
+    text = text.lower()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class SearchCache:
+    """
+    搜索结果缓存：按规范化关键词存储商品字典列表。
+
+    内存中使用 LRU（OrderedDict）并带 TTL 过期；
+    配置 sqlite_path 后同时写入本地 SQLite 文件，重启后仍可命中。
+    在事件循环中使用 aget/aset：内存命中直接返回，SQLite 的连接和读写放到线程中执行。
+    命中/未命中/淘汰次数同时计入 Prometheus 指标，name 作为指标的 cache 标签。
+    """
+
+    def __init__(self, ttl=1800, max_entries=256, sqlite_path=None, name="search"):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.sqlite_path = sqlite_path
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connect(self):
+        """首次访问SQLite时打开连接（调用方持有锁）"""
+        if self._db is not None or not self.sqlite_path:
+            return self._db
+        directory = os.path.dirname(self.sqlite_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.sqlite_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        # 启动时清理已过期的记录
+        self._db.execute("DELETE FROM search_cache WHERE created < ?", (time.time() - self.ttl,))
+        self._db.commit()
+        return self._db
+
+    def _expired(self, created):
+        return time.time() - created > self.ttl
+
+    def _record_hit(self):
+        self.hits += 1
+        SEARCH_CACHE_HITS.inc(cache=self.name)
+
+    def _record_miss(self):
+        self.misses += 1
+        SEARCH_CACHE_MISSES.inc(cache=self.name)
+
+    def _get_memory(self, key):
+        """查询内存中的记录（调用方持有锁），未命中或已过期返回None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        created, value = entry
+        if self._expired(created):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self._record_hit()
+        return copy.deepcopy(value)
+
+    def _get_db(self, key):
+        """查询SQLite（调用方持有锁），命中时放回内存"""
+        db = self._connect()
+        row = db.execute("SELECT value, created FROM search_cache WHERE key = ?", (key,)).fetchone() if db else None
+        if row and not self._expired(row[1]):
+            value = json.loads(row[0])
+            self._store(key, value, row[1])
+            self._record_hit()
+            return copy.deepcopy(value)
+        self._record_miss()
+        return None
+
+    def get(self, keyword):
+        """读取缓存，未命中或已过期返回None（配置了SQLite时可能阻塞，事件循环中请用 aget）"""
+        key = normalize_keyword(keyword)
+        with self._lock:
+            value = self._get_memory(key)
+            return value if value is not None else self._get_db(key)
+
+    async def aget(self, keyword):
+        """异步读取缓存：内存未命中时在线程中查询SQLite"""
+        key = normalize_keyword(keyword)
+        with self._lock:
+            value = self._get_memory(key)
+        if value is not None:
+            return value
+        if not self.sqlite_path:
+            with self._lock:
+                self._record_miss()
+            return None
+
+        def read():
+            with self._lock:
+                return self._get_db(key)
+        return await asyncio.to_thread(read)
+
+    def _write_db(self, key, products, created):
+        """写入SQLite并清理过期记录（调用方持有锁）"""
+        db = self._connect()
+        if db is None:
+            return
+        db.execute(
+            "INSERT OR REPLACE INTO search_cache (key, value, created) VALUES (?, ?, ?)",
+            (key, json.dumps(products, ensure_ascii=False), created)
+        )
+        db.execute("DELETE FROM search_cache WHERE created < ?", (created - self.ttl,))
+        db.commit()
+
+    def set(self, keyword, products):
+        """写入缓存（配置了SQLite时可能阻塞，事件循环中请用 aset）"""
+        key = normalize_keyword(keyword)
+        created = time.time()
+        with self._lock:
+            self._store(key, copy.deepcopy(products), created)
+            self._write_db(key, products, created)
+
+    async def aset(self, keyword, products):
+        """异步写入缓存：内存立即更新，SQLite在线程中写入"""
+        key = normalize_keyword(keyword)
+        created = time.time()
+        value = copy.deepcopy(products)
+        with self._lock:
+            self._store(key, value, created)
+        if not self.sqlite_path:
+            return
+
+        def write():
+            with self._lock:
+                self._write_db(key, value, created)
+        await asyncio.to_thread(write)
+
+    def _store(self, key, value, created):
+        self._entries[key] = (created, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+            SEARCH_CACHE_EVICTIONS.inc(cache=self.name)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            db = self._connect()
+            if db is not None:
+                db.execute("DELETE FROM search_cache")
+                db.commit()
+
+    def stats(self) -> dict:
+        """命中率等统计信息，便于调优TTL和容量"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl
+        }
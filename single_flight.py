@@ -0,0 +1,47 @@
+import asyncio
+from structured_log import get_logger
+
+log = get_logger("single_flight")
+
+
+class SingleFlight:
+    """
+    合并相同键的并发调用（single-flight）。
+
+    同一时刻相同键只会真正执行一次，其余调用方等待同一个任务的结果。
+    任务在独立的 asyncio.Task 中运行，某个调用方超时或取消不会影响其他等待者。
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.executed = 0
+        self.shared = 0
+
+    def inflight_count(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key, coro_factory):
+        """
+        执行 coro_factory() 并返回结果；相同 key 的调用正在进行时直接等待它。
+
+        Args:
+            key: 合并用的键（如规范化后的搜索关键词）
+            coro_factory: 无参函数，返回要执行的协程
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            self.executed += 1
+            task = asyncio.ensure_future(coro_factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+        else:
+            self.shared += 1
+            log.debug("🔗 合并进行中的相同请求: %s", key)
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 避免无人等待时出现 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
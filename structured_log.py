@@ -0,0 +1,106 @@
+import json, logging, os, random, sys, time
+
+# 日志配置，均可通过环境变量覆盖：
+#   JD_LOG_LEVEL=DEBUG                      全局级别
+#   JD_LOG_LEVELS="Gradio_UI=DEBUG,app=WARNING"  按模块设置级别
+#   JD_LOG_SAMPLE_RATE=0.1                  逐条消息类调试日志的采样率
+#   JD_LOG_FORMAT=text                      json（默认）或 text
+LOG_CONFIG = {
+    "level": os.getenv("JD_LOG_LEVEL", "INFO"),
+    "module_levels": os.getenv("JD_LOG_LEVELS", ""),
+    "sample_rate": float(os.getenv("JD_LOG_SAMPLE_RATE", "1.0")),
+    "format": os.getenv("JD_LOG_FORMAT", "json"),
+}
+
+ROOT_LOGGER = "jd"
+
+# LogRecord 自带的属性，其余属性视为通过 extra 传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_configured = False
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，extra 中的字段原样并入"""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _parse_module_levels(spec):
+    """解析 "模块=级别,模块=级别" 格式"""
+    levels = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level=None, module_levels=None, fmt=None, sample_rate=None, stream=None):
+    """
+    配置项目日志（可重复调用，后一次覆盖前一次）。
+
+    Args:
+        level (str): 全局级别，默认取 LOG_CONFIG["level"]
+        module_levels (dict | str): 按模块设置的级别，如 {"Gradio_UI": "DEBUG"}
+        fmt (str): "json" 或 "text"
+        sample_rate (float): 采样调试日志的采样率（0~1）
+        stream: 输出流，默认 stderr
+    """
+    global _configured
+    level = (level or LOG_CONFIG["level"]).upper()
+    if isinstance(module_levels, str) or module_levels is None:
+        module_levels = _parse_module_levels(LOG_CONFIG["module_levels"] if module_levels is None else module_levels)
+    fmt = fmt or LOG_CONFIG["format"]
+    if sample_rate is not None:
+        LOG_CONFIG["sample_rate"] = sample_rate
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    if fmt == "text":
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    else:
+        handler.setFormatter(JsonFormatter())
+
+    root = logging.getLogger(ROOT_LOGGER)
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+    root.propagate = False
+
+    for name, module_level in module_levels.items():
+        logging.getLogger(f"{ROOT_LOGGER}.{name}").setLevel(module_level)
+    _configured = True
+
+
+def get_logger(name) -> logging.Logger:
+    """获取模块日志器（首次调用时按 LOG_CONFIG 完成配置）"""
+    if not _configured:
+        configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def sampled(logger, level=logging.DEBUG, rate=None) -> bool:
+    """
+    判断是否输出一条采样日志：级别未启用时直接返回False，几乎没有开销。
+
+    用于逐条消息、逐个步骤这类高频调试输出：
+        if sampled(log):
+            log.debug("消息: %s", content)
+    """
+    if not logger.isEnabledFor(level):
+        return False
+    rate = LOG_CONFIG["sample_rate"] if rate is None else rate
+    return rate >= 1 or random.random() < rate
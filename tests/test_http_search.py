@@ -0,0 +1,210 @@
+"""
+HTTP快速搜索测试（不访问线上京东）。
+
+在本地启动模拟的搜索结果页服务，验证 parse_search_items 对保存的结果页的解析、
+HttpSearchEngine.search 的各种失败原因（challenged / http_<状态码> / no_items），
+以及 app.jd_search_general 在快速路径失败时退回浏览器的 perform_search。
+
+用法:
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from http_search import HttpSearchEngine, parse_search_items
+from tracing import MemoryExporter, configure_tracing
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "jd_search_results.html")
+EMPTY_PAGE = "<html><body><div id='J_goodsList'><ul class='gl-warp'></ul></div></body></html>"
+
+
+def read_fixture():
+    with open(FIXTURE, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class SearchPageStub:
+    """
+    模拟的搜索结果页服务：routes 为 {路径: (状态码, 响应头, 正文)}，未配置的路径返回404。
+    记录每个请求的路径（含查询参数）。
+    """
+
+    def __init__(self, routes=None):
+        self.routes = dict(routes or {})
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append(self.path)
+                status, headers, body = stub.routes.get(self.path.split("?")[0], (404, {}, "not found"))
+                data = body.encode("utf-8")
+                self.send_response(status)
+                for name, value in {"Content-Type": "text/html; charset=utf-8", **headers}.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="search-stub", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def run_search(url, max_items=30):
+    async def main():
+        engine = HttpSearchEngine(cookies_file=os.path.join(tempfile.gettempdir(), "missing_jd_cookies.json"))
+        try:
+            return await engine.search(url, max_items)
+        finally:
+            await engine.aclose()
+    return asyncio.run(main())
+
+
+class ParseSearchItemsTest(unittest.TestCase):
+
+    def test_parses_saved_results_page(self):
+        items = parse_search_items(read_fixture(), 30)
+        self.assertEqual([item["sku"] for item in items], ["100012043978", "100066896338", "100035246702"])
+        self.assertEqual(items[0]["title"], "Apple iPhone 15 (A3092) 128GB 黑色 支持移动联通电信5G手机")
+        self.assertEqual(items[0]["purchase_link"], "//item.jd.com/100012043978.html")
+        self.assertEqual(items[0]["price"], "5999.00")
+        self.assertEqual(items[0]["image_url"], "//img14.360buyimg.com/n7/jfs/t1/phone-a.jpg")
+        # 懒加载图片只有 data-lazy-img
+        self.assertEqual(items[1]["image_url"], "//img10.360buyimg.com/n7/jfs/t1/phone-b.jpg")
+
+    def test_respects_max_items(self):
+        self.assertEqual(len(parse_search_items(read_fixture(), 2)), 2)
+
+    def test_empty_page(self):
+        self.assertEqual(parse_search_items(EMPTY_PAGE, 30), [])
+
+
+class HttpSearchEngineTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # 只在内存中收集Span，不写 jd_traces.jsonl
+        configure_tracing(MemoryExporter())
+
+    def test_returns_items(self):
+        with SearchPageStub({"/Search": (200, {}, read_fixture())}) as stub:
+            items, failure = run_search(f"{stub.base_url}/Search?keyword=手机&enc=utf-8")
+        self.assertIsNone(failure)
+        self.assertEqual(len(items), 3)
+
+    def test_redirect_to_other_host_is_challenged(self):
+        with SearchPageStub({"/new/login.aspx": (200, {}, "<html>请登录</html>")}) as passport:
+            redirect = {"Location": f"{passport.base_url}/new/login.aspx"}
+            with SearchPageStub({"/Search": (302, redirect, "")}) as stub:
+                self.assertEqual(run_search(f"{stub.base_url}/Search?keyword=手机"), (None, "challenged"))
+        self.assertEqual(passport.requests, ["/new/login.aspx"])
+
+    def test_server_error(self):
+        with SearchPageStub({"/Search": (503, {}, "busy")}) as stub:
+            self.assertEqual(run_search(f"{stub.base_url}/Search?keyword=手机"), (None, "http_503"))
+
+    def test_page_without_items(self):
+        with SearchPageStub({"/Search": (200, {}, EMPTY_PAGE)}) as stub:
+            self.assertEqual(run_search(f"{stub.base_url}/Search?keyword=手机"), (None, "no_items"))
+
+
+class _FakePage:
+    async def close(self):
+        pass
+
+
+class _FakeContext:
+    async def new_page(self):
+        return _FakePage()
+
+
+class _FakePool:
+    """代替浏览器池，租用时不启动浏览器"""
+
+    def __init__(self):
+        self.leases = 0
+
+    def lease(self):
+        pool = self
+
+        class Lease:
+            async def __aenter__(self):
+                pool.leases += 1
+                return _FakeContext()
+
+            async def __aexit__(self, *exc):
+                return False
+        return Lease()
+
+
+class HttpSearchFallbackTest(unittest.TestCase):
+    """app.jd_search_general：快速路径返回失败原因时改用浏览器的 perform_search"""
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            import app
+        except SyntaxError:
+            raise unittest.SkipTest("app.py 中的API密钥占位符尚未替换，无法导入")
+        cls.app = app
+        configure_tracing(MemoryExporter())
+
+    def search(self, stub):
+        app = self.app
+        pool = _FakePool()
+        browser_results = [{"title": "浏览器抓取的商品", "price": "1.00"}]
+        perform_search = mock.AsyncMock(return_value=browser_results)
+        with mock.patch.dict(app.HTTP_SEARCH_CONFIG, enabled=True), \
+                mock.patch.dict(app.SEARCH_NAVIGATION_CONFIG, search_url=f"{stub.base_url}/Search"), \
+                mock.patch.object(app, "_http_search_engine", None), \
+                mock.patch.object(app, "get_browser_pool", lambda cookies_file: pool), \
+                mock.patch.object(app, "get_request_blocker", lambda: None), \
+                mock.patch.object(app, "perform_search", perform_search), \
+                mock.patch.object(app, "save_product_details", mock.Mock()):
+            cookies_file = os.path.join(tempfile.gettempdir(), "missing_jd_cookies.json")
+            results = asyncio.run(app.jd_search_general("手机", cookies_file))
+        return results, pool, perform_search, browser_results
+
+    def test_falls_back_to_browser(self):
+        with SearchPageStub({"/Search": (503, {}, "busy")}) as stub:
+            results, pool, perform_search, browser_results = self.search(stub)
+        self.assertEqual(results, browser_results)
+        self.assertEqual(pool.leases, 1)
+        self.assertEqual(perform_search.await_args.args[1], "手机")
+
+    def test_fast_path_skips_browser(self):
+        with SearchPageStub({"/Search": (200, {}, read_fixture())}) as stub:
+            results, pool, perform_search, _ = self.search(stub)
+        self.assertEqual([item["sku"] for item in results], ["100012043978", "100066896338", "100035246702"])
+        self.assertEqual(pool.leases, 0)
+        perform_search.assert_not_awaited()
+
+
+if __name__ == "__main__":
+    unittest.main()
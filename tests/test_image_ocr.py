@@ -0,0 +1,146 @@
+"""
+图片文字提取客户端测试（不访问网络）。
+
+在本地启动一个 OpenAI 兼容的 /chat/completions 桩服务，ImageOCRClient 通过 base_url 指向它，
+验证 extract_text_from_image_urls 所用的 extract_texts：URL去重、并发上限、单张失败不影响其他图片、缓存命中。
+
+用法:
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_ocr import ImageOCRClient
+from ocr_cache import OCRCache
+from tracing import MemoryExporter, configure_tracing
+
+
+class ChatCompletionsStub:
+    """
+    OpenAI 兼容的模拟服务：把请求中的图片URL作为提取结果返回。
+
+    URL 中含 "fail" 时返回400（OpenAI客户端不重试4xx）；每个请求等待 delay 秒，
+    记录请求过的图片URL和同时处理中的请求数峰值。
+    """
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.image_urls = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                image_url = body["messages"][0]["content"][1]["image_url"]["url"]
+                with stub._lock:
+                    stub.image_urls.append(image_url)
+                    stub.in_flight += 1
+                    stub.peak_in_flight = max(stub.peak_in_flight, stub.in_flight)
+                try:
+                    time.sleep(stub.delay)
+                    if "fail" in image_url:
+                        self._send(400, {"error": {"message": "unsupported image", "type": "invalid_request_error"}})
+                    else:
+                        self._send(200, {
+                            "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": body["model"],
+                            "choices": [{"index": 0, "finish_reason": "stop",
+                                         "message": {"role": "assistant", "content": f" 文字 {image_url} "}}],
+                            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+                        })
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+
+            def _send(self, status, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="ocr-stub", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class ExtractTextsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # 只在内存中收集Span，不写 jd_traces.jsonl
+        configure_tracing(MemoryExporter())
+
+    def run_extract(self, stub, image_urls, **kwargs):
+        async def main():
+            client = ImageOCRClient(api_key="test", base_url=stub.base_url, model="stub-vl", **kwargs)
+            try:
+                return await client.extract_texts(image_urls)
+            finally:
+                await client.aclose()
+        return asyncio.run(main())
+
+    def test_deduplicates_urls(self):
+        urls = ["https://img.example.com/a.jpg", "", "#", "https://img.example.com/b.jpg",
+                "https://img.example.com/a.jpg"]
+        with ChatCompletionsStub() as stub:
+            results = self.run_extract(stub, urls)
+        self.assertEqual(list(results), ["https://img.example.com/a.jpg", "https://img.example.com/b.jpg"])
+        self.assertEqual(results["https://img.example.com/a.jpg"], "文字 https://img.example.com/a.jpg")
+        self.assertEqual(sorted(stub.image_urls), list(results))
+
+    def test_limits_concurrency(self):
+        urls = [f"https://img.example.com/{i}.jpg" for i in range(8)]
+        with ChatCompletionsStub(delay=0.2) as stub:
+            results = self.run_extract(stub, urls, max_concurrency=2)
+        self.assertEqual(len(results), 8)
+        self.assertEqual(stub.peak_in_flight, 2)
+
+    def test_reports_errors_per_url(self):
+        urls = ["https://img.example.com/ok.jpg", "https://img.example.com/fail.jpg"]
+        with ChatCompletionsStub() as stub:
+            results = self.run_extract(stub, urls)
+        self.assertEqual(results["https://img.example.com/ok.jpg"], "文字 https://img.example.com/ok.jpg")
+        self.assertTrue(results["https://img.example.com/fail.jpg"].startswith("错误:"))
+
+    def test_serves_repeats_from_cache(self):
+        urls = ["https://img.example.com/a.jpg", "https://img.example.com/b.jpg"]
+        with tempfile.TemporaryDirectory() as cache_dir, ChatCompletionsStub() as stub:
+            cache = OCRCache(cache_dir=cache_dir)
+            first = self.run_extract(stub, urls, cache=cache)
+            second = self.run_extract(stub, urls, cache=cache)
+        self.assertEqual(first, second)
+        self.assertEqual(len(stub.image_urls), 2)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
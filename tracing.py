@@ -0,0 +1,448 @@
+import contextvars, functools, inspect, json, os, queue, threading, time, uuid
+from contextlib import contextmanager
+from structured_log import get_logger
+
+log = get_logger("tracing")
+
+# 追踪配置，均可通过环境变量覆盖：
+#   JD_TRACE_EXPORTER=jsonl | otlp | none
+#   JD_TRACE_FILE=jd_traces.jsonl           jsonl 导出文件
+#   JD_TRACE_MAX_BYTES=52428800             jsonl 文件超过该大小时轮转，保留 jsonl_backups 个旧文件
+#   JD_TRACE_OTLP_ENDPOINT=http://127.0.0.1:4318   OTLP/HTTP 采集器地址
+TRACE_CONFIG = {
+    "exporter": os.getenv("JD_TRACE_EXPORTER", "jsonl"),
+    "jsonl_path": os.getenv("JD_TRACE_FILE", "jd_traces.jsonl"),
+    "jsonl_max_bytes": int(os.getenv("JD_TRACE_MAX_BYTES", str(50 * 1024 * 1024))),
+    "jsonl_backups": 3,
+    "otlp_endpoint": os.getenv("JD_TRACE_OTLP_ENDPOINT", "http://127.0.0.1:4318"),
+    "service_name": "jd-search-agent",
+}
+
+_current_span = contextvars.ContextVar("jd_current_span", default=None)
+
+
+class Span:
+    """一次操作的耗时记录，父子关系通过 contextvars 在协程和任务之间传递"""
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.end = None
+        self.status = "ok"
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """追踪关闭时使用的空Span，所有操作都不产生开销"""
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class BatchExporter:
+    """
+    Span 先放入队列，由后台线程按批交给 _send 处理，不阻塞事件循环。
+
+    队列满时丢弃新的Span；shutdown 时处理完队列中剩余的Span。
+    """
+
+    def __init__(self, batch_size=64, flush_interval=2.0, thread_name="trace-exporter"):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=10000)
+        self._worker = threading.Thread(target=self._run, name=thread_name, daemon=True)
+        self._worker.start()
+
+    def export(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            log.warning("⚠️ 追踪队列已满，丢弃Span: %s", span.name)
+
+    def _send(self, spans):
+        raise NotImplementedError
+
+    def _close(self):
+        """后台线程退出前调用（释放文件等资源）"""
+
+    def _run(self):
+        batch = []
+        while True:
+            try:
+                span = self._queue.get(timeout=self.flush_interval)
+                if span is None:
+                    break
+                batch.append(span)
+                if len(batch) < self.batch_size:
+                    continue
+            except queue.Empty:
+                pass
+            if batch:
+                self._send(batch)
+            batch = []
+        if batch:
+            self._send(batch)
+        self._close()
+
+    def shutdown(self, timeout=5):
+        self._queue.put(None)
+        self._worker.join(timeout)
+
+
+class JsonlExporter(BatchExporter):
+    """
+    把结束的Span追加为JSONL文件中的一行。
+
+    文件句柄常驻，由后台线程按批写入并刷新；文件超过 max_bytes 时轮转为 path.1 ... path.<backups>。
+    """
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, backups=3, **kwargs):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = None
+        super().__init__(thread_name="jsonl-exporter", **kwargs)
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _send(self, spans):
+        lines = "".join(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n" for span in spans)
+        try:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(lines)
+            self._file.flush()
+            if self.max_bytes and self._file.tell() >= self.max_bytes:
+                self._rotate()
+        except OSError as e:
+            log.warning("⚠️ 写入追踪文件失败: %s", e)
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+
+
+class MemoryExporter:
+    """把结束的Span以字典形式保存在内存中（用于基准测试按次统计阶段耗时）"""
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span.to_dict())
+
+    def drain(self):
+        """取出并清空已收集的Span"""
+        spans, self.spans = self.spans, []
+        return spans
+
+    def shutdown(self):
+        pass
+
+
+class OtlpHttpExporter(BatchExporter):
+    """
+    以 OTLP/HTTP JSON 格式把Span发送到采集器（如 OpenTelemetry Collector、Jaeger、Tempo）。
+
+    Span 先放入队列，由后台线程批量发送，不阻塞事件循环。
+    """
+
+    def __init__(self, endpoint, service_name="jd-search-agent", **kwargs):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        super().__init__(thread_name="otlp-exporter", **kwargs)
+
+    @staticmethod
+    def _attribute(key, value):
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    def _payload(self, spans):
+        return {"resourceSpans": [{
+            "resource": {"attributes": [self._attribute("service.name", self.service_name)]},
+            "scopeSpans": [{
+                "scope": {"name": "jd-search-agent.tracing"},
+                "spans": [{
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    "parentSpanId": span.parent_id or "",
+                    "name": span.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(int(span.start * 1e9)),
+                    "endTimeUnixNano": str(int((span.end or span.start) * 1e9)),
+                    "attributes": [self._attribute(k, v) for k, v in span.attributes.items()],
+                    "status": {"code": 2, "message": span.error or ""} if span.status == "error" else {"code": 1},
+                } for span in spans],
+            }],
+        }]}
+
+    def _send(self, spans):
+        import urllib.request
+        request = urllib.request.Request(
+            self.url, data=json.dumps(self._payload(spans), default=str).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST"
+        )
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+        except Exception as e:
+            log.warning("⚠️ 发送追踪数据失败(%s): %s", self.url, e)
+
+
+class Tracer:
+    """创建Span并在结束时交给导出器；exporter 为 None 时不记录任何数据"""
+
+    def __init__(self, exporter=None):
+        self.exporter = exporter
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        记录一个Span。当前没有父Span时开始一条新的trace。
+
+        用法：
+            with tracer.span("playwright.navigate", url=url) as span:
+                ...
+                span.set_attribute("item_count", 10)
+        """
+        if self.exporter is None:
+            yield NOOP_SPAN
+            return
+
+        parent = _current_span.get()
+        span = Span(
+            name,
+            trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+            parent_id=parent.span_id if parent else None,
+            attributes=attributes
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        except GeneratorExit:
+            # 调用方提前结束迭代（如流式输出已完成），不算错误
+            raise
+        except BaseException as e:
+            span.status = "error"
+            span.error = f"{type(e).__name__}: {str(e)[:200]}"
+            raise
+        finally:
+            span.end = time.time()
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # 异步生成器在其他上下文中被关闭时无法还原，直接恢复为父Span
+                _current_span.set(parent)
+            self.exporter.export(span)
+
+    def shutdown(self):
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+_tracer = Tracer()
+
+
+def configure_tracing(exporter=None, jsonl_path=None, otlp_endpoint=None, service_name=None):
+    """
+    按配置创建全局追踪器（参数默认取 TRACE_CONFIG）。
+
+    exporter 可以是 jsonl/otlp/none，也可以直接传入带 export(span)/shutdown() 方法的导出器对象。
+    """
+    global _tracer
+    exporter = exporter or TRACE_CONFIG["exporter"]
+    _tracer.shutdown()
+    if not isinstance(exporter, str):
+        _tracer = Tracer(exporter)
+        return _tracer
+    if exporter == "jsonl":
+        _tracer = Tracer(JsonlExporter(
+            jsonl_path or TRACE_CONFIG["jsonl_path"], TRACE_CONFIG["jsonl_max_bytes"], TRACE_CONFIG["jsonl_backups"]
+        ))
+    elif exporter == "otlp":
+        _tracer = Tracer(OtlpHttpExporter(
+            otlp_endpoint or TRACE_CONFIG["otlp_endpoint"], service_name or TRACE_CONFIG["service_name"]
+        ))
+    else:
+        _tracer = Tracer()
+    log.info("🧭 追踪导出方式: %s", exporter)
+    return _tracer
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def span(name, **attributes):
+    """在全局追踪器上记录一个Span"""
+    return _tracer.span(name, **attributes)
+
+
+def current_span():
+    """当前Span（没有时返回空Span），用于在调用深处补充属性"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def traced(name):
+    """把同步或异步函数的每次调用记录为一个Span"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def shutdown_tracing():
+    """应用退出时发送剩余的Span"""
+    _tracer.shutdown()
+
+
+# ================== 耗时分析命令行 ==================
+def load_spans(path):
+    """读取JSONL追踪文件，连同轮转出的旧文件（path.N ... path.1）按时间先后读取"""
+    backups = [f"{path}.{index}" for index in range(TRACE_CONFIG["jsonl_backups"], 0, -1)]
+    spans = []
+    for file_path in backups + [path]:
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        spans.append(json.loads(line))
+                    except ValueError:
+                        continue
+    return spans
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def phase_breakdown(spans):
+    """
+    按Span名称汇总耗时。
+
+    self_ms 为去掉子Span后的自身耗时（并发的子Span可能使其为0），
+    用于判断时间具体花在哪一层。
+    """
+    children = {}
+    for item in spans:
+        if item["parent_id"]:
+            children.setdefault(item["parent_id"], []).append(item)
+
+    phases = {}
+    for item in spans:
+        child_ms = sum(child["duration_ms"] for child in children.get(item["span_id"], []))
+        phase = phases.setdefault(item["name"], {"count": 0, "durations": [], "self_ms": 0.0, "errors": 0})
+        phase["count"] += 1
+        phase["durations"].append(item["duration_ms"])
+        phase["self_ms"] += max(0.0, item["duration_ms"] - child_ms)
+        phase["errors"] += item.get("status") == "error"
+    return phases
+
+
+def print_report(spans, last=None, trace_id=None):
+    roots = [item for item in spans if not item["parent_id"]]
+    if trace_id:
+        roots = [item for item in roots if item["trace_id"].startswith(trace_id)]
+    roots.sort(key=lambda item: item["start"])
+    if last:
+        roots = roots[-last:]
+    trace_ids = {item["trace_id"] for item in roots}
+    selected = [item for item in spans if item["trace_id"] in trace_ids]
+    if not roots:
+        print("没有找到匹配的trace")
+        return
+
+    root_total = sum(item["duration_ms"] for item in roots)
+    print(f"共{len(roots)}条trace，{len(selected)}个Span，根Span总耗时 {root_total / 1000:.2f}秒\n")
+    print(f"{'阶段':<36}{'次数':>6}{'总耗时ms':>12}{'自身ms':>12}{'平均ms':>10}{'p95ms':>10}{'占比':>8}{'错误':>6}")
+    phases = phase_breakdown(selected)
+    for name, phase in sorted(phases.items(), key=lambda kv: -kv[1]["self_ms"]):
+        total = sum(phase["durations"])
+        print(f"{name:<36}{phase['count']:>6}{total:>12.1f}{phase['self_ms']:>12.1f}"
+              f"{total / phase['count']:>10.1f}{_percentile(phase['durations'], 95):>10.1f}"
+              f"{phase['self_ms'] / root_total if root_total else 0:>8.1%}{phase['errors']:>6}")
+
+    print("\n最近的trace:")
+    for root in roots[-5:]:
+        attrs = ", ".join(f"{k}={v}" for k, v in root["attributes"].items())
+        print(f"  {root['trace_id'][:12]}  {root['name']}  {root['duration_ms'] / 1000:.2f}秒  {attrs}")
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="按阶段统计追踪耗时")
+    parser.add_argument("path", nargs="?", default=TRACE_CONFIG["jsonl_path"], help="JSONL追踪文件")
+    parser.add_argument("--last", type=int, help="只统计最近N条trace")
+    parser.add_argument("--trace", help="只统计指定trace_id（可用前缀）")
+    args = parser.parse_args()
+    print_report(load_spans(args.path), last=args.last, trace_id=args.trace)
+
+
+if __name__ == "__main__":
+    main()